@@ -1,12 +1,15 @@
 from jose import JWTError
 from jose import jwt
 from datetime import datetime, timedelta
+import time
 from db import database, models
 from schemas import TokenData
 from fastapi import Depends, status, HTTPException
 from fastapi.security import OAuth2PasswordBearer
-from sqlalchemy.orm import Session
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
 from config import settings
+from utils.cache import TTLCache
 
 oauth2_scheme = OAuth2PasswordBearer(tokenUrl='auth/login')
 
@@ -14,6 +17,11 @@ SECRET_KEY = settings.secret_key
 ALGORITHM = settings.algorithm
 ACCESS_TOKEN_EXPIRE_MINUTES = settings.access_token_expire_minutes
 
+# Decoded claims by token, and detached user records by id, so most
+# authenticated requests skip both JWT decoding and the users SELECT
+_token_cache = TTLCache("auth_token", settings.auth_cache_size, settings.auth_cache_ttl)
+_user_cache = TTLCache("auth_user", settings.auth_cache_size, settings.auth_cache_ttl)
+
 def create_access_token(data: dict):
     to_encode = data.copy()
 
@@ -25,6 +33,10 @@ def create_access_token(data: dict):
     return encoded_jwt
 
 def verify_access_token(token: str, credentials_exception):
+    token_data = _token_cache.get(token)
+    if token_data is not None:
+        return token_data
+
     try:
         payload = jwt.decode(token, SECRET_KEY, algorithms=[ALGORITHM])
         id: int = payload.get("user_id")
@@ -34,9 +46,12 @@ def verify_access_token(token: str, credentials_exception):
     except JWTError:
         raise credentials_exception
 
+    # Never keep a token cached past its expiry
+    expires = payload.get("exp")
+    _token_cache.set(token, token_data, ttl=expires - time.time() if expires else None)
     return token_data
 
-def get_current_user(token: str = Depends(oauth2_scheme), db: Session = Depends(database.get_db)):
+async def get_current_user(token: str = Depends(oauth2_scheme), db: AsyncSession = Depends(database.get_async_db)):
     credentials_exception = HTTPException(
         status_code=status.HTTP_401_UNAUTHORIZED,
         detail="Could not validate credentials",
@@ -44,9 +59,23 @@ def get_current_user(token: str = Depends(oauth2_scheme), db: Session = Depends(
     )
 
     token_data = verify_access_token(token, credentials_exception)
-    user = db.query(models.User).filter(models.User.id == token_data.id).first()
-    
+    user = _user_cache.get(token_data.id)
     if user is None:
+        result = await db.execute(select(models.User).where(models.User.id == token_data.id))
+        user = result.scalars().first()
+
+        if user is None:
+            raise credentials_exception
+
+        # Detach so the cached copy is independent of this request's session
+        db.expunge(user)
+        _user_cache.set(user.id, user)
+
+    if not user.is_active:
         raise credentials_exception
-        
+
     return user
+
+def invalidate_user(user_id: int):
+    """Drop a cached user record after it is changed, deactivated or deleted."""
+    _user_cache.pop(user_id)
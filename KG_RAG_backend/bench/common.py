@@ -0,0 +1,130 @@
+"""Helpers shared by the benchmark runners: timing, memory sampling and result files."""
+import asyncio
+import json
+import math
+import os
+import platform
+import resource
+import subprocess
+import time
+from datetime import datetime, timezone
+from pathlib import Path
+from typing import Any, Dict, List, Optional
+
+import psutil
+
+
+def percentiles(samples: List[float], points=(50, 95, 99)) -> Dict[str, Optional[float]]:
+    """Nearest-rank percentiles, rounded to 0.01."""
+    if not samples:
+        return {f"p{p}": None for p in points}
+    ordered = sorted(samples)
+    result = {}
+    for p in points:
+        rank = max(0, min(len(ordered) - 1, math.ceil(p / 100 * len(ordered)) - 1))
+        result[f"p{p}"] = round(ordered[rank], 2)
+    return result
+
+
+class RSSSampler:
+    """Tracks peak resident memory of this process plus its children (the CPU pool)."""
+
+    def __init__(self, interval: float = 0.05):
+        self.interval = interval
+        self.peak_bytes = 0
+        self._task = None
+        self._process = psutil.Process(os.getpid())
+
+    def sample(self) -> int:
+        total = self._process.memory_info().rss
+        for child in self._process.children(recursive=True):
+            try:
+                total += child.memory_info().rss
+            except psutil.Error:
+                pass
+        self.peak_bytes = max(self.peak_bytes, total)
+        return total
+
+    async def _run(self):
+        while True:
+            self.sample()
+            await asyncio.sleep(self.interval)
+
+    def start(self):
+        self.peak_bytes = 0
+        self._task = asyncio.create_task(self._run())
+
+    async def stop(self) -> float:
+        """Stop sampling and return the peak in MiB."""
+        self._task.cancel()
+        try:
+            await self._task
+        except asyncio.CancelledError:
+            pass
+        self.sample()
+        return round(self.peak_bytes / 2**20, 1)
+
+
+class Stage:
+    """``async with Stage(results, "parse") as stage:`` records wall time and peak RSS."""
+
+    def __init__(self, results: Dict[str, Dict[str, Any]], name: str):
+        self.results = results
+        self.name = name
+        self.sampler = RSSSampler()
+        self.metrics: Dict[str, Any] = {}
+
+    async def __aenter__(self):
+        self.sampler.start()
+        self.started = time.perf_counter()
+        return self
+
+    async def __aexit__(self, exc_type, exc, tb):
+        wall = time.perf_counter() - self.started
+        peak = await self.sampler.stop()
+        self.results[self.name] = {"wall_s": round(wall, 3), "peak_rss_mb": peak, **self.metrics}
+        print(f"[bench] {self.name}: {wall:.2f}s {self.metrics}")
+        return False
+
+    def rate(self, key: str, count: float):
+        """Record ``count`` and its per-second rate over the stage so far."""
+        elapsed = max(time.perf_counter() - self.started, 1e-9)
+        self.metrics[key] = count
+        self.metrics[f"{key}_per_s"] = round(count / elapsed, 2)
+
+
+def git_commit() -> Optional[str]:
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "HEAD"], capture_output=True, text=True, check=True
+        ).stdout.strip()
+    except Exception:
+        return None
+
+
+def peak_rss_mb() -> Dict[str, float]:
+    """Lifetime peak RSS from the kernel (ru_maxrss is KiB on Linux, bytes on macOS)."""
+    scale = 1 if platform.system() == "Darwin" else 1024
+    return {
+        "self": round(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * scale / 2**20, 1),
+        "children": round(resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss * scale / 2**20, 1),
+    }
+
+
+def write_results(benchmark: str, config: Dict[str, Any], body: Dict[str, Any], out: Optional[str]) -> Dict[str, Any]:
+    report = {
+        "benchmark": benchmark,
+        "timestamp": datetime.now(timezone.utc).isoformat(),
+        "git_commit": git_commit(),
+        "host": {"platform": platform.platform(), "python": platform.python_version(), "cpus": os.cpu_count()},
+        "config": config,
+        **body,
+    }
+    text = json.dumps(report, indent=2)
+    if out:
+        Path(out).parent.mkdir(parents=True, exist_ok=True)
+        Path(out).write_text(text)
+        print(f"[bench] Results written to {out}")
+    else:
+        print(text)
+    return report
@@ -0,0 +1,154 @@
+"""End-to-end ingestion benchmark.
+
+Generates a synthetic corpus into a dedicated user's PDF directory, then
+times each stage of the pipeline: parsing and chunking, the chunk store,
+embedding and FAISS, NER, and graph writes. Run it against the LLM stand-in
+(``bench.llm_stub``) and a local Neo4j so the numbers measure this code:
+
+    python -m bench.llm_stub --port 8100 &
+    TOGETHER_API_BASE=http://127.0.0.1:8100/v1 \\
+        python -m bench.ingest --docs 20 --pages 8 --out results/ingest.json
+
+``--mode streaming`` times ``StreamingPipeline`` end to end instead of the
+separate stages. ``--stages parse,index`` skips the NER and graph stages;
+each stage reads what the previous one wrote, so NER needs index and graph
+needs NER. Graph builds clear the database first, so point NEO4J_URI at a
+dedicated instance.
+"""
+import argparse
+import asyncio
+import json
+import shutil
+import time
+from pathlib import Path
+
+from bench.common import Stage, peak_rss_mb, write_results
+from bench.corpus import generate_corpus
+from config import BLOCK_SIZE, CHUNK_OVERLAP, CHUNK_SIZE, EMB_MODEL, LLM_MODEL, TOGETHER_API_BASE
+from utils.executors import run_in_executor, shutdown_executors
+
+ALL_STAGES = ("parse", "index", "ner", "graph")
+
+
+def reset_user_data(username: str):
+    for path in (f"data/pdfs/{username}", f"data/chunks/{username}", f"data/vector_stores/{username}",
+                 f"data/entities/{username}", f"data/graphs/{username}"):
+        shutil.rmtree(path, ignore_errors=True)
+
+
+async def run_batch(username: str, stages, results):
+    from modules.data_loader import PDFLoader
+
+    async with Stage(results, "setup") as stage:
+        # Includes loading the embedding model, which the API does once per process
+        loader = await run_in_executor("io", PDFLoader, pdf_dir=f"data/pdfs/{username}", username=username)
+
+    chunks = []
+    async with Stage(results, "parse") as stage:
+        async for doc_chunks in loader.iter_pdf_chunks():
+            chunks.extend(doc_chunks)
+        chunks.sort(key=lambda c: c["chunk_id"])
+        stage.rate("pages", len({(c["doc_id"], c["page"]) for c in chunks}))
+        stage.rate("chunks", len(chunks))
+
+    if "index" in stages:
+        marks = {}
+        async with Stage(results, "index") as stage:
+            await loader.index_chunks(chunks, lambda name, progress: marks.setdefault(name, time.perf_counter()))
+            done = time.perf_counter()
+            embed_s = marks.get("Saving vector store", done) - marks.get("Embedding chunks", done)
+            stage.metrics["chunk_store_s"] = round(marks.get("Embedding chunks", done) - marks.get("Saving chunks", done), 3)
+            stage.metrics["embed_s"] = round(embed_s, 3)
+            stage.metrics["save_s"] = round(done - marks.get("Saving vector store", done), 3)
+            stage.metrics["embeddings_per_s"] = round(len(chunks) / embed_s, 2) if embed_s > 0 else None
+
+    if "ner" in stages:
+        from modules.JSON_NER import Chunks_NER
+        from modules.llm_gateway import llm_gateway
+
+        ner = await run_in_executor("io", Chunks_NER, username=username)
+        calls_before = llm_gateway.snapshot()["calls"]
+        async with Stage(results, "ner") as stage:
+            entities = await run_in_executor("pipeline", ner.Extract_Entities)
+            stage.rate("chunks", len(chunks))
+            stage.metrics["batches"] = llm_gateway.snapshot()["calls"] - calls_before
+            stage.metrics["unique_entities"] = len(entities)
+
+    if "graph" in stages:
+        from modules.KnowledgeGraph import KnowledgeGraph
+
+        entities_file = Path(f"data/entities/{username}/entities_{username}.json")
+        data = json.loads(entities_file.read_text()) if entities_file.exists() else {}
+        kg = KnowledgeGraph(username=username)
+        async with Stage(results, "graph") as stage:
+            await kg.create_graph()
+            stage.rate("chunk_transactions", len(data))
+            stage.rate("entity_writes", sum(len(v) for v in data.values()))
+
+
+async def run_streaming(username: str, results):
+    from modules.pipeline import StreamingPipeline
+
+    async with Stage(results, "streaming_pipeline") as stage:
+        stats = await StreamingPipeline(username).run()
+        stage.rate("chunks", stats["chunks"])
+        stage.metrics["unique_entities"] = stats["entities_found"]
+
+
+async def main_async(args):
+    reset_user_data(args.username)
+    page_counts = generate_corpus(Path(f"data/pdfs/{args.username}"), args.docs, args.pages, args.seed)
+    stages = [s for s in args.stages.split(",") if s] if args.stages else list(ALL_STAGES)
+
+    results = {}
+    started = time.perf_counter()
+    try:
+        if args.mode == "streaming":
+            await run_streaming(args.username, results)
+        else:
+            await run_batch(args.username, stages, results)
+    finally:
+        from db.neo4j_connector import close_neo4j_connector
+
+        await close_neo4j_connector()
+        shutdown_executors()
+    total = time.perf_counter() - started
+
+    config = {
+        "mode": args.mode,
+        "stages": stages if args.mode == "batch" else ["streaming_pipeline"],
+        "docs": args.docs,
+        "pages_per_doc": args.pages,
+        "pages_generated": sum(page_counts.values()),
+        "seed": args.seed,
+        "chunk_size": CHUNK_SIZE,
+        "chunk_overlap": CHUNK_OVERLAP,
+        "ner_block_size": BLOCK_SIZE,
+        "embedding_model": EMB_MODEL,
+        "llm_model": LLM_MODEL,
+        "llm_api_base": TOGETHER_API_BASE,
+    }
+    body = {
+        "stages": results,
+        "total_wall_s": round(total, 3),
+        "peak_rss_mb": peak_rss_mb(),
+    }
+    return write_results("ingest", config, body, args.out)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark PDF ingestion, NER and graph construction")
+    parser.add_argument("--docs", type=int, default=10)
+    parser.add_argument("--pages", type=int, default=8, help="body pages per synthetic paper")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--mode", choices=("batch", "streaming"), default="batch")
+    parser.add_argument("--stages", default=",".join(ALL_STAGES),
+                        help=f"comma-separated subset of {','.join(ALL_STAGES)} (batch mode); parse always runs")
+    parser.add_argument("--username", default="bench_ingest", help="data directories used for the run; wiped first")
+    parser.add_argument("--out", help="write JSON results here instead of stdout")
+    args = parser.parse_args()
+    asyncio.run(main_async(args))
+
+
+if __name__ == "__main__":
+    main()
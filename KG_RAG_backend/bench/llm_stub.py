@@ -0,0 +1,193 @@
+"""Deterministic OpenAI-compatible stand-in for the Together API.
+
+Point ``TOGETHER_API_BASE`` at it to exercise ``Chunks_NER`` and
+``SearchAgent`` without network access:
+
+    python -m bench.llm_stub --port 8100 --latency-ms 200 --tokens-per-sec 400
+    TOGETHER_API_BASE=http://127.0.0.1:8100/v1 uvicorn main:app
+
+Responses depend only on the prompt. The NER prompt gets a JSON object
+with every chunk id present, the query NER prompt gets ``{"entities": [...]}``,
+the synthesis prompt gets an answer with a ``Referenced from:`` line, and
+Cypher generation gets a fixed read query. Latency, jitter, token
+throughput and error injection are configurable, so benchmarks measure
+our code rather than the provider.
+"""
+import argparse
+import asyncio
+import hashlib
+import json
+import random
+import re
+import time
+from collections import Counter
+from typing import Dict, List
+
+from fastapi import FastAPI, Request
+from fastapi.responses import JSONResponse
+
+CHUNK_LINE = re.compile(r"^\s*(d\d{2,}p\d{4,}c\d{2,}): (.*)$", re.MULTILINE)
+CHUNK_ID = re.compile(r"d\d{2,}p\d{4,}c\d{2,}")
+WORD = re.compile(r"[A-Za-z][A-Za-z\-]{3,}")
+STOPWORDS = {
+    "this", "that", "with", "from", "have", "been", "were", "which", "their", "these",
+    "those", "such", "also", "into", "than", "then", "they", "there", "using", "used",
+    "based", "show", "shows", "each", "more", "most", "other", "over", "between",
+    "while", "where", "when", "will", "would", "could", "should", "about", "after",
+    "before", "both", "through", "under", "only", "very", "some", "many", "results",
+    "paper", "work", "approach", "method", "propose", "proposed", "first", "second",
+    "what", "does", "chunk", "text", "metadata", "page", "score", "entity", "entities", "related",
+}
+
+
+class StubConfig:
+    latency_ms = 0.0
+    jitter_ms = 0.0
+    tokens_per_sec = 0.0
+    error_rate = 0.0
+    max_entities = 5
+    seed = 0
+
+
+config = StubConfig()
+rng = random.Random(config.seed)
+stats = Counter()
+app = FastAPI(title="LLM stand-in")
+
+
+def extract_terms(text: str, limit: int) -> List[str]:
+    """Most frequent non-stopword terms, ties broken alphabetically."""
+    counts = Counter(w.lower() for w in WORD.findall(text) if w.lower() not in STOPWORDS)
+    ranked = sorted(counts.items(), key=lambda item: (-item[1], item[0]))
+    return [term for term, _ in ranked[:limit]]
+
+
+def ner_response(prompt: str) -> str:
+    chunks = CHUNK_LINE.findall(prompt.split("Text chunks:", 1)[-1])
+    return json.dumps({cid: extract_terms(text, config.max_entities) for cid, text in chunks})
+
+
+def query_ner_response(prompt: str) -> str:
+    text = prompt.split("Text:", 1)[-1].split("The output should be formatted", 1)[0]
+    return json.dumps({"entities": extract_terms(text, config.max_entities)})
+
+
+def synthesis_response(prompt: str) -> str:
+    query = prompt.split("Query:", 1)[-1].split("\n", 1)[0].strip()
+    chunk_ids = list(dict.fromkeys(CHUNK_ID.findall(prompt.split("Query:", 1)[-1])))
+    refs = ", ".join(
+        "(document: {},page: {})".format(*map(int, re.match(r"d(\d+)p(\d+)", cid).groups()))
+        for cid in chunk_ids[:5]
+    )
+    terms = ", ".join(extract_terms(prompt.split("Vector Search Results:", 1)[-1], 3)) or "no matching concepts"
+    return (
+        f"Stand-in answer to '{query}': the retrieved chunks discuss {terms}.\n"
+        f"Referenced from: [{refs}]"
+    )
+
+
+def respond(messages: List[Dict]) -> str:
+    prompt = "\n".join(str(m.get("content", "")) for m in messages)
+    if "known_entities" in prompt or "Known entities:" in prompt:
+        return ner_response(prompt)
+    if 'single key "entities"' in prompt:
+        return query_ner_response(prompt)
+    if "Vector Search Results:" in prompt:
+        return synthesis_response(prompt)
+    if "Information:" in prompt:
+        return "The graph query returned the listed entities."
+    if "Cypher" in prompt:
+        return "MATCH (e:Entity {username: $username}) RETURN e.name AS name LIMIT 5"
+    digest = hashlib.sha256(prompt.encode()).hexdigest()[:12]
+    return f"stub-{digest}"
+
+
+def count_tokens(text: str) -> int:
+    # Close enough to BPE counts for throughput modelling
+    return max(1, int(len(text.split()) * 1.3))
+
+
+@app.get("/v1/models")
+@app.get("/models")
+async def models():
+    return {"object": "list", "data": [{"id": "stub", "object": "model", "owned_by": "bench"}]}
+
+
+@app.get("/stats")
+async def get_stats():
+    return dict(stats)
+
+
+@app.post("/v1/chat/completions")
+@app.post("/chat/completions")
+async def chat_completions(request: Request):
+    body = await request.json()
+    messages = body.get("messages", [])
+    stats["requests"] += 1
+
+    if config.error_rate and rng.random() < config.error_rate:
+        stats["errors"] += 1
+        status = rng.choice([429, 500, 503])
+        return JSONResponse(
+            status_code=status,
+            content={"error": {"message": "injected failure", "type": "stub_error", "code": status}}
+        )
+
+    content = respond(messages)
+    prompt_tokens = count_tokens("\n".join(str(m.get("content", "")) for m in messages))
+    completion_tokens = count_tokens(content)
+    stats["prompt_tokens"] += prompt_tokens
+    stats["completion_tokens"] += completion_tokens
+
+    delay = config.latency_ms / 1000
+    if config.jitter_ms:
+        delay += rng.uniform(0, config.jitter_ms) / 1000
+    if config.tokens_per_sec:
+        delay += completion_tokens / config.tokens_per_sec
+    if delay:
+        await asyncio.sleep(delay)
+
+    return {
+        "id": f"chatcmpl-{hashlib.sha256(content.encode()).hexdigest()[:24]}",
+        "object": "chat.completion",
+        "created": int(time.time()),
+        "model": body.get("model", "stub"),
+        "choices": [{
+            "index": 0,
+            "message": {"role": "assistant", "content": content},
+            "finish_reason": "stop"
+        }],
+        "usage": {
+            "prompt_tokens": prompt_tokens,
+            "completion_tokens": completion_tokens,
+            "total_tokens": prompt_tokens + completion_tokens
+        }
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8100)
+    parser.add_argument("--latency-ms", type=float, default=0.0, help="fixed delay added to every response")
+    parser.add_argument("--jitter-ms", type=float, default=0.0, help="uniform random delay on top of latency")
+    parser.add_argument("--tokens-per-sec", type=float, default=0.0, help="simulated generation speed; 0 is instant")
+    parser.add_argument("--error-rate", type=float, default=0.0, help="fraction of requests answered with 429/5xx")
+    parser.add_argument("--max-entities", type=int, default=5, help="entities returned per chunk")
+    parser.add_argument("--seed", type=int, default=0, help="seed for jitter and error injection")
+    args = parser.parse_args()
+
+    config.latency_ms = args.latency_ms
+    config.jitter_ms = args.jitter_ms
+    config.tokens_per_sec = args.tokens_per_sec
+    config.error_rate = args.error_rate
+    config.max_entities = args.max_entities
+    config.seed = args.seed
+    rng.seed(args.seed)
+
+    import uvicorn
+    uvicorn.run(app, host=args.host, port=args.port, log_level="warning")
+
+
+if __name__ == "__main__":
+    main()
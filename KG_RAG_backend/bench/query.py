@@ -0,0 +1,238 @@
+"""Query-path latency and retrieval-quality benchmark.
+
+Latency: drives ``SearchAgent.search`` in-process (per-stage p50/p95/p99 for
+embed, faiss, ner, graph and synthesis) or ``POST /query/chat`` over HTTP
+(end-to-end percentiles), at a configurable concurrency.
+
+Quality: for a golden set of questions labelled with relevant chunk ids,
+computes recall@k and MRR for vector, graph and fused (reciprocal rank
+fusion) retrieval, so a latency win can be checked against grounding.
+
+Golden sets are JSONL, one ``{"question": ..., "relevant_chunk_ids": [...]}``
+per line. ``--make-golden`` derives one from the user's chunk store, which
+suits corpora generated by ``bench.corpus``:
+
+    python -m bench.query --username bench_ingest --make-golden data/bench/golden.jsonl
+    python -m bench.query --username bench_ingest --golden data/bench/golden.jsonl \\
+        --requests 200 --concurrency 8 --out results/query.json
+    python -m bench.query --http http://localhost:8000 --login bench:secret --golden data/bench/golden.jsonl
+"""
+import argparse
+import asyncio
+import json
+import random
+import re
+import time
+from collections import Counter, defaultdict
+from pathlib import Path
+from typing import Dict, List
+
+from bench.common import percentiles, peak_rss_mb, write_results
+from utils.executors import run_in_executor, shutdown_executors
+
+TERM = re.compile(r"[a-z][a-z\-]{4,}")
+RRF_K = 60
+
+
+def load_golden(path: str) -> List[Dict]:
+    with open(path, encoding="utf-8") as f:
+        return [json.loads(line) for line in f if line.strip()]
+
+
+def make_golden(username: str, path: str, size: int, seed: int = 0) -> List[Dict]:
+    """Build questions from term pairs that co-occur in sampled chunks.
+
+    A chunk is relevant when it contains both terms of its question.
+    """
+    from modules.chunk_store import ChunkStore
+
+    store = ChunkStore.for_user(username)
+    chunks = list(store.iter_chunks())
+    store.close()
+    if not chunks:
+        raise SystemExit(f"No chunks for user {username}; run bench.ingest first")
+
+    terms_by_chunk = {c["chunk_id"]: set(TERM.findall(c["text"].lower())) for c in chunks}
+    frequency = Counter(t for terms in terms_by_chunk.values() for t in terms)
+    rng = random.Random(seed)
+    golden, seen = [], set()
+    for chunk in rng.sample(chunks, min(len(chunks), size * 3)):
+        # Rarer terms make for more selective questions
+        terms = sorted(terms_by_chunk[chunk["chunk_id"]], key=lambda t: (frequency[t], t))[:2]
+        if len(terms) < 2 or tuple(terms) in seen:
+            continue
+        seen.add(tuple(terms))
+        relevant = sorted(cid for cid, ts in terms_by_chunk.items() if terms[0] in ts and terms[1] in ts)
+        golden.append({"question": f"How does {terms[0]} relate to {terms[1]}?", "relevant_chunk_ids": relevant})
+        if len(golden) >= size:
+            break
+
+    Path(path).parent.mkdir(parents=True, exist_ok=True)
+    with open(path, "w", encoding="utf-8") as f:
+        for item in golden:
+            f.write(json.dumps(item) + "\n")
+    print(f"[bench] Wrote {len(golden)} golden questions to {path}")
+    return golden
+
+
+def rank_metrics(ranked: List[str], relevant: set, k: int) -> Dict[str, float]:
+    top = ranked[:k]
+    hits = len(relevant.intersection(top))
+    reciprocal = next((1 / (i + 1) for i, cid in enumerate(top) if cid in relevant), 0.0)
+    return {"recall": hits / len(relevant) if relevant else 0.0, "mrr": reciprocal}
+
+
+def fuse(*rankings: List[str]) -> List[str]:
+    """Reciprocal rank fusion of several chunk-id rankings."""
+    scores = defaultdict(float)
+    for ranking in rankings:
+        for i, cid in enumerate(dict.fromkeys(ranking)):
+            scores[cid] += 1 / (RRF_K + i + 1)
+    return sorted(scores, key=lambda cid: -scores[cid])
+
+
+async def evaluate_quality(tools, golden: List[Dict], k: int) -> Dict[str, Dict[str, float]]:
+    totals = {name: defaultdict(float) for name in ("vector", "graph", "fused")}
+    for item in golden:
+        question = item["question"]
+        relevant = set(item["relevant_chunk_ids"])
+        vector_hits = await run_in_executor("embed", tools.search_similar_chunks, question, k)
+        entities = await tools.extract_entities(question)
+        graph_hits = await tools.get_relevant_chunks_from_graph(question, k=k, entities=entities)
+
+        vector_ids = [hit["metadata"]["chunk_id"] for hit in vector_hits]
+        graph_ids = [hit["chunk_id"] for hit in graph_hits if hit.get("chunk_id")]
+        for name, ranked in (("vector", vector_ids), ("graph", graph_ids), ("fused", fuse(vector_ids, graph_ids))):
+            for metric, value in rank_metrics(ranked, relevant, k).items():
+                totals[name][metric] += value
+
+    n = max(len(golden), 1)
+    return {
+        name: {f"recall@{k}": round(m["recall"] / n, 4), "mrr": round(m["mrr"] / n, 4)}
+        for name, m in totals.items()
+    }
+
+
+async def drive(questions: List[str], requests: int, concurrency: int, call) -> Dict:
+    """Issue ``requests`` calls cycling through ``questions`` with bounded concurrency."""
+    limiter = asyncio.Semaphore(concurrency)
+    samples = defaultdict(list)
+    errors = 0
+
+    async def one(i: int):
+        nonlocal errors
+        async with limiter:
+            timings = {}
+            started = time.perf_counter()
+            try:
+                await call(questions[i % len(questions)], timings)
+            except Exception as e:
+                errors += 1
+                print(f"[bench] Request {i} failed: {e}")
+                return
+            samples["total"].append((time.perf_counter() - started) * 1000)
+            for stage, seconds in timings.items():
+                samples[stage].append(seconds * 1000)
+
+    started = time.perf_counter()
+    await asyncio.gather(*(one(i) for i in range(requests)))
+    wall = time.perf_counter() - started
+    return {
+        "requests": requests,
+        "errors": errors,
+        "wall_s": round(wall, 3),
+        "throughput_rps": round((requests - errors) / wall, 2) if wall else None,
+        "latency_ms": {stage: percentiles(values) for stage, values in samples.items()},
+    }
+
+
+async def run_in_process(args, questions, golden):
+    from modules.agent import SearchAgent
+
+    agent = await run_in_executor("io", SearchAgent, username=args.username)
+    try:
+        async def call(question, timings):
+            await agent.search(question, k=args.k, timings=timings)
+
+        if args.warmup:
+            await drive(questions, args.warmup, 1, call)
+        latency = await drive(questions, args.requests, args.concurrency, call)
+        quality = await evaluate_quality(agent.tools, golden, args.k) if golden else None
+    finally:
+        from db.neo4j_connector import close_neo4j_connector
+
+        await agent.close()
+        await close_neo4j_connector()
+    return latency, quality
+
+
+async def run_http(args, questions):
+    import httpx
+
+    async with httpx.AsyncClient(base_url=args.http, timeout=args.timeout) as client:
+        headers = {}
+        if args.login:
+            username, password = args.login.split(":", 1)
+            response = await client.post("/auth/login", data={"username": username, "password": password})
+            response.raise_for_status()
+            headers["Authorization"] = f"Bearer {response.json()['access_token']}"
+
+        async def call(question, timings):
+            response = await client.post("/query/chat", json={"question": question}, headers=headers)
+            response.raise_for_status()
+
+        if args.warmup:
+            await drive(questions, args.warmup, 1, call)
+        return await drive(questions, args.requests, args.concurrency, call)
+
+
+async def main_async(args):
+    golden = None
+    if args.make_golden:
+        golden = make_golden(args.username, args.make_golden, args.golden_size, args.seed)
+    elif args.golden:
+        golden = load_golden(args.golden)
+
+    questions = [g["question"] for g in golden] if golden else ["What methods are compared in these papers?"]
+    quality = None
+    try:
+        if args.http:
+            latency = await run_http(args, questions)
+        else:
+            latency, quality = await run_in_process(args, questions, golden)
+    finally:
+        shutdown_executors()
+
+    config = {
+        "mode": "http" if args.http else "in_process",
+        "username": None if args.http else args.username,
+        "k": args.k,
+        "requests": args.requests,
+        "concurrency": args.concurrency,
+        "golden_questions": len(golden) if golden else 0,
+    }
+    body = {"latency": latency, "quality": quality, "peak_rss_mb": peak_rss_mb()}
+    return write_results("query", config, body, args.out)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark query latency and retrieval quality")
+    parser.add_argument("--username", default="bench_ingest", help="user whose index and graph are queried")
+    parser.add_argument("--golden", help="JSONL golden set of questions and relevant chunk ids")
+    parser.add_argument("--make-golden", metavar="PATH", help="derive a golden set from the user's chunks and use it")
+    parser.add_argument("--golden-size", type=int, default=50)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("-k", type=int, default=3, help="results per retrieval method")
+    parser.add_argument("--requests", type=int, default=50)
+    parser.add_argument("--concurrency", type=int, default=4)
+    parser.add_argument("--warmup", type=int, default=1, help="untimed requests before measuring")
+    parser.add_argument("--http", metavar="URL", help="benchmark POST /query/chat on a running server instead")
+    parser.add_argument("--login", metavar="USER:PASSWORD", help="credentials for --http")
+    parser.add_argument("--timeout", type=float, default=120.0)
+    parser.add_argument("--out", help="write JSON results here instead of stdout")
+    args = parser.parse_args()
+    asyncio.run(main_async(args))
+
+
+if __name__ == "__main__":
+    main()
@@ -1,4 +1,5 @@
 from pathlib import Path
+from typing import Optional
 from pydantic_settings import BaseSettings
 from dotenv import load_dotenv
 load_dotenv()  # Load .env file
@@ -10,6 +11,12 @@ class Settings(BaseSettings):
     database_password: str
     database_name: str
     database_username: str
+    # Pool settings apply per engine (async for request handlers, sync for worker threads)
+    db_pool_size: int = 10
+    db_max_overflow: int = 20
+    db_pool_timeout: float = 30.0
+    db_pool_recycle: int = 1800
+    db_pool_pre_ping: bool = True
     
     # JWT settings
     secret_key: str
@@ -22,6 +29,9 @@ class Settings(BaseSettings):
     vector_store: str = "./data/pdfs/vector_store"
     chunk_size: int = 800
     chunk_overlap: int = 300
+    # Content-addressed store shared by all users (PDFs, parsed pages, embeddings, NER results)
+    cas_dir: str = "./data/cas"
+    upload_chunk_size: int = 1 << 20
     
     # NER Model settings
     model: str = "mistral"
@@ -34,16 +44,102 @@ class Settings(BaseSettings):
     together_api_base: str = "https://api.together.xyz/v1"
     llm_model: str = "mistralai/Mistral-7B-Instruct-v0.2"
     llm_temperature: float = 0.7
+    llm_max_concurrency: int = 8
+    batch_max_questions: int = 500
+
+    # LLM gateway settings (rates are requests per second; 0 disables a bucket)
+    llm_max_inflight: int = 16
+    llm_global_rps: float = 20.0
+    llm_global_burst: float = 40.0
+    llm_user_rps: float = 5.0
+    llm_user_burst: float = 10.0
+    llm_pool_connections: int = 32
+    llm_keepalive_expiry: float = 30.0
+    llm_timeout: float = 120.0
     
     # Neo4j settings
     neo4j_uri: str
     neo4j_username: str
     neo4j_password: str
+    neo4j_max_pool_size: int = 50
+    neo4j_acquisition_timeout: float = 30.0
+    neo4j_max_connection_lifetime: float = 3600.0
+    neo4j_liveness_check_timeout: Optional[float] = 60.0
+    # Relationships or nodes deleted per transaction when a user's graph is cleared
+    graph_delete_batch: int = 10000
     
     # Vector store settings
     vector_index: str = "./data/pdfs/vector_index"
     emb_model: str = "sentence-transformers/all-MiniLM-L6-v2"
 
+    # Execution settings (pool sizes are per worker process)
+    io_workers: int = 16
+    pipeline_workers: int = 2
+    embed_workers: int = 1
+    cpu_workers: int = 2
+    loop_lag_interval: float = 0.5
+    loop_lag_warn_ms: float = 100.0
+
+    # Warmup (after startup, in the background: query stack imports, embedding model, indexes)
+    warmup_enabled: bool = False
+    warmup_index_users: int = 20
+
+    # Job queue settings
+    job_worker_enabled: bool = True
+    job_worker_concurrency: int = 2
+    job_poll_interval: float = 1.0
+    job_heartbeat_interval: float = 2.0
+    job_stale_after: float = 60.0
+    job_max_attempts: int = 3
+    job_retry_backoff: float = 10.0
+
+    # Streaming pipeline settings
+    streaming_pipeline: bool = False
+    pipeline_queue_size: int = 64
+
+    # Auth cache (per process; other processes see changes after at most the TTL)
+    auth_cache_ttl: float = 30.0
+    auth_cache_size: int = 10000
+
+    # KG status cache (per process; entries expire sooner while a job is active)
+    kg_status_cache_ttl: float = 10.0
+    kg_status_active_ttl: float = 1.0
+    kg_status_cache_size: int = 10000
+
+    # Query history (chat answers are written in batches off the response path)
+    history_flush_interval: float = 1.0
+    history_buffer_limit: int = 10000
+    history_page_max: int = 100
+    history_export_batch: int = 500
+
+    # Structured (text-to-Cypher) questions; chains are cached per user and graph build
+    cypher_qa_enabled: bool = False
+    cypher_qa_top_k: int = 10
+    cypher_qa_timeout: float = 30.0
+    cypher_qa_schema_sample: int = 1000
+    cypher_qa_cache_size: int = 64
+    cypher_qa_cache_ttl: float = 3600.0
+
+    # Tracing settings (spans are flushed in bulk to the system_logs table)
+    tracing_enabled: bool = True
+    trace_flush_interval: float = 2.0
+    trace_min_span_ms: float = 5.0
+    trace_buffer_limit: int = 20000
+    # system_logs rows (spans, Cypher profiles) older than this are pruned; 0 keeps everything
+    system_log_retention_days: float = 7.0
+    system_log_prune_interval: float = 3600.0
+    system_log_prune_batch: int = 5000
+
+    # Cypher slow-query log (slow statements are re-run with PROFILE on a sample)
+    cypher_slow_ms: float = 100.0
+    cypher_profile_sample_rate: float = 0.25
+    cypher_profile_interval: float = 300.0
+
+    # Shared index serving settings
+    shared_index_serving: bool = False
+    published_index_dir: str = "./data/published"
+    published_versions_kept: int = 3
+
     class Config:
         env_file = ".env"
         env_file_encoding = 'utf-8'
@@ -64,11 +160,18 @@ TOGETHER_API_KEY = settings.together_api_key
 TOGETHER_API_BASE = settings.together_api_base
 LLM_MODEL = settings.llm_model
 LLM_TEMPERATURE = settings.llm_temperature
+LLM_MAX_CONCURRENCY = settings.llm_max_concurrency
+BATCH_MAX_QUESTIONS = settings.batch_max_questions
 NEO4J_URI = settings.neo4j_uri
 NEO4J_USERNAME = settings.neo4j_username
 NEO4J_PASSWORD = settings.neo4j_password
+NEO4J_MAX_POOL_SIZE = settings.neo4j_max_pool_size
+NEO4J_ACQUISITION_TIMEOUT = settings.neo4j_acquisition_timeout
 VECTOR_INDEX = Path(settings.vector_index)
 EMB_MODEL = settings.emb_model
+SHARED_INDEX_SERVING = settings.shared_index_serving
+PUBLISHED_INDEX_DIR = Path(settings.published_index_dir)
+PUBLISHED_VERSIONS_KEPT = settings.published_versions_kept
 
 PROMPT = """
   You are an NLP researcher assistant helping extract scientific concepts from text chunks
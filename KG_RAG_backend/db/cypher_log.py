@@ -0,0 +1,207 @@
+"""Per-statement Cypher timing aggregated by normalized query text.
+
+``Neo4jConnector`` hands transaction functions a ``ProfiledTransaction``, so
+every ``tx.run`` is timed, including each of the small statements inside one
+graph-write transaction. Statements slower than ``CYPHER_SLOW_MS`` are
+logged, and a sample of them is re-run with ``PROFILE`` once the original
+transaction has finished. The re-run happens in a transaction that is rolled
+back, so profiling a write never changes the graph. Captured plans keep their
+operators, db hits and rows, and flag Cartesian products and label or
+all-node scans, which usually mean a missing index. Profiles go to
+``system_logs`` with level ``CYPHER_PROFILE`` and are kept alongside the
+aggregates.
+"""
+import logging
+import random
+import re
+import threading
+import time
+from typing import Any, Dict, List, Optional, Tuple
+
+from config import settings
+from utils.metrics import Counter
+from utils.tracing import log_event
+
+CYPHER_SLOW_STATEMENTS = Counter("kgrag_cypher_slow_statements_total", "Cypher statements over the slow-query threshold.")
+
+_STRING = re.compile(r"'(?:[^'\\]|\\.)*'|\"(?:[^\"\\]|\\.)*\"")
+_NUMBER = re.compile(r"(?<![\w$.])-?\d+(?:\.\d+)?\b")
+_SPACE = re.compile(r"\s+")
+
+# Operators that usually point at a missing index or a disconnected pattern
+SUSPECT_OPERATORS = ("CartesianProduct", "AllNodesScan", "NodeByLabelScan")
+
+
+def normalize(query: str) -> str:
+    """Collapse whitespace and replace string and number literals with ``?``."""
+    query = _STRING.sub("?", query)
+    query = _NUMBER.sub("?", query)
+    return _SPACE.sub(" ", query).strip()
+
+
+def _plan_tree(plan: Dict[str, Any]) -> Dict[str, Any]:
+    args = plan.get("args") or {}
+    return {
+        "operator": plan.get("operatorType"),
+        "details": args.get("Details"),
+        "db_hits": plan.get("dbHits", 0),
+        "rows": plan.get("rows", 0),
+        "children": [_plan_tree(child) for child in plan.get("children") or []],
+    }
+
+
+def _walk(node: Dict[str, Any]):
+    yield node
+    for child in node["children"]:
+        yield from _walk(child)
+
+
+class QueryStats:
+    def __init__(self, query: str):
+        self.query = query
+        self.count = 0
+        self.errors = 0
+        self.slow = 0
+        self.rows = 0
+        self.total_ms = 0.0
+        self.max_ms = 0.0
+        self.profile: Optional[Dict[str, Any]] = None
+        self.profiled_at = float("-inf")
+
+    def snapshot(self) -> Dict[str, Any]:
+        return {
+            "query": self.query,
+            "count": self.count,
+            "errors": self.errors,
+            "slow": self.slow,
+            "rows": self.rows,
+            "total_ms": round(self.total_ms, 1),
+            "avg_ms": round(self.total_ms / self.count, 2) if self.count else 0.0,
+            "max_ms": round(self.max_ms, 1),
+            "profile": self.profile,
+        }
+
+
+class CypherQueryLog:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._stats: Dict[str, QueryStats] = {}
+
+    def record(self, query: str, elapsed_ms: float, rows: int, failed: bool) -> bool:
+        """Aggregate one statement; returns True when it should be profiled."""
+        key = normalize(query)
+        now = time.monotonic()
+        with self._lock:
+            stats = self._stats.get(key)
+            if stats is None:
+                stats = self._stats[key] = QueryStats(key)
+            stats.count += 1
+            stats.rows += rows
+            stats.total_ms += elapsed_ms
+            stats.max_ms = max(stats.max_ms, elapsed_ms)
+            if failed:
+                stats.errors += 1
+                return False
+            if elapsed_ms < settings.cypher_slow_ms:
+                return False
+            stats.slow += 1
+            profile = (
+                now - stats.profiled_at >= settings.cypher_profile_interval
+                and random.random() < settings.cypher_profile_sample_rate
+            )
+            if profile:
+                # Claim the slot now so concurrent slow runs don't all profile
+                stats.profiled_at = now
+
+        CYPHER_SLOW_STATEMENTS.inc()
+        logging.warning(f"Slow Cypher ({elapsed_ms:.0f} ms, {rows} rows): {key[:200]}")
+        return profile
+
+    def store_profile(self, query: str, plan: Dict[str, Any], rows: int, notifications: List[Any],
+                      mode: str = "PROFILE"):
+        """Keep a captured plan; an ``EXPLAIN`` plan has no db hits or rows."""
+        tree = _plan_tree(plan)
+        nodes = list(_walk(tree))
+        profile = {
+            "captured_at": time.time(),
+            "mode": mode,
+            "db_hits": sum(node["db_hits"] for node in nodes),
+            "rows": rows,
+            "warnings": sorted({node["operator"] for node in nodes if node["operator"] in SUSPECT_OPERATORS}),
+            "notifications": [
+                n.get("title") or n.get("code") if isinstance(n, dict) else str(n) for n in notifications or []
+            ],
+            "plan": tree,
+        }
+        key = normalize(query)
+        with self._lock:
+            stats = self._stats.get(key)
+            if stats is None:
+                stats = self._stats[key] = QueryStats(key)
+            stats.profile = profile
+
+        if profile["warnings"]:
+            logging.warning(f"Cypher plan uses {', '.join(profile['warnings'])}: {key[:200]}")
+        log_event("CYPHER_PROFILE", key[:200], {"query": key, **profile})
+
+    def snapshot(self, limit: int = 50) -> List[Dict[str, Any]]:
+        """Statements with the most total time first."""
+        with self._lock:
+            stats = sorted(self._stats.values(), key=lambda s: s.total_ms, reverse=True)[:limit]
+            return [s.snapshot() for s in stats]
+
+
+class BufferedResult:
+    """A fully read result, so statement timing includes streaming the records."""
+
+    def __init__(self, records, summary):
+        self.records = records
+        self.summary = summary
+
+    async def data(self, *keys):
+        return [record.data(*keys) for record in self.records]
+
+    async def consume(self):
+        return self.summary
+
+    def __aiter__(self):
+        return self._iter()
+
+    async def _iter(self):
+        for record in self.records:
+            yield record
+
+
+class ProfiledTransaction:
+    """Wraps a managed transaction so each ``run`` is timed and logged.
+
+    Statements picked for profiling are appended to ``to_profile`` as
+    ``(query, parameters)``; the connector profiles them after the
+    transaction ends, so the re-run never waits on this transaction's locks.
+    """
+
+    def __init__(self, tx, log: CypherQueryLog, to_profile: List[Tuple[str, Dict[str, Any]]]):
+        self._tx = tx
+        self._log = log
+        self.to_profile = to_profile
+
+    async def run(self, query: str, parameters: Optional[Dict[str, Any]] = None, **kwargs):
+        parameters = {**(parameters or {}), **kwargs}
+        started = time.perf_counter()
+        records, failed = [], True
+        try:
+            result = await self._tx.run(query, parameters)
+            records = [record async for record in result]
+            summary = await result.consume()
+            failed = False
+        finally:
+            elapsed_ms = (time.perf_counter() - started) * 1000
+            if self._log.record(query, elapsed_ms, len(records), failed):
+                self.to_profile.append((query, parameters))
+        return BufferedResult(records, summary)
+
+    def __getattr__(self, name):
+        return getattr(self._tx, name)
+
+
+cypher_log = CypherQueryLog()
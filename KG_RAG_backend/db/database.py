@@ -1,22 +1,66 @@
-from sqlalchemy import create_engine
+from sqlalchemy import create_engine, text
+from sqlalchemy.ext.asyncio import async_sessionmaker, create_async_engine
 from sqlalchemy.orm import sessionmaker
 from config import settings
 from .base import Base
 from . import models  # Import models here
 
-SQLALCHEMY_DATABASE_URL = f'postgresql://{settings.database_username}:{settings.database_password}@{settings.database_hostname}:{settings.database_port}/{settings.database_name}'
+_CREDENTIALS = f'{settings.database_username}:{settings.database_password}@{settings.database_hostname}:{settings.database_port}/{settings.database_name}'
+SQLALCHEMY_DATABASE_URL = f'postgresql://{_CREDENTIALS}'
+ASYNC_DATABASE_URL = f'postgresql+asyncpg://{_CREDENTIALS}'
 
-print("Database URL:", SQLALCHEMY_DATABASE_URL)
+_POOL_OPTIONS = dict(
+    pool_size=settings.db_pool_size,
+    max_overflow=settings.db_max_overflow,
+    pool_timeout=settings.db_pool_timeout,
+    pool_recycle=settings.db_pool_recycle,
+    pool_pre_ping=settings.db_pool_pre_ping,
+)
 
-engine = create_engine(SQLALCHEMY_DATABASE_URL)
+# Request handlers use the async engine; job workers and other code running in
+# pool threads keep the sync engine. Neither connects until first use.
+async_engine = create_async_engine(ASYNC_DATABASE_URL, **_POOL_OPTIONS)
+AsyncSessionLocal = async_sessionmaker(async_engine, autoflush=False, expire_on_commit=False)
+
+engine = create_engine(SQLALCHEMY_DATABASE_URL, **_POOL_OPTIONS)
 SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
 
-Base.metadata.create_all(bind=engine)
+# Columns added to existing tables after their first release: (table, column, type)
+ADDED_COLUMNS = [
+    ("files", "content_hash", "VARCHAR(64)"),
+    ("system_logs", "user_id", "INTEGER"),
+    ("system_logs", "job_id", "INTEGER"),
+    ("system_logs", "duration_ms", "DOUBLE PRECISION"),
+]
+
+def _create_schema(conn):
+    Base.metadata.create_all(conn)
+    for table, column, column_type in ADDED_COLUMNS:
+        conn.execute(text(f"ALTER TABLE {table} ADD COLUMN IF NOT EXISTS {column} {column_type}"))
+    # create_all skips the indexes of tables that already exist, so indexes
+    # added to a model later are created here (CREATE INDEX IF NOT EXISTS)
+    for table in Base.metadata.sorted_tables:
+        for index in table.indexes:
+            index.create(conn, checkfirst=True)
+
+async def init_db():
+    """Create missing tables and indexes. Called once at startup, not on import."""
+    async with async_engine.begin() as conn:
+        await conn.run_sync(_create_schema)
+
+async def close_db():
+    await async_engine.dispose()
+    engine.dispose()
+
+async def get_async_db():
+    # Sessions connect lazily, so requests that never query (e.g. auth cache
+    # hits on polling routes) don't check out a pool connection
+    async with AsyncSessionLocal() as db:
+        yield db
 
 def get_db():
     db = SessionLocal()
     try:
-        print("Connection established")
         yield db
     finally:
         db.close()
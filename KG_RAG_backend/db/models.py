@@ -1,4 +1,4 @@
-from sqlalchemy import Column, Integer, String, Boolean, ForeignKey, JSON, DateTime, Float, Text
+from sqlalchemy import Column, Integer, String, Boolean, ForeignKey, JSON, DateTime, Float, Text, Index
 from sqlalchemy.orm import relationship
 from sqlalchemy.sql.expression import text
 from sqlalchemy.sql.sqltypes import TIMESTAMP
@@ -22,6 +22,7 @@ class User(Base):
     # Relationships
     files = relationship("File", back_populates="user")
     query_history = relationship("QueryHistory", back_populates="user")
+    jobs = relationship("Job", back_populates="user")
 
 class File(Base):
     __tablename__ = "files"
@@ -33,6 +34,8 @@ class File(Base):
     uploaded_at = Column(TIMESTAMP, server_default=text("now()"))
     processed_at = Column(TIMESTAMP, nullable=True)
     file_path = Column(String, nullable=False)
+    # sha256 of the PDF, its key in the content-addressed store
+    content_hash = Column(String(64), nullable=True, index=True)
     user_id = Column(Integer, ForeignKey("users.id"))
 
     # Relationships
@@ -40,6 +43,9 @@ class File(Base):
 
 class QueryHistory(Base):
     __tablename__ = "query_history"
+    __table_args__ = (
+        Index("ix_query_history_user_timestamp", "user_id", "timestamp", "id"),
+    )
 
     id = Column(Integer, primary_key=True, index=True)
     query = Column(Text)
@@ -51,11 +57,49 @@ class QueryHistory(Base):
     # Relationships
     user = relationship("User", back_populates="query_history")
 
+class Job(Base):
+    __tablename__ = "jobs"
+    __table_args__ = (
+        Index("ix_jobs_claim", "status", "run_after"),
+    )
+
+    id = Column(Integer, primary_key=True, index=True)
+    kind = Column(String, nullable=False)
+    status = Column(String, nullable=False, default="queued")  # queued, running, succeeded, failed, cancelled
+    stage = Column(String, nullable=True)
+    progress = Column(Float, nullable=False, default=0.0)
+    payload = Column(JSON, nullable=True)
+    result = Column(JSON, nullable=True)
+    error = Column(Text, nullable=True)
+    attempts = Column(Integer, nullable=False, default=0)
+    max_attempts = Column(Integer, nullable=False, default=3)
+    cancel_requested = Column(Boolean, nullable=False, default=False)
+    worker_id = Column(String, nullable=True)
+    run_after = Column(TIMESTAMP, server_default=text("now()"))
+    created_at = Column(TIMESTAMP, server_default=text("now()"))
+    started_at = Column(TIMESTAMP, nullable=True)
+    heartbeat_at = Column(TIMESTAMP, nullable=True)
+    finished_at = Column(TIMESTAMP, nullable=True)
+    user_id = Column(Integer, ForeignKey("users.id"), nullable=False, index=True)
+
+    # Relationships
+    user = relationship("User", back_populates="jobs")
+
 class SystemLog(Base):
     __tablename__ = "system_logs"
+    __table_args__ = (
+        # Trace lookups filter on these instead of on keys inside ``details``
+        Index("ix_system_logs_level_user_duration", "level", "user_id", "duration_ms"),
+        Index("ix_system_logs_level_job", "level", "job_id"),
+        Index("ix_system_logs_timestamp", "timestamp"),
+    )
 
     id = Column(Integer, primary_key=True, index=True)
     timestamp = Column(TIMESTAMP, server_default=text("now()"))
     level = Column(String, nullable=False)
     message = Column(String, nullable=False)
     details = Column(JSON, nullable=True)
+    # Copied out of ``details`` for trace spans
+    user_id = Column(Integer, nullable=True)
+    job_id = Column(Integer, nullable=True)
+    duration_ms = Column(Float, nullable=True)
@@ -1,34 +1,166 @@
-from neo4j import GraphDatabase
+import asyncio
+import logging
+import threading
+import time
+from typing import Optional
+from neo4j import AsyncGraphDatabase
 from config import settings
+from db.cypher_log import ProfiledTransaction, cypher_log
+from utils.metrics import CYPHER_QUERIES, CYPHER_SECONDS, NEO4J_ACQUIRE_SECONDS, NEO4J_POOL_IN_USE, NEO4J_POOL_MAX
+from utils.tracing import span
 
 class Neo4jConnector:
-    def __init__(self):
-        self.uri = settings.neo4j_uri
-        self.user = settings.neo4j_username
-        self.password = settings.neo4j_password
+    """Async Neo4j access layer built on managed transactions.
+
+    Reads go through ``execute_read`` and writes through ``execute_write`` so the
+    driver retries transient failures, and no Cypher round trip blocks the event
+    loop. Pool size and acquisition timeout come from settings.
+    """
+
+    def __init__(self, uri=None, user=None, password=None):
+        self.uri = uri or settings.neo4j_uri
+        self.user = user or settings.neo4j_username
+        self.password = password or settings.neo4j_password
         self.driver = None
+        self._profile_tasks = set()
 
     def connect(self):
         try:
-            self.driver = GraphDatabase.driver(self.uri, auth=(self.user, self.password))
+            self.driver = AsyncGraphDatabase.driver(
+                self.uri,
+                auth=(self.user, self.password),
+                max_connection_pool_size=settings.neo4j_max_pool_size,
+                connection_acquisition_timeout=settings.neo4j_acquisition_timeout,
+                max_connection_lifetime=settings.neo4j_max_connection_lifetime,
+                liveness_check_timeout=settings.neo4j_liveness_check_timeout,
+            )
+            NEO4J_POOL_MAX.set(settings.neo4j_max_pool_size)
         except Exception as e:
             print(f"Failed to create the driver: {e}")
             raise
 
-    def close(self):
+    async def close(self):
+        if self._profile_tasks:
+            await asyncio.gather(*self._profile_tasks, return_exceptions=True)
         if self.driver:
-            self.driver.close()
+            await self.driver.close()
+
+    async def _managed(self, access, label, work, *args, **kwargs):
+        """Run ``work`` as a managed transaction and record its count and latency.
+
+        ``work`` gets a ``ProfiledTransaction``, so each statement it runs is
+        timed in the slow-query log; slow ones it samples are profiled afterwards.
+        The wait until the first attempt starts is recorded as pool acquisition
+        time, and the transaction counts as holding a connection from then on.
+        """
+        to_profile = []
+        acquired = False
+
+        async def timed_work(tx, *work_args, **work_kwargs):
+            nonlocal acquired
+            if not acquired:
+                acquired = True
+                NEO4J_ACQUIRE_SECONDS.observe(time.perf_counter() - started, access=access)
+                NEO4J_POOL_IN_USE.inc()
+            return await work(ProfiledTransaction(tx, cypher_log, to_profile), *work_args, **work_kwargs)
+
+        started = time.perf_counter()
+        outcome = "error"
+        try:
+            with span("cypher", access=access, query=label[:200]):
+                async with self.driver.session() as session:
+                    run = session.execute_read if access == "read" else session.execute_write
+                    result = await run(timed_work, *args, **kwargs)
+            outcome = "ok"
+            return result
+        finally:
+            if acquired:
+                NEO4J_POOL_IN_USE.dec()
+            CYPHER_SECONDS.observe(time.perf_counter() - started, access=access)
+            CYPHER_QUERIES.inc(access=access, outcome=outcome)
+            for query, parameters in to_profile:
+                task = asyncio.create_task(self._profile(access, query, parameters))
+                self._profile_tasks.add(task)
+                task.add_done_callback(self._profile_tasks.discard)
 
-    def execute_query(self, query, parameters=None):
-        with self.driver.session() as session:
-            result = session.run(query, parameters)
-            return result.data()
+    async def _profile(self, access, query, parameters):
+        """Capture the plan of a slow statement in a rolled-back transaction.
 
-    def verify_connection(self):
+        Reads are re-run with PROFILE for db hits and rows. Writes only get
+        EXPLAIN: re-running them would repeat the write and take its locks again.
+        """
+        if query.lstrip().upper().startswith(("PROFILE", "EXPLAIN")):
+            return
+        mode = "PROFILE" if access == "read" else "EXPLAIN"
         try:
-            with self.driver.session() as session:
-                session.run("RETURN 1")
+            async with self.driver.session() as session:
+                tx = await session.begin_transaction()
+                try:
+                    result = await tx.run(f"{mode} {query}", parameters)
+                    rows = len([record async for record in result])
+                    summary = await result.consume()
+                finally:
+                    await tx.rollback()
+            plan = summary.profile if mode == "PROFILE" else summary.plan
+            if plan:
+                cypher_log.store_profile(query, plan, rows, summary.notifications, mode)
+        except Exception as e:
+            logging.warning(f"Could not profile slow Cypher statement: {e}")
+
+    async def execute_read(self, query, parameters=None):
+        async def work(tx):
+            result = await tx.run(query, parameters or {})
+            return await result.data()
+
+        return await self._managed("read", query, work)
+
+    async def execute_write(self, query, parameters=None):
+        async def work(tx):
+            result = await tx.run(query, parameters or {})
+            return await result.data()
+
+        return await self._managed("write", query, work)
+
+    async def write_transaction(self, work, *args, **kwargs):
+        """Run ``work(tx, *args, **kwargs)`` as one managed write transaction."""
+        return await self._managed("write", work.__name__, work, *args, **kwargs)
+
+    async def execute_query(self, query, parameters=None):
+        return await self.execute_write(query, parameters)
+
+    async def verify_connection(self):
+        try:
+            await self.driver.verify_connectivity()
             return True
         except Exception as e:
             print(f"Connection verification failed: {e}")
-            return False
\ No newline at end of file
+            return False
+
+
+_shared_connector: Optional[Neo4jConnector] = None
+_shared_lock = threading.Lock()
+
+
+def get_neo4j_connector() -> Neo4jConnector:
+    """The process-wide connector, also usable as a FastAPI dependency.
+
+    Every graph consumer shares its driver and connection pool instead of
+    opening a driver (and TCP/TLS handshakes) per request. The driver is
+    created on first use; the API lifespan and worker.py close it.
+    """
+    global _shared_connector
+    if _shared_connector is None:
+        # Consumers may be constructed in pool threads
+        with _shared_lock:
+            if _shared_connector is None:
+                connector = Neo4jConnector()
+                connector.connect()
+                _shared_connector = connector
+    return _shared_connector
+
+
+async def close_neo4j_connector():
+    global _shared_connector
+    connector, _shared_connector = _shared_connector, None
+    if connector is not None:
+        await connector.close()
@@ -1,34 +1,84 @@
+from utils.startup import startup_profile
 import asyncio
+import time
 from contextlib import asynccontextmanager
-from fastapi import FastAPI, HTTPException
+from fastapi import FastAPI, HTTPException, Request
+from fastapi.responses import PlainTextResponse
 from fastapi.middleware.cors import CORSMiddleware
 from fastapi.staticfiles import StaticFiles
-from routers import KG_status, query, graph, data_loader, auth, user
+from routers import KG_status, query, graph, data_loader, auth, user, jobs, traces
 from config import settings
-from db.neo4j_connector import Neo4jConnector
+from db.database import close_db, init_db
+from db.neo4j_connector import close_neo4j_connector, get_neo4j_connector
+from modules import cypher_qa
+from modules.graph_migration import migrate_legacy_graph
+from modules.history import history_writer
+from modules.jobs import JobWorker
+from modules import warmup
+from modules.llm_gateway import llm_gateway
+from utils.executors import loop_monitor, shutdown_executors
+from utils.metrics import HTTP_REQUEST_SECONDS, render_metrics
+from utils.tracing import trace_flusher
 import socket
 import sys
 
+async def verify_neo4j(connector):
+    if await connector.verify_connection():
+        print("Successfully connected to Neo4j.")
+    else:
+        print("Failed to connect to Neo4j. Continuing without Neo4j connection.")
+
 @asynccontextmanager
 async def lifespan(app: FastAPI):
     # Startup
+    await init_db()
+    startup_profile.mark("database")
+    background = []
     try:
-        neo4j_connector.connect()
-        if neo4j_connector.verify_connection():
-            print("Successfully connected to Neo4j.")
-        else:
-            print("Failed to connect to Neo4j. Continuing without Neo4j connection.")
+        # One driver and pool for every graph consumer in this process
+        app.state.neo4j = get_neo4j_connector()
+        # Checked in the background so an unreachable Neo4j doesn't hold up startup
+        background.append(asyncio.create_task(verify_neo4j(app.state.neo4j)))
+        background.append(asyncio.create_task(migrate_legacy_graph(app.state.neo4j)))
     except Exception as e:
         print(f"Error during Neo4j startup: {e}")
         print("Continuing without Neo4j connection.")
+    startup_profile.mark("neo4j_driver")
+
+    loop_monitor.start()
+    trace_flusher.start()
+    history_writer.start()
+
+    # Run pipeline jobs in-process unless dedicated workers (worker.py) handle them
+    job_worker = None
+    if settings.job_worker_enabled:
+        job_worker = JobWorker()
+        job_worker.start()
+    startup_profile.mark("background_services")
+    startup_profile.report()
+
+    # Heavy imports and model loading happen after the server is accepting traffic
+    if settings.warmup_enabled:
+        background.append(asyncio.create_task(warmup.warmup()))
     
     yield
     
     # Shutdown
+    for task in background:
+        task.cancel()
+    await asyncio.gather(*background, return_exceptions=True)
+    if job_worker:
+        await job_worker.stop()
+    await loop_monitor.stop()
+    await history_writer.stop()
+    await trace_flusher.stop()
+    shutdown_executors()
     try:
-        neo4j_connector.close()
+        await close_neo4j_connector()
+        cypher_qa.close_graph()
     except Exception as e:
         print(f"Error during Neo4j shutdown: {e}")
+    await close_db()
 
 app = FastAPI(lifespan=lifespan)
 
@@ -45,8 +95,27 @@ app.add_middleware(
     allow_credentials=True,
     allow_methods=["*"],
     allow_headers=["*"],
+    expose_headers=["X-Next-Cursor"],
 )
 
+@app.middleware("http")
+async def record_request_latency(request: Request, call_next):
+    started = time.perf_counter()
+    status = 500
+    try:
+        response = await call_next(request)
+        status = response.status_code
+        return response
+    finally:
+        # Label by route template, not raw path, so ids don't explode cardinality
+        route = request.scope.get("route")
+        HTTP_REQUEST_SECONDS.observe(
+            time.perf_counter() - started,
+            method=request.method,
+            route=getattr(route, "path", "unmatched"),
+            status=status,
+        )
+
 # Include routers
 app.include_router(KG_status.router, tags=["KG-status"])
 app.include_router(query.router, tags=["query"])
@@ -54,14 +123,25 @@ app.include_router(graph.router, tags=["graph"])
 app.include_router(data_loader.router, tags=["data-loader"])
 app.include_router(auth.router, tags=["auth"])
 app.include_router(user.router, tags=["users"])
-
-# Initialize Neo4j connector
-neo4j_connector = Neo4jConnector()
+app.include_router(jobs.router, tags=["jobs"])
+app.include_router(traces.router, tags=["traces"])
+startup_profile.mark("imports")
 
 # Health check endpoint
 @app.get("/health")
 async def health_check():
-    return {"status": "ok"}
+    return {
+        "status": "ok",
+        "event_loop_lag": loop_monitor.snapshot(),
+        "llm": llm_gateway.snapshot(),
+        "startup_ms": startup_profile.snapshot(),
+        "warmup": warmup.state
+    }
+
+# Prometheus scrape endpoint
+@app.get("/metrics", response_class=PlainTextResponse)
+async def metrics():
+    return PlainTextResponse(render_metrics(), media_type="text/plain; version=0.0.4")
 
 if __name__ == "__main__":
     import uvicorn
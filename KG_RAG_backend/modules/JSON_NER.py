@@ -1,5 +1,3 @@
-from langchain_openai.chat_models import ChatOpenAI
-import os
 import json
 from pathlib import Path
 import time
@@ -7,12 +5,17 @@ import time
 from langchain_core.output_parsers import JsonOutputParser, PydanticOutputParser
 from langchain_core.prompts import PromptTemplate
 from config import CHUNK_STORE, BLOCK_SIZE, MODEL, PROMPT, ENTITY_PATH
+from modules.chunk_store import ChunkStore
+from modules.content_store import content_store
+from modules.llm_gateway import get_chat_model
+from utils.metrics import NER_BATCH_SECONDS, NER_CHUNKS
+from utils.tracing import annotate, span
 
 from pydantic import RootModel
 from typing import Dict, List
 from config import (
     NEO4J_URI, NEO4J_USERNAME, NEO4J_PASSWORD,
-    TOGETHER_API_KEY, TOGETHER_API_BASE, LLM_MODEL, LLM_TEMPERATURE
+    LLM_MODEL
 )
 
 class EntityResponse(RootModel[Dict[str, List[str]]]):
@@ -23,21 +26,9 @@ class Chunks_NER:
         self.username = username
         print(f"[Chunks_NER] Initializing for user: {username}")
         
-        # Initialize LLM with proper configuration
-        try:
-            print("[Chunks_NER] Attempting to initialize LLM...")
-            # Add your API key here or load from env
-            os.environ["TOGETHER_API_KEY"] = TOGETHER_API_KEY
-            self.llm = ChatOpenAI(
-                temperature=LLM_TEMPERATURE,
-                openai_api_key=TOGETHER_API_KEY,
-                openai_api_base=TOGETHER_API_BASE,
-                model_name=LLM_MODEL,
-            )
-            print(f"[Chunks_NER] Successfully initialized LLM with model: {LLM_MODEL}")
-        except Exception as e:
-            print(f"[Chunks_NER ERROR] Error initializing LLM: {str(e)}")
-            raise
+        # NER runs through the shared gateway at batch priority so it yields to chat
+        self.llm = get_chat_model(username=username, priority="batch")
+        print(f"[Chunks_NER] Using gateway LLM with model: {LLM_MODEL}")
         
         # Create parser and format instructions
         self.parser = PydanticOutputParser(pydantic_object=EntityResponse)
@@ -64,30 +55,133 @@ class Chunks_NER:
         print(f"[Chunks_NER] Directories ensured: chunks at {self.chunks_dir}, entities at {self.entities_dir}")
         
         # Set file paths
-        self.chunks_file = self.chunks_dir / f"chunks_{username}.jsonl"
+        self.chunk_store = ChunkStore.for_user(username)
         self.entities_file = self.entities_dir / f"entities_{username}.json"
-        print(f"[Chunks_NER] File paths set: chunks={self.chunks_file}, entities={self.entities_file}")
+        print(f"[Chunks_NER] File paths set: chunks={self.chunk_store.path}, entities={self.entities_file}")
 
     def load_chunks(self):
-        print(f"[Chunks_NER] Loading chunks from {self.chunks_file}...")
+        print(f"[Chunks_NER] Loading chunks from {self.chunk_store.path}...")
         try:
-            if not self.chunks_file.exists():
-                print(f"[Chunks_NER] No chunks file found at {self.chunks_file}")
+            if not self.chunk_store.exists():
+                print(f"[Chunks_NER] No chunks found at {self.chunk_store.path}")
                 return []
-                
-            chunks = []
-            with open(self.chunks_file, "r", encoding="utf-8") as f:
-                for line in f:
-                    if line.strip():
-                        data = json.loads(line)
-                        chunks.append([data["chunk_id"], data["text"]])
-            print(f"[Chunks_NER] Loaded {len(chunks)} chunks from {self.chunks_file}")
+
+            chunks = [[c["chunk_id"], c["text"]] for c in self.chunk_store.iter_chunks()]
+            print(f"[Chunks_NER] Loaded {len(chunks)} chunks from {self.chunk_store.path}")
             return chunks
         except Exception as e:
             print(f"[Chunks_NER ERROR] Error loading chunks: {e}")
             return []
 
-    def Extract_Entities(self):
+    def extract_batch(self, batch, known_entities, label=""):
+        """Run NER over one batch of [chunk_id, text] pairs.
+
+        Chunks whose text the content store already has entities for are not
+        sent to the LLM. Returns {chunk_id: [normalized entities]}; failed
+        chunks are missing from it.
+        """
+        cached = content_store.get_entities([text for _, text in batch])
+        found = {cid: entities for (cid, _), entities in zip(batch, cached) if entities}
+        misses = [pair for pair, entities in zip(batch, cached) if entities is None]
+        if not misses:
+            print(f"[Chunks_NER] Batch {label} served from the content store.")
+            return found
+
+        extracted = self._invoke_batch(misses, known_entities, label)
+        if extracted is not None:
+            # Only chunks the response answered for are stored, empty ones included, so
+            # ids the model dropped or mistyped are asked again instead of cached as empty
+            answered = [(cid, text) for cid, text in misses if cid in extracted]
+            content_store.put_entities(
+                [text for _, text in answered], [extracted[cid] for cid, _ in answered]
+            )
+            found.update((cid, entities) for cid, entities in extracted.items() if entities)
+        return found
+
+    def _invoke_batch(self, batch, known_entities, label):
+        """Ask the LLM for one batch; None if the call failed or returned nothing.
+
+        Maps every chunk id in the response to its normalized entities, which
+        may be empty.
+        """
+        start = time.time()
+        prompt_input = {
+            "known_entities": list(known_entities)[-100:],
+            "batch_texts": "\n".join([f"{cid}: {text}" for cid, text in batch])
+        }
+        print(f"[Chunks_NER] Prompt input for batch {label}: {prompt_input['batch_texts'][:100]}...") # Print first 100 chars of batch_texts
+
+        found = dict()
+        NER_CHUNKS.inc(len(batch))
+        try:
+            print(f"[Chunks_NER] Invoking LLM chain for batch {label}...")
+            with span("ner_batch", batch=label, chunks=len(batch)):
+                response = self.chain.invoke(prompt_input)
+                annotate(chunks_with_entities=len(response.root) if response and response.root else 0)
+            
+            # Debug print the response
+            print(f"[Chunks_NER] Response type: {type(response)}")
+            print(f"[Chunks_NER] Response content: {response}")
+            
+            if not response or not response.root:
+                print(f"[Chunks_NER WARNING] Empty or invalid response for batch {label}")
+                NER_BATCH_SECONDS.observe(time.time() - start, outcome="empty")
+                return None
+                
+            for chunk_id, entity_list in response.root.items():
+                # Kept even when empty, so the caller knows the chunk was answered for
+                found[chunk_id] = [e.strip().lower() for e in entity_list or [] if e.strip()]
+            print(f"[Chunks_NER] Entities processed for batch {label}.")
+            
+        except Exception as e:
+            print(f"[Chunks_NER ERROR] Error processing batch {label}: {str(e)}")
+            # Optionally, log the full traceback here for more detailed debugging
+            # import traceback
+            # traceback.print_exc()
+            NER_BATCH_SECONDS.observe(time.time() - start, outcome="error")
+            return None
+        
+        end = time.time()
+        NER_BATCH_SECONDS.observe(end - start, outcome="ok")
+        print(f"[Chunks_NER] Batch {label} took {end - start:.2f} seconds")
+        return found
+
+    def add_entities(self, chunks, progress_callback=None):
+        """Extract entities for the given chunk dicts only and merge them into the entities file.
+
+        Returns {chunk_id: [normalized entities]} for those chunks.
+        """
+        existing = {}
+        if self.entities_file.exists():
+            with open(self.entities_file, "r", encoding="utf-8") as f:
+                existing = json.load(f)
+        entities = {name for names in existing.values() if isinstance(names, list) for name in names}
+
+        pairs = [[c["chunk_id"], c["text"]] for c in chunks]
+        found = dict()
+        for i in range(0, len(pairs), BLOCK_SIZE):
+            if progress_callback:
+                progress_callback("Extracting entities", i / len(pairs))
+            batch = pairs[i:i + BLOCK_SIZE]
+            label = f"{i // BLOCK_SIZE + 1}/{len(pairs) // BLOCK_SIZE + 1}"
+            batch_found = self.extract_batch(batch, entities, label)
+            found.update(batch_found)
+            for normalized in batch_found.values():
+                entities.update(normalized)
+
+        existing.update(found)
+        self.save_entities(existing)
+        return found
+
+    def save_entities(self, dump):
+        if dump:  # Only write if we have entities
+            with open(self.entities_file, "w", encoding="utf-8") as f:
+                json.dump(dump, f, indent=2, ensure_ascii=False)
+            print(f"[Chunks_NER] Saved {len(dump)} chunks with entities to {self.entities_file}")
+        else:
+            print("[Chunks_NER WARNING] No entities were extracted from any chunks. No file written.")
+
+    def Extract_Entities(self, progress_callback=None):
         print("[Chunks_NER] Starting entity extraction...")
         entities = set()
         chunks = self.load_chunks()
@@ -99,53 +193,19 @@ class Chunks_NER:
         
         # Open the file once after processing all chunks
         for i in range(0, len(chunks), BLOCK_SIZE):
-            start = time.time()
+            # Report outside extract_batch so a cancelled job stops here instead of being swallowed
+            if progress_callback:
+                progress_callback("Extracting entities", i / len(chunks))
             batch = chunks[i:i + BLOCK_SIZE]
-            print(f"[Chunks_NER] Processing batch {i // BLOCK_SIZE + 1}/{len(chunks) // BLOCK_SIZE + 1} with {len(batch)} texts.")
-            
-            prompt_input = {
-                "known_entities": list(entities)[-100:],
-                "batch_texts": "\n".join([f"{cid}: {text}" for cid, text in batch])
-            }
-            print(f"[Chunks_NER] Prompt input for batch {i // BLOCK_SIZE + 1}: {prompt_input['batch_texts'][:100]}...") # Print first 100 chars of batch_texts
-
-            try:
-                print(f"[Chunks_NER] Invoking LLM chain for batch {i // BLOCK_SIZE + 1}...")
-                response = self.chain.invoke(prompt_input)
-                
-                # Debug print the response
-                print(f"[Chunks_NER] Response type: {type(response)}")
-                print(f"[Chunks_NER] Response content: {response}")
-                
-                if not response or not response.root:
-                    print(f"[Chunks_NER WARNING] Empty or invalid response for batch {i // BLOCK_SIZE + 1}")
-                    continue
-                    
-                for chunk_id, entity_list in response.root.items():
-                    if not entity_list:  # Skip empty entity lists
-                        continue
-                    normalized = [e.strip().lower() for e in entity_list if e.strip()]
-                    if normalized:  # Only add if there are valid entities
-                        dump[chunk_id] = normalized
-                        entities.update(normalized)
-                print(f"[Chunks_NER] Entities processed for batch {i // BLOCK_SIZE + 1}.")
-                
-            except Exception as e:
-                print(f"[Chunks_NER ERROR] Error processing batch {i // BLOCK_SIZE + 1}: {str(e)}")
-                # Optionally, log the full traceback here for more detailed debugging
-                # import traceback
-                # traceback.print_exc()
-                continue
-            
-            end = time.time()
-            print(f"[Chunks_NER] Batch {i // BLOCK_SIZE + 1} took {end - start:.2f} seconds")
+            label = f"{i // BLOCK_SIZE + 1}/{len(chunks) // BLOCK_SIZE + 1}"
+            print(f"[Chunks_NER] Processing batch {label} with {len(batch)} texts.")
 
-        if dump:  # Only write if we have entities
-            with open(self.entities_file, "w", encoding="utf-8") as f:
-                json.dump(dump, f, indent=2, ensure_ascii=False)
-            print(f"[Chunks_NER] Saved {len(dump)} chunks with entities to {self.entities_file}")
-        else:
-            print("[Chunks_NER WARNING] No entities were extracted from any chunks. No file written.")
+            found = self.extract_batch(batch, entities, label)
+            dump.update(found)
+            for normalized in found.values():
+                entities.update(normalized)
+
+        self.save_entities(dump)
                 
         print("[Chunks_NER] Entity extraction completed. Total unique entities: {len(entities)}")
-        return list(entities)  # Return the list of unique entities 
\ No newline at end of file
+        return list(entities)  # Return the list of unique entities
@@ -1,196 +1,513 @@
-from neo4j import GraphDatabase
-from config import NEO4J_URI, NEO4J_USERNAME, NEO4J_PASSWORD
+from config import settings
+from db.neo4j_connector import Neo4jConnector, get_neo4j_connector
+from utils.executors import run_in_executor
+from utils.metrics import GRAPH_CHUNKS_WRITTEN
+from utils.tracing import span
 import json
 import logging
+import os
+import re
+import time
 from pathlib import Path
+from typing import Dict, Iterable, List, Optional, Tuple
+
+# Documents and entities are keyed by their owner, so each user's graph can be
+# changed or removed without touching anyone else's
+ADD_DOCUMENT = "MERGE (d:Document {username: $username, doc_id: $doc_id})"
+
+ADD_ENTITY = (
+    "MERGE (e:Entity {username: $username, name: $entity_name}) "
+    "ON CREATE SET e.chunk_ids = [$chunk_id] "
+    "ON MATCH SET e.chunk_ids = CASE "
+    "WHEN NOT $chunk_id IN e.chunk_ids THEN e.chunk_ids + $chunk_id "
+    "ELSE e.chunk_ids END"
+)
+
+ADD_ENTITY_DOC_RELATIONSHIP = (
+    "MATCH (e:Entity {username: $username, name: $entity_name}) "
+    "MATCH (d:Document {username: $username, doc_id: $doc_id}) "
+    "MERGE (e)-[r:MENTIONED_IN]->(d) "
+    "ON CREATE SET r.chunk_ids = [$chunk_id] "
+    "ON MATCH SET r.chunk_ids = CASE "
+    "WHEN NOT $chunk_id IN r.chunk_ids THEN r.chunk_ids + $chunk_id "
+    "ELSE r.chunk_ids END"
+)
+
+ADD_ENTITY_RELATIONSHIP = (
+    "MATCH (e1:Entity {username: $username, name: $entity1_name}) "
+    "MATCH (e2:Entity {username: $username, name: $entity2_name}) "
+    "WHERE e1 <> e2 "
+    "MERGE (e1)-[r:RELATED_TO]-(e2) "
+    "ON CREATE SET r.chunk_ids = [$chunk_id], r.count = 1 "
+    "ON MATCH SET r.chunk_ids = CASE "
+    "WHEN NOT $chunk_id IN r.chunk_ids THEN r.chunk_ids + $chunk_id "
+    "ELSE r.chunk_ids END, "
+    "r.count = r.count + 1"
+)
+
+GRAPH_INDEXES = (
+    "CREATE INDEX entity_username_name IF NOT EXISTS FOR (e:Entity) ON (e.username, e.name)",
+    "CREATE INDEX document_username_doc_id IF NOT EXISTS FOR (d:Document) ON (d.username, d.doc_id)",
+)
+
+# Undo what ADD_ENTITY_RELATIONSHIP added for the removed chunks; pairs that
+# only co-occurred there lose their relationship
+REMOVE_CO_OCCURRENCES = (
+    "UNWIND $items AS pair "
+    "MATCH (e1:Entity {username: $username, name: pair.a})-[r:RELATED_TO]-"
+    "(e2:Entity {username: $username, name: pair.b}) "
+    # Only subtract chunks still listed, so re-running a batch after a failure is a no-op
+    "WITH r, pair, size([c IN pair.chunk_ids WHERE c IN r.chunk_ids]) AS removed "
+    "SET r.chunk_ids = [c IN r.chunk_ids WHERE NOT c IN pair.chunk_ids], "
+    "r.count = r.count - removed "
+    "WITH r WHERE r.count <= 0 OR size(r.chunk_ids) = 0 "
+    "DELETE r"
+)
+
+# Entities no other chunk mentions are removed with their relationships
+REMOVE_MENTIONS = (
+    "UNWIND $items AS mention "
+    "MATCH (e:Entity {username: $username, name: mention.name}) "
+    "SET e.chunk_ids = [c IN e.chunk_ids WHERE NOT c IN mention.chunk_ids] "
+    "WITH e WHERE size(e.chunk_ids) = 0 "
+    "DETACH DELETE e"
+)
+
+REMOVE_DOCUMENTS = (
+    "UNWIND $items AS doc_id "
+    "MATCH (d:Document {username: $username, doc_id: doc_id}) "
+    "DETACH DELETE d"
+)
+
+# Items per transaction when removing a document's contributions
+REMOVAL_BATCH = 1000
+
+# One bounded slice of a user's graph per transaction. Relationships go first,
+# so deleting a node never has to detach (and hold in memory) a large fan-out
+DELETE_RELATIONSHIPS_BATCH = (
+    "MATCH (:Entity {username: $username})-[r]->() "
+    "WITH r LIMIT $batch "
+    "DELETE r "
+    "RETURN count(*) AS deleted"
+)
+DELETE_NODES_BATCH = (
+    "MATCH (n:{label} {{username: $username}}) "
+    "WITH n LIMIT $batch "
+    "DETACH DELETE n "
+    "RETURN count(*) AS deleted"
+)
+GRAPH_LABELS = ("Entity", "Document")
+
+# Graphs built before nodes carried a username merged every user's entities by
+# name, so they can't be attributed to anyone. They are removed once, in the
+# same bounded batches, and a marker node records that it was done.
+LEGACY_MIGRATION = "username_scope"
+LEGACY_MIGRATION_DONE = "MATCH (m:GraphMigration {name: $name}) RETURN count(m) AS done"
+MARK_LEGACY_MIGRATION_DONE = "MERGE (:GraphMigration {name: $name})"
+DELETE_LEGACY_RELATIONSHIPS_BATCH = (
+    "MATCH (n:{label})-[r]-() WHERE n.username IS NULL "
+    "WITH DISTINCT r LIMIT $batch "
+    "DELETE r "
+    "RETURN count(*) AS deleted"
+)
+DELETE_LEGACY_NODES_BATCH = (
+    "MATCH (n:{label}) WHERE n.username IS NULL "
+    "WITH n LIMIT $batch "
+    "DETACH DELETE n "
+    "RETURN count(*) AS deleted"
+)
+
+# Chunk ids are d{doc}p{page}c{n}, zero-padded to at least two digits, so the
+# document part can be longer than two characters
+_CHUNK_ID = re.compile(r"d(\d+)p")
+
+_indexes_ready = False
+
+# username -> (stats file mtime_ns, stats)
+_stats_cache: Dict[str, Tuple[int, dict]] = {}
+
+
+def doc_index(chunk_id: str) -> int:
+    """The document index in a chunk id; raises ValueError for anything else."""
+    match = _CHUNK_ID.match(chunk_id)
+    if match is None:
+        raise ValueError(f"Not a chunk id: {chunk_id}")
+    return int(match.group(1))
+
+
+async def remove_legacy_graph(connector: Optional[Neo4jConnector] = None) -> int:
+    """Delete nodes without a ``username`` left by graphs built before scoping; returns how many.
+
+    Returns 0 straight away once a run has completed.
+    """
+    connector = connector or get_neo4j_connector()
+    done = await connector.execute_read(LEGACY_MIGRATION_DONE, {"name": LEGACY_MIGRATION})
+    if done and done[0]["done"]:
+        return 0
+
+    params = {"batch": settings.graph_delete_batch}
+    deleted = {"nodes": 0, "relationships": 0}
+    with span("graph_legacy_delete"):
+        for kind, query in (("relationships", DELETE_LEGACY_RELATIONSHIPS_BATCH), ("nodes", DELETE_LEGACY_NODES_BATCH)):
+            for label in GRAPH_LABELS:
+                while True:
+                    records = await connector.execute_write(query.format(label=label), params)
+                    count = records[0]["deleted"] if records else 0
+                    if not count:
+                        break
+                    deleted[kind] += count
+    await connector.execute_write(MARK_LEGACY_MIGRATION_DONE, {"name": LEGACY_MIGRATION})
+    if deleted["nodes"] or deleted["relationships"]:
+        logging.info(
+            f"Removed legacy unscoped graph: {deleted['nodes']} nodes, {deleted['relationships']} relationships"
+        )
+    return deleted["nodes"]
+
+
+def graph_stats_path(username: str) -> Path:
+    return Path(f"data/graphs/{username}/stats.json")
+
+
+def read_graph_stats(username: str) -> Optional[dict]:
+    """Node and relationship counts saved by the last graph build, or None.
+
+    Cached per process and re-read only when a build rewrites the file, so
+    status polling never touches Neo4j.
+    """
+    path = graph_stats_path(username)
+    try:
+        mtime = path.stat().st_mtime_ns
+    except FileNotFoundError:
+        _stats_cache.pop(username, None)
+        return None
+    cached = _stats_cache.get(username)
+    if cached and cached[0] == mtime:
+        return cached[1]
+    try:
+        with open(path, 'r', encoding='utf-8') as f:
+            stats = json.load(f)
+    except (OSError, json.JSONDecodeError):
+        return None
+    _stats_cache[username] = (mtime, stats)
+    return stats
 
-URI = NEO4J_URI
-AUTH = (NEO4J_USERNAME, NEO4J_PASSWORD)
 
 class KnowledgeGraph:
-    def __init__(self, username: str, uri=URI, auth=AUTH):
+    def __init__(self, username: str, connector: Optional[Neo4jConnector] = None):
         self.username = username
-        self.driver = GraphDatabase.driver(uri, auth=auth)
-        self.driver.verify_connectivity()
+        # Shared driver pool; nothing to close per instance
+        self.connector = connector or get_neo4j_connector()
         logging.basicConfig(level=logging.INFO)
         self.logger = logging.getLogger(__name__)
-        
+
         # Set up user-specific paths
         self.entities_file = Path(f"data/entities/{username}/entities_{username}.json")
         self.graph_dir = Path(f"data/graphs/{username}")
         self.graph_dir.mkdir(parents=True, exist_ok=True)
+        self.stats_file = graph_stats_path(username)
 
-    def close(self):
-        self.driver.close()
+    async def ensure_indexes(self):
+        """Create the lookup indexes for user-scoped nodes, once per process."""
+        global _indexes_ready
+        if _indexes_ready:
+            return
+        for statement in GRAPH_INDEXES:
+            await self.connector.execute_write(statement)
+        _indexes_ready = True
 
-    def add_document(self, doc_id):
+    async def add_document(self, doc_id):
         try:
-            with self.driver.session() as session:
-                session.run(
-                    "MERGE (d:Document {doc_id: $doc_id})",
-                    doc_id=doc_id
-                )
+            await self.connector.execute_write(ADD_DOCUMENT, {"username": self.username, "doc_id": doc_id})
         except Exception as e:
             self.logger.error(f"Error adding document {doc_id}: {str(e)}")
             raise
 
-    def add_entity(self, entity_name, chunk_id):
+    async def add_entity(self, entity_name, chunk_id):
         try:
-            with self.driver.session() as session:
-                session.run(
-                    "MERGE (e:Entity {name: $entity_name}) "
-                    "ON CREATE SET e.chunk_ids = [$chunk_id] "
-                    "ON MATCH SET e.chunk_ids = CASE "
-                    "WHEN NOT $chunk_id IN e.chunk_ids THEN e.chunk_ids + $chunk_id "
-                    "ELSE e.chunk_ids END",
-                    entity_name=entity_name, chunk_id=chunk_id
-                )
+            await self.connector.execute_write(
+                ADD_ENTITY, {"username": self.username, "entity_name": entity_name, "chunk_id": chunk_id}
+            )
         except Exception as e:
             self.logger.error(f"Error adding entity {entity_name}: {str(e)}")
             raise
 
-    def create_entity_doc_relationship(self, entity_name, doc_id):
+    async def create_entity_doc_relationship(self, entity_name, doc_id):
         try:
-            with self.driver.session() as session:
-                session.run(
-                    "MATCH (e:Entity {name: $entity_name}) "
-                    "MATCH (d:Document {doc_id: $doc_id}) "
-                    "MERGE (e)-[r:MENTIONED_IN]->(d) "
-                    "ON CREATE SET r.chunk_ids = [$chunk_id] "
-                    "ON MATCH SET r.chunk_ids = CASE "
-                    "WHEN NOT $chunk_id IN r.chunk_ids THEN r.chunk_ids + $chunk_id "
-                    "ELSE r.chunk_ids END",
-                    entity_name=entity_name, 
-                    doc_id=doc_id,
-                    chunk_id=str(doc_id)
-                )
+            await self.connector.execute_write(
+                ADD_ENTITY_DOC_RELATIONSHIP,
+                {"username": self.username, "entity_name": entity_name, "doc_id": doc_id, "chunk_id": str(doc_id)}
+            )
         except Exception as e:
             self.logger.error(f"Error creating entity-document relationship for {entity_name} and doc {doc_id}: {str(e)}")
             raise
 
-    def create_entity_relationship(self, entity1_name, entity2_name, chunk_id):
+    async def create_entity_relationship(self, entity1_name, entity2_name, chunk_id):
         try:
-            with self.driver.session() as session:
-                session.run(
-                    "MATCH (e1:Entity {name: $entity1_name}) "
-                    "MATCH (e2:Entity {name: $entity2_name}) "
-                    "WHERE e1 <> e2 "
-                    "MERGE (e1)-[r:RELATED_TO]-(e2) "
-                    "ON CREATE SET r.chunk_ids = [$chunk_id], r.count = 1 "
-                    "ON MATCH SET r.chunk_ids = CASE "
-                    "WHEN NOT $chunk_id IN r.chunk_ids THEN r.chunk_ids + $chunk_id "
-                    "ELSE r.chunk_ids END, "
-                    "r.count = r.count + 1",
-                    entity1_name=entity1_name, 
-                    entity2_name=entity2_name, 
-                    chunk_id=chunk_id
-                )
+            await self.connector.execute_write(
+                ADD_ENTITY_RELATIONSHIP,
+                {
+                    "username": self.username,
+                    "entity1_name": entity1_name,
+                    "entity2_name": entity2_name,
+                    "chunk_id": chunk_id
+                }
+            )
         except Exception as e:
             self.logger.error(f"Error creating entity relationship between {entity1_name} and {entity2_name}: {str(e)}")
             raise
 
-    def get_entity_details(self, entity_name):
-        with self.driver.session() as session:
-            result = session.run(
-                "MATCH (e:Entity {name: $entity_name}) "
-                "RETURN e.name as name, e.chunk_ids as chunk_ids",
-                entity_name=entity_name
-            )
-            return result.single()
-
-    def get_related_entities(self, entity_name):
-        with self.driver.session() as session:
-            result = session.run(
-                "MATCH (e:Entity {name: $entity_name})-[r:RELATED_TO]-(related:Entity) "
-                "RETURN related.name as name, r.count as relationship_count, r.chunk_id as chunk_id",
-                entity_name=entity_name
-            )
-            return list(result)
+    async def get_entity_details(self, entity_name):
+        records = await self.connector.execute_read(
+            "MATCH (e:Entity {username: $username, name: $entity_name}) "
+            "RETURN e.name as name, e.chunk_ids as chunk_ids",
+            {"username": self.username, "entity_name": entity_name}
+        )
+        return records[0] if records else None
 
-    def get_all_entities(self):
-        with self.driver.session() as session:
-            result = session.run(
-                "MATCH (e:Entity) "
-                "RETURN e.name as name, e.chunk_ids as chunk_ids"
+    async def get_related_entities(self, entity_name):
+        return await self.connector.execute_read(
+            "MATCH (e:Entity {username: $username, name: $entity_name})-[r:RELATED_TO]-(related:Entity) "
+            "RETURN related.name as name, r.count as relationship_count, r.chunk_id as chunk_id",
+            {"username": self.username, "entity_name": entity_name}
+        )
+
+    async def get_all_entities(self):
+        return await self.connector.execute_read(
+            "MATCH (e:Entity {username: $username}) "
+            "RETURN e.name as name, e.chunk_ids as chunk_ids",
+            {"username": self.username}
+        )
+
+    async def get_graph_stats(self):
+        """Get the number of nodes and relationships in this user's graph."""
+        params = {"username": self.username}
+        node_count = await self.connector.execute_read(
+            "CALL { MATCH (e:Entity {username: $username}) RETURN count(e) AS c "
+            "UNION ALL MATCH (d:Document {username: $username}) RETURN count(d) AS c } "
+            "RETURN sum(c) as count",
+            params
+        )
+        # Every relationship starts at one of the user's entities
+        relationship_count = await self.connector.execute_read(
+            "MATCH (:Entity {username: $username})-[r]->() RETURN count(r) as count", params
+        )
+
+        return {
+            "node_count": node_count[0]["count"],
+            "relationship_count": relationship_count[0]["count"]
+        }
+
+    def _write_stats_file(self, stats):
+        tmp = self.stats_file.with_suffix(".tmp")
+        with open(tmp, 'w', encoding='utf-8') as f:
+            json.dump(stats, f)
+        os.replace(tmp, self.stats_file)
+
+    async def save_graph_stats(self):
+        """Count the graph once after a build so status polls can read the file instead."""
+        stats = await self.get_graph_stats()
+        stats["updated_at"] = time.time()
+        await run_in_executor("io", self._write_stats_file, stats)
+        return stats
+
+    @staticmethod
+    async def _write_chunk(tx, username, key, doc_id, entities):
+        """Write one chunk's document, entities and co-occurrences in a single transaction."""
+        await tx.run(ADD_DOCUMENT, username=username, doc_id=doc_id)
+
+        for entity in entities:
+            await tx.run(ADD_ENTITY, username=username, entity_name=entity, chunk_id=key)
+            await tx.run(
+                ADD_ENTITY_DOC_RELATIONSHIP,
+                username=username, entity_name=entity, doc_id=doc_id, chunk_id=str(doc_id)
             )
-            return list(result)
-
-    def get_graph_stats(self):
-        """Get the total number of nodes and relationships in the graph."""
-        with self.driver.session() as session:
-            node_count_result = session.run("MATCH (n) RETURN count(n) as count")
-            node_count = node_count_result.single()["count"]
-
-            relationship_count_result = session.run("MATCH ()-[r]->() RETURN count(r) as count")
-            relationship_count = relationship_count_result.single()["count"]
-            
-            return {
-                "node_count": node_count,
-                "relationship_count": relationship_count
-            }
-
-    def create_graph(self):
-        """Create knowledge graph from entities file."""
+
+        # Create relationships between entities in the same chunk
+        for i, entity1 in enumerate(entities):
+            for entity2 in entities[i+1:]:  # Only process each pair once
+                if entity1 != entity2:
+                    await tx.run(
+                        ADD_ENTITY_RELATIONSHIP,
+                        username=username, entity1_name=entity1, entity2_name=entity2, chunk_id=key
+                    )
+
+    def _load_entities(self):
+        with open(self.entities_file, 'r', encoding='utf-8') as f:
+            return json.load(f)
+
+    async def create_graph(self, progress_callback=None):
+        """Create knowledge graph from entities file.
+
+        ``progress_callback(stage, fraction)`` is called once per chunk when given.
+        """
         try:
             # Ensure the graph is empty before creation
-            self.delete_graph()
-            
+            await self.delete_graph(progress_callback)
+
             if not self.entities_file.exists():
                 raise FileNotFoundError(f"Entities file not found at {self.entities_file}")
-                
-            with open(self.entities_file, 'r', encoding='utf-8') as f:
-                data = json.load(f)
-                
-            for key, entities in data.items():
+
+            data = await run_in_executor("io", self._load_entities)
+
+            await self.write_entities(data, progress_callback)
+            await self.save_graph_stats()
+
+        except FileNotFoundError:
+            self.logger.error(f"Entity file not found at {self.entities_file}")
+            raise
+        except json.JSONDecodeError:
+            self.logger.error(f"Invalid JSON format in {self.entities_file}")
+            raise
+        except Exception as e:
+            self.logger.error(f"Error creating knowledge graph: {str(e)}")
+            raise
+
+    async def write_entities(self, data, progress_callback=None):
+        """Write {chunk_key: [entities]} to the graph, one transaction per chunk."""
+        total = len(data)
+        await self.ensure_indexes()
+        with span("graph_write", chunks=total):
+            for n, (key, entities) in enumerate(data.items()):
+                if progress_callback:
+                    progress_callback("Building knowledge graph", n / total)
                 try:
-                    doc_id = int(key[1:3])
-                    # Add document node
-                    self.add_document(doc_id)
+                    doc_id = doc_index(key)
 
                     # Process entities
                     if not isinstance(entities, list):
                         self.logger.warning(f"Expected list of entities for {key}, got {type(entities)}")
+                        await self.add_document(doc_id)
                         continue
-                        
-                    # Add entities and their relationships
+
+                    valid_entities = []
                     for entity in entities:
                         if not isinstance(entity, str):
                             self.logger.warning(f"Invalid entity type in {key}: {type(entity)}")
                             continue
-                            
-                        self.add_entity(entity, key)
-                        self.create_entity_doc_relationship(entity, doc_id)
-                    
-                    # Create relationships between entities in the same chunk
-                    for i, entity1 in enumerate(entities):
-                        for entity2 in entities[i+1:]:  # Only process each pair once
-                            if entity1 != entity2:
-                                self.create_entity_relationship(entity1, entity2, key)
-                                
+                        valid_entities.append(entity)
+
+                    await self.connector.write_transaction(
+                        self._write_chunk, self.username, key, doc_id, valid_entities
+                    )
+                    GRAPH_CHUNKS_WRITTEN.inc()
+
                 except ValueError as ve:
                     self.logger.error(f"Error processing key {key}: {str(ve)}")
                     continue
                 except Exception as e:
                     self.logger.error(f"Unexpected error processing {key}: {str(e)}")
                     continue
-                    
-        except FileNotFoundError:
-            self.logger.error(f"Entity file not found at {self.entities_file}")
-            raise
-        except json.JSONDecodeError:
-            self.logger.error(f"Invalid JSON format in {self.entities_file}")
-            raise
-        except Exception as e:
-            self.logger.error(f"Error creating knowledge graph: {str(e)}")
-            raise
 
-    def delete_graph(self):
-        """Delete all nodes and relationships from the knowledge graph."""
+    @staticmethod
+    async def _remove_batch(tx, query, params):
+        summary = await (await tx.run(query, params)).consume()
+        return summary.counters.nodes_deleted, summary.counters.relationships_deleted
+
+    async def remove_chunks(self, chunk_ids: Iterable[str], entities_by_chunk: Dict[str, List[str]]) -> Dict[str, int]:
+        """Detach what the given chunks contributed to the graph.
+
+        ``entities_by_chunk`` is their entry in the entities file. Only the
+        entities, co-occurrences and documents of those chunks are visited,
+        in transactions of ``REMOVAL_BATCH`` items, so the cost follows the
+        size of the removed document rather than the graph.
+        """
+        mentions: Dict[str, List[str]] = {}
+        pairs: Dict[Tuple[str, str], List[str]] = {}
+        for chunk_id, entities in entities_by_chunk.items():
+            names = [e for e in entities if isinstance(e, str)] if isinstance(entities, list) else []
+            for name in names:
+                mentions.setdefault(name, []).append(chunk_id)
+            # Mirrors _write_chunk, which adds to the count once per pair per chunk
+            for i, entity1 in enumerate(names):
+                for entity2 in names[i+1:]:
+                    if entity1 != entity2:
+                        pairs.setdefault((entity1, entity2), []).append(chunk_id)
+        doc_ids = sorted({doc_index(chunk_id) for chunk_id in chunk_ids})
+
+        await self.ensure_indexes()
+        counts = {"nodes_deleted": 0, "relationships_deleted": 0}
+        steps = (
+            (REMOVE_CO_OCCURRENCES, [{"a": a, "b": b, "chunk_ids": ids} for (a, b), ids in pairs.items()]),
+            (REMOVE_MENTIONS, [{"name": name, "chunk_ids": ids} for name, ids in mentions.items()]),
+            (REMOVE_DOCUMENTS, doc_ids),
+        )
+        with span("graph_remove", entities=len(mentions), pairs=len(pairs), documents=len(doc_ids)):
+            for query, items in steps:
+                for i in range(0, len(items), REMOVAL_BATCH):
+                    nodes, relationships = await self.connector.write_transaction(
+                        self._remove_batch, query,
+                        {"username": self.username, "items": items[i:i + REMOVAL_BATCH]}
+                    )
+                    counts["nodes_deleted"] += nodes
+                    counts["relationships_deleted"] += relationships
+
+        await self._adjust_graph_stats(counts["nodes_deleted"], counts["relationships_deleted"])
+        return counts
+
+    async def _adjust_graph_stats(self, nodes_deleted: int, relationships_deleted: int):
+        """Subtract removed counts from the saved stats instead of recounting the graph."""
+        stats = await run_in_executor("io", read_graph_stats, self.username)
+        if stats is None:
+            return
+        stats = {
+            **stats,
+            "node_count": max(stats.get("node_count", 0) - nodes_deleted, 0),
+            "relationship_count": max(stats.get("relationship_count", 0) - relationships_deleted, 0),
+            "updated_at": time.time()
+        }
+        await run_in_executor("io", self._write_stats_file, stats)
+
+    async def _delete_batches(self, query: str, done: int, total: int, report) -> int:
+        """Run ``query`` until it deletes nothing; returns how many it deleted."""
+        deleted = 0
+        while True:
+            records = await self.connector.execute_write(
+                query, {"username": self.username, "batch": settings.graph_delete_batch}
+            )
+            count = records[0]["deleted"] if records else 0
+            if not count:
+                return deleted
+            deleted += count
+            report("Deleting knowledge graph", min((done + deleted) / total, 1.0) if total else 0.0)
+
+    async def delete_graph(self, progress_callback=None):
+        """Delete this user's nodes and relationships in bounded batches.
+
+        Each batch of ``GRAPH_DELETE_BATCH`` is its own short transaction, so
+        memory stays flat and locks are released between batches however big
+        the graph is. The driver's managed transactions can't run
+        ``CALL { ... } IN TRANSACTIONS``, hence the ``LIMIT`` loops.
+        ``progress_callback(stage, fraction)`` is called after every batch.
+        Nodes of a graph built before nodes carried a username are removed
+        too, unless that was already done.
+        """
+        def report(stage, progress):
+            if progress_callback:
+                progress_callback(stage, progress)
+            else:
+                self.logger.info(f"{stage} for {self.username}: {progress:.0%}")
+
         try:
-            with self.driver.session() as session:
-                # Delete all relationships and nodes
-                session.run("MATCH (n) DETACH DELETE n")
-                self.logger.info("Successfully deleted all nodes and relationships from the knowledge graph")
+            await self.ensure_indexes()
+            stats = await run_in_executor("io", read_graph_stats, self.username)
+            if stats is None:
+                stats = await self.get_graph_stats()
+            total = stats.get("relationship_count", 0) + stats.get("node_count", 0)
+
+            with span("graph_delete", nodes=stats.get("node_count", 0), relationships=stats.get("relationship_count", 0)):
+                relationships = await self._delete_batches(DELETE_RELATIONSHIPS_BATCH, 0, total, report)
+                nodes = 0
+                for label in GRAPH_LABELS:
+                    nodes += await self._delete_batches(
+                        DELETE_NODES_BATCH.format(label=label), relationships + nodes, total, report
+                    )
+                legacy = await remove_legacy_graph(self.connector)
+
+            self.stats_file.unlink(missing_ok=True)
+            self.logger.info(
+                f"Deleted knowledge graph for {self.username}: {nodes} nodes, {relationships} relationships"
+            )
+            return {"nodes_deleted": nodes, "relationships_deleted": relationships, "legacy_nodes_deleted": legacy}
         except Exception as e:
             self.logger.error(f"Error deleting knowledge graph: {str(e)}")
             raise
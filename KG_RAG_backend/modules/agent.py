@@ -1,26 +1,25 @@
-from langchain_openai import ChatOpenAI
 from langchain_core.prompts import ChatPromptTemplate
 from langchain_core.output_parsers import StrOutputParser
-import os
+import asyncio
+import time
+from typing import AsyncIterator, Dict, List, Optional, Tuple
+from db.neo4j_connector import Neo4jConnector
 from modules.tools import SearchTools
+from modules.llm_gateway import get_chat_model
+from utils.executors import run_in_executor
+from utils.metrics import QUERY_STAGE_SECONDS
 from config import (
     NEO4J_URI, NEO4J_USERNAME, NEO4J_PASSWORD,
-    TOGETHER_API_KEY, TOGETHER_API_BASE, LLM_MODEL, LLM_TEMPERATURE
+    LLM_MAX_CONCURRENCY
 )
 
 class SearchAgent:
-    def __init__(self, username: str = None):
+    def __init__(self, username: str = None, connector: Optional[Neo4jConnector] = None):
         # Initialize tools with username
-        self.tools = SearchTools(username=username)
+        self.tools = SearchTools(username=username, connector=connector)
         
-        # Initialize LLM
-        os.environ["TOGETHER_API_KEY"] = TOGETHER_API_KEY
-        self.llm = ChatOpenAI(
-            temperature=LLM_TEMPERATURE,
-            openai_api_key=TOGETHER_API_KEY,
-            openai_api_base=TOGETHER_API_BASE,
-            model_name=LLM_MODEL,
-        )
+        # Initialize LLM (shared connection pool and limits via the gateway)
+        self.llm = get_chat_model(username=username)
         
         # Initialize prompt
         self.prompt = ChatPromptTemplate.from_messages([
@@ -64,43 +63,42 @@ class SearchAgent:
         # Initialize chain
         self.chain = self.prompt | self.llm | StrOutputParser()
 
-    def search(self, query: str, k: int = 3):
+    async def search(self, query: str, k: int = 3, timings: Optional[Dict[str, float]] = None):
         """
         Perform a comprehensive search using both vector and graph search.
 
         Args:
             query: The search query
             k: Number of results to return from each search method
+            timings: If given, filled with seconds spent per stage
+                (embed, faiss, ner, graph, synthesis)
 
         Returns:
             A comprehensive response synthesizing information from both search methods
         """
+        stages = {}
         try:
             # Get results from different search methods
-            vector_results = self.tools.search_similar_chunks(query, k=k)
-            graph_results = self.tools.get_relevant_chunks_from_graph(query, k=k)
-            entities = self.tools.extract_entities(query)
-
-            # Format results for the prompt
-            vector_results_str = "\n".join([
-                f"Chunk {r['metadata']['chunk_id']}: {r['text']} (Score: {r['score']})"
-                for r in vector_results
-            ]) if vector_results else "No vector search results found."
-
-            graph_results_str = "\n".join([
-                f"Chunk {r['chunk_id']}: Entity '{r['entity']}' with related entities: {', '.join(r['related_entities'])}"
-                for r in graph_results
-            ]) if graph_results else "No graph search results found."
+            vector_results = await run_in_executor("embed", self.tools.search_similar_chunks, query, k, stages)
 
-            entities_str = ", ".join(entities) if entities else "No entities extracted."
+            started = time.perf_counter()
+            entities = await self.tools.extract_entities(query)
+            ner_done = time.perf_counter()
+            graph_results = await self.tools.get_relevant_chunks_from_graph(query, k=k, entities=entities)
+            graph_done = time.perf_counter()
 
             # Generate response
-            response = self.chain.invoke({
-                "query": query,
-                "vector_results": vector_results_str,
-                "graph_results": graph_results_str,
-                "entities": entities_str
-            })
+            response = await self.chain.ainvoke(
+                self._prompt_inputs(query, vector_results, graph_results, entities)
+            )
+
+            stages["ner"] = ner_done - started
+            stages["graph"] = graph_done - ner_done
+            stages["synthesis"] = time.perf_counter() - graph_done
+            for stage, seconds in stages.items():
+                QUERY_STAGE_SECONDS.observe(seconds, stage=stage)
+            if timings is not None:
+                timings.update(stages)
 
             return response
 
@@ -108,6 +106,76 @@ class SearchAgent:
             print(f"Error performing search: {str(e)}")
             return "An error occurred while processing your query."
 
-    def close(self):
+    async def search_batch(
+        self,
+        queries: List[str],
+        k: int = 3,
+        max_concurrency: int = LLM_MAX_CONCURRENCY
+    ) -> AsyncIterator[Tuple[int, str]]:
+        """
+        Answer many queries at once, amortizing retrieval across the batch.
+
+        All queries are embedded in one matrix pass and searched with one FAISS
+        call, graph lookups go out as a single UNWIND query, and NER and synthesis
+        LLM calls run concurrently under a shared limit.
+
+        Args:
+            queries: The search queries
+            k: Number of results to return from each search method
+            max_concurrency: Maximum number of LLM calls in flight
+
+        Yields:
+            (index, answer) tuples in order of completion
+        """
+        if not queries:
+            return
+
+        limiter = asyncio.Semaphore(max_concurrency)
+
+        async def limited(coro):
+            async with limiter:
+                return await coro
+
+        vector_results, *entities = await asyncio.gather(
+            run_in_executor("embed", self.tools.search_similar_chunks_batch, queries, k),
+            *(limited(self.tools.extract_entities(q)) for q in queries)
+        )
+        graph_results = await self.tools.get_relevant_chunks_from_graph_batch(entities, k)
+
+        async def answer(i: int) -> Tuple[int, str]:
+            inputs = self._prompt_inputs(queries[i], vector_results[i], graph_results[i], entities[i])
+            try:
+                return i, await limited(self.chain.ainvoke(inputs))
+            except Exception as e:
+                print(f"Error performing search for batch item {i}: {str(e)}")
+                return i, "An error occurred while processing your query."
+
+        for next_done in asyncio.as_completed([answer(i) for i in range(len(queries))]):
+            yield await next_done
+
+    @staticmethod
+    def _prompt_inputs(query: str, vector_results, graph_results, entities) -> dict:
+        """Format retrieval results for the synthesis prompt."""
+        vector_results_str = "\n".join([
+            f"Chunk {r['metadata']['chunk_id']}: {r['text']} (Score: {r['score']})"
+            for r in vector_results
+        ]) if vector_results else "No vector search results found."
+
+        graph_results_str = "\n".join([
+            f"Chunk {r['chunk_id']}: {r.get('text') or ''} "
+            f"(Entity '{r['entity']}' with related entities: {', '.join(r['related_entities'])})"
+            for r in graph_results
+        ]) if graph_results else "No graph search results found."
+
+        entities_str = ", ".join(entities) if entities else "No entities extracted."
+
+        return {
+            "query": query,
+            "vector_results": vector_results_str,
+            "graph_results": graph_results_str,
+            "entities": entities_str
+        }
+
+    async def close(self):
         """Close connections to external services."""
-        self.tools.close() 
\ No newline at end of file
+        await self.tools.close() 
\ No newline at end of file
@@ -0,0 +1,245 @@
+import json
+import sqlite3
+import threading
+from contextlib import contextmanager
+from pathlib import Path
+from typing import Dict, Iterable, Iterator, List, Optional
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS chunks (
+    chunk_id TEXT NOT NULL UNIQUE,
+    doc_id INTEGER,
+    doc TEXT,
+    page INTEGER,
+    text TEXT NOT NULL,
+    deleted INTEGER NOT NULL DEFAULT 0
+);
+CREATE INDEX IF NOT EXISTS ix_chunks_doc ON chunks (doc);
+"""
+
+# Let SQLite serve reads straight from the page cache instead of copying pages into its own buffers
+MMAP_SIZE = 1 << 30
+LOOKUP_BATCH = 500
+
+
+class ChunkStore:
+    """Per-user chunk store backed by an embedded SQLite key-value file.
+
+    Replaces the flat ``chunks_{username}.jsonl`` file: chunks are appended as
+    rows keyed by ``chunk_id``, so single and batch lookups hit the primary key
+    instead of scanning, and iteration streams rows in insertion order. A full
+    re-ingest rewrites the table inside one transaction, so concurrent readers
+    keep seeing the previous chunks until it commits. Removing a document only
+    tombstones its rows; readers skip them and the next rebuild drops them.
+    """
+
+    def __init__(self, path, read_only: bool = False):
+        self.path = Path(path)
+        self.read_only = read_only
+        if not read_only:
+            self.path.parent.mkdir(parents=True, exist_ok=True)
+        self._lock = threading.RLock()
+        self._conn = None
+        self._live = "1"
+
+    @classmethod
+    def for_user(cls, username: str) -> "ChunkStore":
+        store = cls(Path(f"data/chunks/{username}") / f"chunks_{username}.db")
+        store._import_legacy(Path(f"data/chunks/{username}") / f"chunks_{username}.jsonl")
+        return store
+
+    def exists(self) -> bool:
+        return self.path.exists() and len(self) > 0
+
+    @property
+    def conn(self) -> sqlite3.Connection:
+        if self._conn is None:
+            if self.read_only:
+                # Published snapshots never change, so SQLite can skip locking entirely
+                conn = sqlite3.connect(
+                    f"file:{self.path}?mode=ro&immutable=1",
+                    uri=True, check_same_thread=False, isolation_level=None
+                )
+                conn.execute(f"PRAGMA mmap_size={MMAP_SIZE}")
+            else:
+                conn = sqlite3.connect(str(self.path), check_same_thread=False, isolation_level=None)
+                conn.execute("PRAGMA journal_mode=WAL")
+                conn.execute(f"PRAGMA mmap_size={MMAP_SIZE}")
+                conn.executescript(SCHEMA)
+            columns = {row[1] for row in conn.execute("PRAGMA table_info(chunks)")}
+            if "deleted" not in columns and not self.read_only:
+                # Stores created before tombstones existed
+                conn.execute("ALTER TABLE chunks ADD COLUMN deleted INTEGER NOT NULL DEFAULT 0")
+                columns.add("deleted")
+            # Older published snapshots have no tombstone column and no tombstones
+            self._live = "deleted = 0" if "deleted" in columns else "1"
+            self._conn = conn
+        return self._conn
+
+    @property
+    def live(self) -> str:
+        """SQL condition that skips tombstoned rows."""
+        self.conn
+        return self._live
+
+    def _import_legacy(self, jsonl_path: Path):
+        """One-time migration of an existing flat JSONL chunk file."""
+        if self.path.exists() or not jsonl_path.exists():
+            return
+        with open(jsonl_path, "r", encoding="utf-8") as f:
+            self.append(json.loads(line) for line in f if line.strip())
+        print(f"Imported legacy chunks from {jsonl_path} into {self.path}")
+
+    @staticmethod
+    def _rows(chunks: Iterable[Dict]) -> List[tuple]:
+        return [
+            (c["chunk_id"], c.get("doc_id"), c.get("doc"), c.get("page"), c["text"])
+            for c in chunks
+        ]
+
+    def append(self, chunks: Iterable[Dict]) -> int:
+        """Append chunks; a repeated ``chunk_id`` replaces the earlier row."""
+        rows = self._rows(chunks)
+        if not rows:
+            return 0
+        with self._lock:
+            if self.conn.in_transaction:
+                # Inside rebuild(): the rows become visible when the rebuild commits
+                self._insert(rows)
+                return len(rows)
+            self.conn.execute("BEGIN")
+            try:
+                self._insert(rows)
+                self.conn.execute("COMMIT")
+            except Exception:
+                self.conn.execute("ROLLBACK")
+                raise
+        return len(rows)
+
+    def _insert(self, rows: List[tuple]):
+        self.conn.executemany(
+            "INSERT OR REPLACE INTO chunks (chunk_id, doc_id, doc, page, text) VALUES (?, ?, ?, ?, ?)",
+            rows
+        )
+
+    @contextmanager
+    def rebuild(self):
+        """Replace every chunk atomically with the rows appended inside the block."""
+        with self._lock:
+            self.conn.execute("BEGIN IMMEDIATE")
+            try:
+                self.conn.execute("DELETE FROM chunks")
+                yield self
+                self.conn.execute("COMMIT")
+            except Exception:
+                self.conn.execute("ROLLBACK")
+                raise
+
+    def doc_chunk_ids(self, doc: str) -> List[str]:
+        """Ids of every chunk of document ``doc``, including tombstoned ones."""
+        if not self.path.exists():
+            return []
+        with self._lock:
+            return [row[0] for row in self.conn.execute(
+                "SELECT chunk_id FROM chunks WHERE doc = ? ORDER BY rowid", (doc,)
+            )]
+
+    def tombstone_doc(self, doc: str) -> List[str]:
+        """Mark every live chunk of document ``doc`` as deleted; returns their ids."""
+        if not self.path.exists():
+            return []
+        with self._lock:
+            self.conn.execute("BEGIN IMMEDIATE")
+            try:
+                chunk_ids = [row[0] for row in self.conn.execute(
+                    "SELECT chunk_id FROM chunks WHERE doc = ? AND deleted = 0 ORDER BY rowid", (doc,)
+                )]
+                self.conn.execute("UPDATE chunks SET deleted = 1 WHERE doc = ? AND deleted = 0", (doc,))
+                self.conn.execute("COMMIT")
+            except Exception:
+                self.conn.execute("ROLLBACK")
+                raise
+        return chunk_ids
+
+    def next_doc_index(self) -> int:
+        """Index for a document added after the current ones; removed documents' ids are not reused."""
+        if not self.path.exists():
+            return 0
+        # doc_id is the 0-based document index plus one
+        return self.conn.execute("SELECT COALESCE(MAX(doc_id), 0) FROM chunks").fetchone()[0]
+
+    @staticmethod
+    def _to_chunk(row) -> Dict:
+        chunk_id, doc_id, doc, page, text = row
+        return {"chunk_id": chunk_id, "doc_id": doc_id, "doc": doc, "page": page, "text": text}
+
+    def get(self, chunk_id: str) -> Optional[Dict]:
+        row = self.conn.execute(
+            f"SELECT chunk_id, doc_id, doc, page, text FROM chunks WHERE chunk_id = ? AND {self.live}",
+            (chunk_id,)
+        ).fetchone()
+        return self._to_chunk(row) if row else None
+
+    def get_many(self, chunk_ids: Iterable[str]) -> Dict[str, Dict]:
+        """Look up many chunks at once; missing IDs are simply absent from the result."""
+        ids = list(dict.fromkeys(cid for cid in chunk_ids if cid))
+        found = {}
+        for i in range(0, len(ids), LOOKUP_BATCH):
+            batch = ids[i:i + LOOKUP_BATCH]
+            placeholders = ",".join("?" * len(batch))
+            for row in self.conn.execute(
+                f"SELECT chunk_id, doc_id, doc, page, text FROM chunks "
+                f"WHERE chunk_id IN ({placeholders}) AND {self.live}",
+                batch
+            ):
+                found[row[0]] = self._to_chunk(row)
+        return found
+
+    def iter_chunks(self) -> Iterator[Dict]:
+        """Stream chunks in insertion order without materialising them all."""
+        cursor = self.conn.execute(
+            f"SELECT chunk_id, doc_id, doc, page, text FROM chunks WHERE {self.live} ORDER BY rowid"
+        )
+        for row in cursor:
+            yield self._to_chunk(row)
+
+    def iter_batches(self, size: int) -> Iterator[List[Dict]]:
+        batch = []
+        for chunk in self.iter_chunks():
+            batch.append(chunk)
+            if len(batch) >= size:
+                yield batch
+                batch = []
+        if batch:
+            yield batch
+
+    def snapshot(self, dest: Path):
+        """Copy a consistent point-in-time image of the store to ``dest``."""
+        target = sqlite3.connect(str(dest))
+        try:
+            self.conn.backup(target)
+            target.execute("PRAGMA journal_mode=DELETE")
+        finally:
+            target.close()
+
+    def delete(self):
+        """Remove the store and its WAL side files."""
+        self.close()
+        for suffix in ("", "-wal", "-shm"):
+            Path(f"{self.path}{suffix}").unlink(missing_ok=True)
+
+    def __len__(self) -> int:
+        if not self.path.exists():
+            return 0
+        return self.conn.execute(f"SELECT count(*) FROM chunks WHERE {self.live}").fetchone()[0]
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def close(self):
+        if self._conn is not None:
+            self._conn.close()
+            self._conn = None
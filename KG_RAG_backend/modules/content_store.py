@@ -0,0 +1,195 @@
+"""Content-addressed store shared by all users.
+
+Uploaded PDFs are stored once under ``data/cas/<hh>/<sha256>/document.pdf``;
+a user's copy in ``data/pdfs/{username}`` is a hard link to that blob. Next
+to each blob, the parsed and chunked pages are kept per chunking setting.
+Embeddings and NER results are keyed by a hash of the chunk text and the
+model that produced them, in one SQLite file, so any document containing a
+chunk already seen (the same paper uploaded by another user, or a re-ingest)
+skips the parser, the embedding model and the LLM for it.
+"""
+import hashlib
+import json
+import os
+import shutil
+import sqlite3
+import threading
+import uuid
+from pathlib import Path
+from typing import Dict, Iterable, List, Optional, Tuple
+
+import numpy as np
+
+from config import settings
+from utils.executors import run_in_executor
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS embeddings (key TEXT PRIMARY KEY, vector BLOB NOT NULL);
+CREATE TABLE IF NOT EXISTS entities (key TEXT PRIMARY KEY, entities TEXT NOT NULL);
+"""
+
+LOOKUP_BATCH = 500
+
+
+def hash_file(path) -> str:
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(settings.upload_chunk_size), b""):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+def artifact_key(model: str, text: str) -> str:
+    return hashlib.sha256(f"{model}\0{text}".encode("utf-8")).hexdigest()
+
+
+class ContentStore:
+    def __init__(self, root=settings.cas_dir):
+        self.root = Path(root)
+        self._lock = threading.RLock()
+        self._conn = None
+
+    def blob_dir(self, content_hash: str) -> Path:
+        return self.root / content_hash[:2] / content_hash
+
+    def pdf_path(self, content_hash: str) -> Path:
+        return self.blob_dir(content_hash) / "document.pdf"
+
+    # PDFs
+
+    async def save_upload(self, upload) -> Tuple[str, int, bool]:
+        """Stream an ``UploadFile`` into the store in fixed-size chunks, hashing as it goes.
+
+        Returns ``(sha256, size, already_stored)``. Memory use is one chunk,
+        whatever the file size.
+        """
+        tmp_dir = self.root / "tmp"
+        tmp_dir.mkdir(parents=True, exist_ok=True)
+        tmp_path = tmp_dir / uuid.uuid4().hex
+        digest = hashlib.sha256()
+        size = 0
+        f = await run_in_executor("io", open, tmp_path, "wb")
+        try:
+            while True:
+                block = await upload.read(settings.upload_chunk_size)
+                if not block:
+                    break
+                size += len(block)
+                await run_in_executor("io", self._write_block, f, digest, block)
+            await run_in_executor("io", f.close)
+            content_hash = digest.hexdigest()
+            stored = await run_in_executor("io", self._commit_blob, tmp_path, content_hash)
+            return content_hash, size, not stored
+        finally:
+            f.close()
+            tmp_path.unlink(missing_ok=True)
+
+    @staticmethod
+    def _write_block(f, digest, block: bytes):
+        digest.update(block)
+        f.write(block)
+
+    def _commit_blob(self, tmp_path: Path, content_hash: str) -> bool:
+        """Move a finished upload into place; False if the blob already existed."""
+        dest = self.pdf_path(content_hash)
+        if dest.exists():
+            return False
+        dest.parent.mkdir(parents=True, exist_ok=True)
+        os.replace(tmp_path, dest)
+        return True
+
+    def link(self, content_hash: str, dest: Path):
+        """Give a user a copy of a stored PDF: a hard link, or a plain copy across filesystems.
+
+        A file already at ``dest`` is replaced; callers make sure no File row points at it.
+        """
+        dest = Path(dest)
+        dest.parent.mkdir(parents=True, exist_ok=True)
+        dest.unlink(missing_ok=True)
+        try:
+            os.link(self.pdf_path(content_hash), dest)
+        except OSError:
+            shutil.copyfile(self.pdf_path(content_hash), dest)
+
+    # Parsed and chunked pages, per document
+
+    def _pages_path(self, content_hash: str, chunk_size: int, chunk_overlap: int) -> Path:
+        return self.blob_dir(content_hash) / f"chunks_{chunk_size}_{chunk_overlap}.json"
+
+    def load_pages(self, content_hash: str, chunk_size: int, chunk_overlap: int):
+        """``split_pdf``'s result for this document and chunking, or None."""
+        try:
+            with open(self._pages_path(content_hash, chunk_size, chunk_overlap), "r", encoding="utf-8") as f:
+                data = json.load(f)
+        except (OSError, json.JSONDecodeError):
+            return None
+        return data["page_count"], [(page, texts) for page, texts in data["pages"]]
+
+    def save_pages(self, content_hash: str, chunk_size: int, chunk_overlap: int, page_count: int, pages):
+        path = self._pages_path(content_hash, chunk_size, chunk_overlap)
+        path.parent.mkdir(parents=True, exist_ok=True)
+        tmp = path.with_suffix(f".{uuid.uuid4().hex}.tmp")
+        with open(tmp, "w", encoding="utf-8") as f:
+            json.dump({"page_count": page_count, "pages": pages}, f, ensure_ascii=False)
+        os.replace(tmp, path)
+
+    # Embeddings and NER results, per chunk text
+
+    @property
+    def conn(self) -> sqlite3.Connection:
+        if self._conn is None:
+            self.root.mkdir(parents=True, exist_ok=True)
+            conn = sqlite3.connect(str(self.root / "artifacts.db"), check_same_thread=False, isolation_level=None)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.executescript(SCHEMA)
+            self._conn = conn
+        return self._conn
+
+    def _get_many(self, table: str, column: str, keys: List[str]) -> Dict[str, object]:
+        found = {}
+        with self._lock:
+            for i in range(0, len(keys), LOOKUP_BATCH):
+                batch = keys[i:i + LOOKUP_BATCH]
+                placeholders = ",".join("?" * len(batch))
+                found.update(self.conn.execute(
+                    f"SELECT key, {column} FROM {table} WHERE key IN ({placeholders})", batch
+                ).fetchall())
+        return found
+
+    def _put_many(self, table: str, column: str, rows: Iterable[tuple]):
+        rows = list(rows)
+        if not rows:
+            return
+        with self._lock:
+            self.conn.execute("BEGIN")
+            try:
+                self.conn.executemany(f"INSERT OR REPLACE INTO {table} (key, {column}) VALUES (?, ?)", rows)
+                self.conn.execute("COMMIT")
+            except Exception:
+                self.conn.execute("ROLLBACK")
+                raise
+
+    def get_embeddings(self, texts: List[str]) -> List[Optional[np.ndarray]]:
+        keys = [artifact_key(settings.emb_model, text) for text in texts]
+        found = self._get_many("embeddings", "vector", keys)
+        return [np.frombuffer(found[key], dtype="float32") if key in found else None for key in keys]
+
+    def put_embeddings(self, texts: List[str], vectors):
+        self._put_many("embeddings", "vector", (
+            (artifact_key(settings.emb_model, text), np.asarray(vector, dtype="float32").tobytes())
+            for text, vector in zip(texts, vectors)
+        ))
+
+    def get_entities(self, texts: List[str]) -> List[Optional[List[str]]]:
+        keys = [artifact_key(settings.llm_model, text) for text in texts]
+        found = self._get_many("entities", "entities", keys)
+        return [json.loads(found[key]) if key in found else None for key in keys]
+
+    def put_entities(self, texts: List[str], entity_lists: List[List[str]]):
+        self._put_many("entities", "entities", (
+            (artifact_key(settings.llm_model, text), json.dumps(entities, ensure_ascii=False))
+            for text, entities in zip(texts, entity_lists)
+        ))
+
+
+content_store = ContentStore()
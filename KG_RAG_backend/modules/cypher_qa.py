@@ -0,0 +1,279 @@
+"""Structured (text-to-Cypher) questions over a user's knowledge graph.
+
+Ordinary chat never touches this module. The first structured question of a
+process builds one shared ``Neo4jGraph`` with schema introspection switched
+off; each user's chain then gets its schema text from a snapshot in
+``data/graphs/{username}/schema.json``. The snapshot is versioned by the
+``updated_at`` of the graph stats written at build time, so it is
+re-introspected only after the graph has been rebuilt.
+
+All users share one database, so both introspection and generated queries
+are confined to the asking user's nodes: every node pattern, including
+repeated variables, must carry ``{username: $username}``, and ``$username`` is always bound to the user the
+question is answered for. Queries that don't are rejected before they run.
+"""
+import json
+import os
+import re
+import threading
+from contextvars import ContextVar
+from pathlib import Path
+from typing import Any, Dict, Optional
+
+from config import settings
+from db.cypher_log import normalize
+from db.neo4j_connector import Neo4jConnector, get_neo4j_connector
+from modules.KnowledgeGraph import read_graph_stats
+from modules.llm_gateway import get_chat_model
+from utils.cache import TTLCache
+from utils.executors import run_in_executor
+
+# Bumped when the snapshot layout or its scope changes, so older snapshots are redone
+SNAPSHOT_FORMAT = 2
+
+# Sampled from the user's own nodes like apoc.meta.data, so the cost doesn't grow
+# with the graph; db.schema.* procedures would describe every user's data
+NODE_PROPERTIES = (
+    "MATCH (n {username: $username}) WITH n LIMIT $sample "
+    "UNWIND keys(n) AS key "
+    "WITH labels(n) AS labels, key, collect(n[key])[0] AS value "
+    "RETURN labels, key, value"
+)
+RELATIONSHIP_PROPERTIES = (
+    "MATCH ({username: $username})-[r]->({username: $username}) WITH r LIMIT $sample "
+    "UNWIND keys(r) AS key "
+    "WITH type(r) AS type, key, collect(r[key])[0] AS value "
+    "RETURN type, key, value"
+)
+RELATIONSHIP_PATTERNS = (
+    "MATCH (a {username: $username})-[r]->(b {username: $username}) WITH a, r, b LIMIT $sample "
+    "RETURN DISTINCT labels(a) AS start, type(r) AS type, labels(b) AS end"
+)
+
+CYPHER_GENERATION_TEMPLATE = """Task: Generate a Cypher statement to query a graph database.
+Instructions:
+Use only the provided relationship types and properties in the schema.
+Do not use any other relationship types or properties that are not provided.
+Every node pattern must include the property map {{username: $username}}, for example
+MATCH (e:Entity {{username: $username}})-[:RELATED_TO]-(o:Entity {{username: $username}}).
+Do not use any parameter other than $username.
+Schema:
+{schema}
+Note: Do not include any explanations or apologies in your responses.
+Do not respond to any questions that might ask anything else than for you to construct a Cypher statement.
+Do not include any text except the generated Cypher statement.
+
+The question is:
+{question}"""
+
+# Generated Cypher must only read; literals are stripped before matching
+_WRITE_CLAUSE = re.compile(r"\b(CREATE|MERGE|DELETE|SET|REMOVE|DROP|FOREACH|LOAD\s+CSV|CALL)\b", re.IGNORECASE)
+# A node pattern: optional variable, labels and property map, not preceded by a function name
+_NODE_PATTERN = re.compile(
+    r"(?<![\w$`])\(\s*([A-Za-z_]\w*)?\s*((?::\s*`?\w+`?\s*)*)(\{[^{}]*\})?\s*\)"
+)
+_SCOPED_MAP = re.compile(r"[{,]\s*username\s*:\s*\$username\s*[,}]")
+# Where a node pattern may open: after MATCH, a relationship arrow, a comma, `=` or `(`
+_NODE_POSITION = re.compile(r"(?:\bMATCH|[-<>,=(])\s*(?=\()", re.IGNORECASE)
+# A parenthesis shaped like a node: empty, or labels, a map, a label expression or WHERE inside
+_NODE_SHAPE = re.compile(
+    r"(?<![\w$`])\((?=\s*(?:[):{`]|[A-Za-z_]\w*\s*(?:[):{|&!%]|WHERE\b)))", re.IGNORECASE
+)
+
+# The user a structured question is being answered for, read by ReadOnlyGraph.query
+_tenant: ContextVar[Optional[str]] = ContextVar("cypher_qa_tenant", default=None)
+
+_chains = TTLCache("cypher_chain", settings.cypher_qa_cache_size, settings.cypher_qa_cache_ttl)
+_graph = None
+_graph_lock = threading.Lock()
+
+
+def schema_path(username: str) -> Path:
+    return Path(f"data/graphs/{username}/schema.json")
+
+
+def _type_name(value: Any) -> str:
+    if isinstance(value, bool):
+        return "BOOLEAN"
+    if isinstance(value, int):
+        return "INTEGER"
+    if isinstance(value, float):
+        return "FLOAT"
+    if isinstance(value, str):
+        return "STRING"
+    if isinstance(value, (list, tuple)):
+        return "LIST"
+    return type(value).__name__.upper()
+
+
+def check_tenancy(query: str):
+    """Raise ValueError unless every node ``query`` matches is scoped to ``$username``.
+
+    Every node pattern must bind ``username: $username`` in its property map,
+    even one naming a variable bound earlier, since WITH, UNION and RETURN can
+    drop that binding. A parenthesis placed or shaped like a node that doesn't
+    parse as such a pattern is rejected rather than skipped.
+    """
+    text = normalize(query)
+    scoped = set()
+    for match in _NODE_PATTERN.finditer(text):
+        props = match.group(3)
+        if props is None or not _SCOPED_MAP.search(props):
+            raise ValueError(f"Structured questions must scope every node to $username: {match.group(0)}")
+        scoped.add(match.start())
+    if not scoped:
+        raise ValueError("Structured questions must match the user's nodes")
+    starts = {m.end() for m in _NODE_POSITION.finditer(text)} | {m.start() for m in _NODE_SHAPE.finditer(text)}
+    unparsed = sorted(starts - scoped)
+    if unparsed:
+        start = unparsed[0]
+        raise ValueError(f"Structured questions must use plain node patterns: {text[start:start + 60]}")
+
+
+def format_schema(snapshot: Dict[str, Any]) -> str:
+    """Render a snapshot in the text layout ``Neo4jGraph.get_schema`` produces."""
+    def props(items):
+        return "{" + ", ".join(f"{name}: {kind}" for name, kind in items) + "}"
+
+    lines = ["Node properties:"]
+    lines += [f"{label} {props(items)}" for label, items in snapshot["node_props"].items()]
+    lines.append("Relationship properties:")
+    lines += [f"{rel_type} {props(items)}" for rel_type, items in snapshot["rel_props"].items()]
+    lines.append("The relationships:")
+    lines += [f"(:{r['start']})-[:{r['type']}]->(:{r['end']})" for r in snapshot["relationships"]]
+    return "\n".join(lines)
+
+
+async def _introspect(connector: Neo4jConnector, username: str) -> Dict[str, Any]:
+    params = {"username": username, "sample": settings.cypher_qa_schema_sample}
+    node_props: Dict[str, list] = {}
+    for row in await connector.execute_read(NODE_PROPERTIES, params):
+        for label in row["labels"]:
+            props = node_props.setdefault(label, [])
+            if row["key"] not in (name for name, _ in props):
+                props.append([row["key"], _type_name(row["value"])])
+
+    rel_props: Dict[str, list] = {}
+    for row in await connector.execute_read(RELATIONSHIP_PROPERTIES, params):
+        rel_props.setdefault(row["type"], []).append([row["key"], _type_name(row["value"])])
+
+    relationships = []
+    rows = await connector.execute_read(RELATIONSHIP_PATTERNS, params)
+    for row in rows:
+        for start in row["start"]:
+            for end in row["end"]:
+                relationships.append({"start": start, "type": row["type"], "end": end})
+    return {"node_props": node_props, "rel_props": rel_props, "relationships": relationships}
+
+
+def _read_snapshot(path: Path) -> Optional[Dict[str, Any]]:
+    try:
+        with open(path, 'r', encoding='utf-8') as f:
+            return json.load(f)
+    except (OSError, json.JSONDecodeError):
+        return None
+
+
+def _write_snapshot(path: Path, snapshot: Dict[str, Any]):
+    tmp = path.with_suffix(".tmp")
+    with open(tmp, 'w', encoding='utf-8') as f:
+        json.dump(snapshot, f)
+    os.replace(tmp, path)
+
+
+async def schema_snapshot(username: str, connector: Optional[Neo4jConnector] = None) -> Dict[str, Any]:
+    """The user's graph schema, introspected again only after a rebuild.
+
+    Raises FileNotFoundError when the user has no built graph.
+    """
+    stats = await run_in_executor("io", read_graph_stats, username)
+    if stats is None:
+        raise FileNotFoundError("Knowledge graph has not been built yet")
+    version = stats.get("updated_at")
+
+    path = schema_path(username)
+    snapshot = await run_in_executor("io", _read_snapshot, path)
+    if snapshot is not None and snapshot.get("version") == version and snapshot.get("format") == SNAPSHOT_FORMAT:
+        return snapshot
+
+    snapshot = await _introspect(connector or get_neo4j_connector(), username)
+    snapshot["version"] = version
+    snapshot["format"] = SNAPSHOT_FORMAT
+    await run_in_executor("io", _write_snapshot, path, snapshot)
+    return snapshot
+
+
+def _shared_graph():
+    """One read-only ``Neo4jGraph`` per process, created on first use."""
+    global _graph
+    with _graph_lock:
+        if _graph is None:
+            from langchain_neo4j import Neo4jGraph
+
+            class ReadOnlyGraph(Neo4jGraph):
+                def query(self, query, params=None, *args, **kwargs):
+                    username = _tenant.get()
+                    if username is None:
+                        raise ValueError("Structured questions must be asked for a user")
+                    if _WRITE_CLAUSE.search(normalize(query)):
+                        raise ValueError("Structured questions can only run read queries")
+                    check_tenancy(query)
+                    return super().query(query, {**(params or {}), "username": username}, *args, **kwargs)
+
+            # The chain is given each user's schema snapshot, so skip introspection here
+            _graph = ReadOnlyGraph(
+                url=settings.neo4j_uri,
+                username=settings.neo4j_username,
+                password=settings.neo4j_password,
+                timeout=settings.cypher_qa_timeout,
+                refresh_schema=False
+            )
+        return _graph
+
+
+def _build_chain(username: str, schema_text: str):
+    from langchain_core.prompts import PromptTemplate
+    from langchain_neo4j import GraphCypherQAChain
+
+    chain = GraphCypherQAChain.from_llm(
+        llm=get_chat_model(username=username),
+        graph=_shared_graph(),
+        cypher_prompt=PromptTemplate(input_variables=["schema", "question"], template=CYPHER_GENERATION_TEMPLATE),
+        top_k=settings.cypher_qa_top_k,
+        return_intermediate_steps=True,
+        # Writes and queries reaching other users' nodes are rejected by ReadOnlyGraph.query
+        allow_dangerous_requests=True
+    )
+    chain.graph_schema = schema_text
+    return chain
+
+
+async def ask(username: str, question: str, connector: Optional[Neo4jConnector] = None) -> Dict[str, Any]:
+    """Answer ``question`` by generating and running Cypher; returns the answer and the query."""
+    snapshot = await schema_snapshot(username, connector)
+    key = (username, snapshot["version"])
+    chain = _chains.get(key)
+    if chain is None:
+        chain = await run_in_executor("io", _build_chain, username, format_schema(snapshot))
+        _chains.set(key, chain)
+
+    # run_in_executor copies the context, so the chain's graph queries see the user
+    token = _tenant.set(username)
+    try:
+        result = await run_in_executor("io", chain.invoke, {"query": question})
+    finally:
+        _tenant.reset(token)
+    steps = result.get("intermediate_steps") or []
+    return {
+        "answer": result["result"],
+        "cypher": steps[0].get("query") if steps else None
+    }
+
+
+def close_graph():
+    global _graph
+    with _graph_lock:
+        graph, _graph = _graph, None
+    if graph is not None:
+        graph.close()
+    _chains.clear()
@@ -1,11 +1,62 @@
-import json
+import asyncio
+import time
+from functools import lru_cache
 from pathlib import Path
+from typing import List, Tuple
+import numpy as np
 from langchain.text_splitter import RecursiveCharacterTextSplitter
 from langchain_community.document_loaders import PyPDFLoader
 from langchain_community.vectorstores import FAISS
 from langchain_huggingface import HuggingFaceEmbeddings
-from langchain_core.documents import Document
-from config import CHUNK_SIZE, CHUNK_OVERLAP
+from config import CHUNK_SIZE, CHUNK_OVERLAP, EMB_MODEL, SHARED_INDEX_SERVING
+from modules.chunk_store import ChunkStore
+from modules.content_store import content_store, hash_file
+from utils.executors import run_in_executor
+from utils.metrics import CHUNKS_CREATED, CHUNKS_EMBEDDED, EMBEDDING_SECONDS, PDF_PAGES_PARSED
+from utils.tracing import span
+
+@lru_cache(maxsize=1)
+def get_embeddings():
+    """Load the embedding model once per process and share it between requests."""
+    return HuggingFaceEmbeddings(
+        model_name=EMB_MODEL,
+        model_kwargs={'device': 'cpu'},
+        encode_kwargs={'normalize_embeddings': True}
+    )
+
+@lru_cache(maxsize=4)
+def _get_chunker(chunk_size: int, chunk_overlap: int):
+    return RecursiveCharacterTextSplitter(
+        separators=["\n\n", "\n", ".", ",", " "],
+        chunk_size=chunk_size,
+        chunk_overlap=chunk_overlap,
+        length_function=len
+    )
+
+def split_pdf(pdf_path: str, chunk_size: int, chunk_overlap: int) -> Tuple[int, List[Tuple[int, List[str]]]]:
+    """Parse one PDF and chunk its pages, stopping at the references section.
+
+    Runs in the CPU process pool, so it only takes and returns plain data.
+    Returns the page count and a list of (page number, chunk texts).
+    """
+    chunker = _get_chunker(chunk_size, chunk_overlap)
+    docs = PyPDFLoader(pdf_path, mode="page").load()
+
+    pages = []
+    pg = 0
+    for doc in docs:
+        pg += 1
+        text = doc.page_content.strip()
+
+        if not text:
+            continue
+
+        lines = text.lower().splitlines()
+        if any(l.startswith(("reference", "references", "bibliography", "acknowledgements")) for l in lines):
+            break
+
+        pages.append((pg, [chunk.strip() for chunk in chunker.split_text(text)]))
+    return len(docs), pages
 
 class PDFLoader:
     def __init__(self, 
@@ -24,21 +75,11 @@ class PDFLoader:
         self.vector_store_dir = Path(f"data/vector_stores/{username}")
         self.chunks_dir.mkdir(parents=True, exist_ok=True)
         self.vector_store_dir.mkdir(parents=True, exist_ok=True)
-        self.output_file = self.chunks_dir / f"chunks_{username}.jsonl"
+        self.chunk_store = ChunkStore.for_user(username)
         self.vector_store_path = self.vector_store_dir / "vector_store"
             
-        self.embeddings = HuggingFaceEmbeddings(
-            model_name="sentence-transformers/all-MiniLM-L6-v2",
-            model_kwargs={'device': 'cpu'},
-            encode_kwargs={'normalize_embeddings': True}
-        )
-
-        self.chunker = RecursiveCharacterTextSplitter(
-            separators=["\n\n", "\n", ".", ",", " "],
-            chunk_size=self.chunk_size,
-            chunk_overlap=self.chunk_overlap,
-            length_function=len
-        )
+        self.embeddings = get_embeddings()
+        self.chunker = _get_chunker(self.chunk_size, self.chunk_overlap)
 
     def load_index(self):
         """Load a FAISS index from disk."""
@@ -58,8 +99,12 @@ class PDFLoader:
             print(f"Error loading vector store: {str(e)}")
             return False
 
-    async def load_pdfs(self):
-        """Load PDFs, create chunks, and build vector store."""
+    async def load_pdfs(self, progress_callback=None):
+        """Load PDFs, create chunks, and build vector store.
+
+        ``progress_callback(stage, fraction)`` is called between stages when given.
+        """
+        report = progress_callback or (lambda stage, progress: None)
         pdf_files = list(self.pdf_dir.glob("*.pdf"))
         if not pdf_files:
             print(f"No PDF files found in {self.pdf_dir}")
@@ -67,82 +112,228 @@ class PDFLoader:
             
         all_chunks = []
         print(f"Processing {len(pdf_files)} PDF files...")
+        report("Parsing PDFs", 0.0)
+
+        # Parse and chunk every PDF in parallel in the CPU process pool
+        parsed = await asyncio.gather(*(self._split(pdf_path) for pdf_path in pdf_files))
+
+        for doc_id, (pdf_path, (pg, pages)) in enumerate(zip(pdf_files, parsed)):
+            all_chunks.extend(self._build_chunks(doc_id, pdf_path, pg, pages))
+
+        await self.index_chunks(all_chunks, report)
 
-        with open(self.output_file, "w", encoding="utf-8") as out:
-            for doc_id, pdf_path in enumerate(pdf_files):
-                print(f"\nProcessing {pdf_path.name}...")
-                loader = PyPDFLoader(str(pdf_path), mode="page")
-                docs = await loader.aload()
-
-                pg = 0
-                total_chunks = 0
-                skip = False
-
-                for doc in docs:
-                    pg += 1
-                    text = doc.page_content.strip()
-
-                    if not text or skip:
-                        continue
-
-                    lines = text.lower().splitlines()
-                    for l in lines:
-                        if l.startswith("reference") or l.startswith("references") or l.startswith("bibliography") or l.startswith("acknowledgements"):
-                            skip = True
-                            break
-
-                    if skip:
-                        continue
-
-                    chunks = self.chunker.split_text(text)
-                    for i, chunk in enumerate(chunks):
-                        data = {
-                            "chunk_id": f"d{doc_id:02}p{pg:04}c{i+1:02}",
-                            "doc_id": doc_id+1,
-                            "doc": pdf_path.name,
-                            "page": pg,
-                            "text": chunk.strip()
-                        }
-                        total_chunks += 1
-                        json.dump(data, out, ensure_ascii=False)
-                        out.write("\n")
-                        all_chunks.append(data)
-                        
-                print(f"Document: {doc_id+1}\nPages: {pg}\nChunks: {total_chunks}")
-
-        print(f"\nSaving {len(all_chunks)} chunks to {self.output_file}")
+    async def add_pdfs(self, pdf_paths, progress_callback=None):
+        """Chunk and index only ``pdf_paths``, after the documents already indexed.
+
+        The new chunks are appended to the chunk store and their vectors added
+        to the saved index; nothing already indexed is parsed or embedded
+        again. Returns the new chunk dicts.
+        """
+        report = progress_callback or (lambda stage, progress: None)
+        report("Parsing PDFs", 0.0)
+        first = await run_in_executor("io", self.chunk_store.next_doc_index)
+        parsed = await asyncio.gather(*(self._split(pdf_path) for pdf_path in pdf_paths))
+
+        new_chunks = []
+        for offset, (pdf_path, (pg, pages)) in enumerate(zip(pdf_paths, parsed)):
+            new_chunks.extend(self._build_chunks(first + offset, pdf_path, pg, pages))
+        if not new_chunks:
+            return new_chunks
+
+        report("Saving chunks", 0.3)
+        with span("save_chunks", chunks=len(new_chunks)):
+            await run_in_executor("io", self.chunk_store.append, new_chunks)
+
+        report("Embedding chunks", 0.4)
+        texts = [chunk['text'] for chunk in new_chunks]
+        metadatas = [{
+            'chunk_id': chunk['chunk_id'],
+            'doc_id': chunk['doc_id'],
+            'doc': chunk['doc'],
+            'page': chunk['page']
+        } for chunk in new_chunks]
+        ids = [chunk['chunk_id'] for chunk in new_chunks]
+        started = time.perf_counter()
+        with span("embed", chunks=len(texts)):
+            vectors = await self._embed(texts)
+            if self.vector_store is None and not await run_in_executor("io", self.load_index):
+                self.vector_store = await run_in_executor(
+                    "embed", FAISS.from_embeddings, list(zip(texts, vectors)), self.embeddings, metadatas, ids
+                )
+            else:
+                await run_in_executor(
+                    "embed", self.vector_store.add_embeddings, list(zip(texts, vectors)), metadatas, ids
+                )
+        EMBEDDING_SECONDS.observe(time.perf_counter() - started)
+        report("Saving vector store", 0.9)
+        with span("save_vector_store"):
+            await run_in_executor("io", self._save_vector_store)
+        return new_chunks
+
+    async def iter_pdf_chunks(self):
+        """Yield each PDF's chunk dicts as soon as that PDF has been parsed.
+
+        Chunk ids match ``load_pdfs``; documents arrive in completion order.
+        """
+        pdf_files = list(self.pdf_dir.glob("*.pdf"))
+        if not pdf_files:
+            print(f"No PDF files found in {self.pdf_dir}")
+            return
+
+        print(f"Processing {len(pdf_files)} PDF files...")
+
+        async def parse(doc_id, pdf_path):
+            pg, pages = await self._split(pdf_path)
+            return self._build_chunks(doc_id, pdf_path, pg, pages)
+
+        tasks = [asyncio.create_task(parse(doc_id, pdf_path)) for doc_id, pdf_path in enumerate(pdf_files)]
+        try:
+            for next_done in asyncio.as_completed(tasks):
+                yield await next_done
+        finally:
+            for task in tasks:
+                task.cancel()
+
+    async def _split(self, pdf_path):
+        """Parse and chunk one PDF in the CPU process pool, unless the content store has it."""
+        with span("parse", pdf=pdf_path.name):
+            content_hash = await run_in_executor("io", hash_file, pdf_path)
+            cached = await run_in_executor(
+                "io", content_store.load_pages, content_hash, self.chunk_size, self.chunk_overlap
+            )
+            if cached is not None:
+                return cached
+            pg, pages = await run_in_executor("cpu", split_pdf, str(pdf_path), self.chunk_size, self.chunk_overlap)
+            await run_in_executor(
+                "io", content_store.save_pages, content_hash, self.chunk_size, self.chunk_overlap, pg, pages
+            )
+            return pg, pages
+
+    @staticmethod
+    def _build_chunks(doc_id, pdf_path, pg, pages):
+        chunks = []
+        with span("chunk", pdf=pdf_path.name, pages=pg):
+            for page, texts in pages:
+                for i, chunk in enumerate(texts):
+                    chunks.append({
+                        "chunk_id": f"d{doc_id:02}p{page:04}c{i+1:02}",
+                        "doc_id": doc_id+1,
+                        "doc": pdf_path.name,
+                        "page": page,
+                        "text": chunk
+                    })
+        PDF_PAGES_PARSED.inc(pg)
+        CHUNKS_CREATED.inc(len(chunks))
+        print(f"Document: {doc_id+1} ({pdf_path.name})\nPages: {pg}\nChunks: {len(chunks)}")
+        return chunks
+
+    async def index_chunks(self, all_chunks, progress_callback=None):
+        """Replace the user's chunk store with ``all_chunks`` and build the vector store."""
+        report = progress_callback or (lambda stage, progress: None)
+        report("Saving chunks", 0.3)
+        with span("save_chunks", chunks=len(all_chunks)):
+            await run_in_executor("io", self._write_chunks, all_chunks)
+        print(f"\nSaved {len(all_chunks)} chunks to {self.chunk_store.path}")
 
         # Create vector store
         if all_chunks:
             try:
                 print("\nCreating vector store...")
-                # Create documents for FAISS
-                documents = []
-                for chunk in all_chunks:
-                    documents.append(Document(
-                        page_content=chunk['text'],
-                        metadata={
-                            'chunk_id': chunk['chunk_id'],
-                            'doc_id': chunk['doc_id'],
-                            'doc': chunk['doc'],
-                            'page': chunk['page']
-                        }
-                    ))
+                texts = [chunk['text'] for chunk in all_chunks]
+                metadatas = [{
+                    'chunk_id': chunk['chunk_id'],
+                    'doc_id': chunk['doc_id'],
+                    'doc': chunk['doc'],
+                    'page': chunk['page']
+                } for chunk in all_chunks]
 
                 # Create and save FAISS vector store
-                self.vector_store = FAISS.from_documents(
-                    documents,
-                    self.embeddings
-                )
-                
-                # Save vector store
-                self.vector_store.save_local(str(self.vector_store_path))
-                print(f"Vector store saved to {self.vector_store_path}")
+                report("Embedding chunks", 0.4)
+                started = time.perf_counter()
+                with span("embed", chunks=len(texts)):
+                    vectors = await self._embed(texts)
+                    self.vector_store = await run_in_executor(
+                        "embed", FAISS.from_embeddings, list(zip(texts, vectors)), self.embeddings, metadatas,
+                        # Keyed by chunk id, so a document's vectors can be deleted by id
+                        [chunk['chunk_id'] for chunk in all_chunks]
+                    )
+                EMBEDDING_SECONDS.observe(time.perf_counter() - started)
+                report("Saving vector store", 0.9)
+                with span("save_vector_store"):
+                    await run_in_executor("io", self._save_vector_store)
 
             except Exception as e:
                 print(f"Error creating vector store: {str(e)}")
                 raise
 
+    async def _embed(self, texts):
+        """Embed ``texts``, computing only those the content store has no vector for."""
+        vectors = await run_in_executor("io", content_store.get_embeddings, texts)
+        missing = [i for i, vector in enumerate(vectors) if vector is None]
+        if missing:
+            new = await run_in_executor(
+                "embed", self.embeddings.embed_documents, [texts[i] for i in missing]
+            )
+            await run_in_executor("io", content_store.put_embeddings, [texts[i] for i in missing], new)
+            for i, vector in zip(missing, new):
+                vectors[i] = vector
+            CHUNKS_EMBEDDED.inc(len(missing))
+        print(f"Embedded {len(missing)} chunks, reused {len(texts) - len(missing)} from the content store")
+        return vectors
+
+    def remove_chunks(self, chunk_ids) -> int:
+        """Delete the vectors of ``chunk_ids`` from the saved index and save it again."""
+        if not chunk_ids or not self.load_index():
+            return 0
+        stored = set(self.vector_store.index_to_docstore_id.values())
+        ids = [chunk_id for chunk_id in chunk_ids if chunk_id in stored]
+        if len(ids) < len(chunk_ids):
+            # Indexes built before vectors were keyed by chunk id
+            wanted = set(chunk_ids)
+            ids = [
+                doc_id for doc_id in stored
+                if self.vector_store.docstore.search(doc_id).metadata.get('chunk_id') in wanted
+            ]
+        if ids:
+            self.vector_store.delete(ids)
+            self._save_vector_store()
+        return len(ids)
+
+    def _write_chunks(self, chunks):
+        with self.chunk_store.rebuild():
+            self.chunk_store.append(chunks)
+
+    def _save_vector_store(self):
+        self.vector_store.save_local(str(self.vector_store_path))
+        print(f"Vector store saved to {self.vector_store_path}")
+
+        if SHARED_INDEX_SERVING:
+            from modules.index_store import IndexPublisher
+            IndexPublisher(self.username).publish(self.vector_store, self.chunk_store)
+
+    def search_similar_by_vectors(self, vectors, k: int = 4):
+        """Search many already-embedded queries with a single FAISS call."""
+        if not self.vector_store:
+            if not self.load_index():
+                raise ValueError("Vector store not initialized. Please load PDFs first.")
+
+        scores, positions = self.vector_store.index.search(np.asarray(vectors, dtype="float32"), k)
+        results = []
+        for row_scores, row_positions in zip(scores, positions):
+            hits = []
+            for score, position in zip(row_scores, row_positions):
+                if position < 0:
+                    continue
+                doc_id = self.vector_store.index_to_docstore_id[int(position)]
+                doc = self.vector_store.docstore.search(doc_id)
+                hits.append({
+                    'text': doc.page_content,
+                    'metadata': doc.metadata,
+                    'score': float(score)
+                })
+            results.append(hits)
+        return results
+
     def search_similar(self, query: str, k: int = 4):
         """Search for similar chunks using the vector store."""
         if not self.vector_store:
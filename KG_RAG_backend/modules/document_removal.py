@@ -0,0 +1,82 @@
+"""Remove one document from a user's chunks, vectors, entities and graph.
+
+Deleting a file used to leave everything derived from it in place until the
+next full re-ingest and graph build. ``remove_document`` undoes only that
+document's contributions: its vectors are deleted by chunk id, its mentions
+and co-occurrences detached in Neo4j, its entries dropped from the entities
+file and, last, its chunks tombstoned. Every step can run again, so a job
+that failed part way through is retried until the document is gone.
+"""
+import json
+import os
+from pathlib import Path
+from typing import Dict, List, Optional
+
+from db.neo4j_connector import Neo4jConnector
+from modules.chunk_store import ChunkStore
+from modules.KnowledgeGraph import KnowledgeGraph
+from utils.executors import run_in_executor
+from utils.tracing import span
+
+
+def _remove_vectors(username: str, chunk_ids: List[str]) -> int:
+    # Imported here so the upload router doesn't load FAISS and the embedding stack
+    from modules.data_loader import PDFLoader
+
+    return PDFLoader(pdf_dir=f"data/pdfs/{username}", username=username).remove_chunks(chunk_ids)
+
+
+def _read_entities(entities_file: Path, chunk_ids: List[str]) -> Dict[str, list]:
+    """The chunks' entries in the entities file."""
+    if not entities_file.exists():
+        return {}
+    with open(entities_file, 'r', encoding='utf-8') as f:
+        data = json.load(f)
+    return {chunk_id: data[chunk_id] for chunk_id in chunk_ids if chunk_id in data}
+
+
+def _drop_entities(entities_file: Path, chunk_ids: List[str]) -> int:
+    """Remove the chunks from the entities file; returns how many entries were removed."""
+    if not entities_file.exists():
+        return 0
+    with open(entities_file, 'r', encoding='utf-8') as f:
+        data = json.load(f)
+    removed = [data.pop(chunk_id) for chunk_id in chunk_ids if chunk_id in data]
+    if removed:
+        tmp = entities_file.with_suffix(".tmp")
+        with open(tmp, 'w', encoding='utf-8') as f:
+            json.dump(data, f, indent=2, ensure_ascii=False)
+        os.replace(tmp, entities_file)
+    return len(removed)
+
+
+async def remove_document(username: str, doc: str, connector: Optional[Neo4jConnector] = None) -> Dict[str, int]:
+    """Remove everything derived from the user's PDF named ``doc``.
+
+    Returns how many chunks, vectors, entity entries, graph nodes and graph
+    relationships were removed. A document that was never ingested has no
+    chunks, and nothing else is touched. Safe to call again after a failure.
+    """
+    removed = {"chunks": 0, "vectors": 0, "entity_chunks": 0, "nodes_deleted": 0, "relationships_deleted": 0}
+    chunk_store = ChunkStore.for_user(username)
+    try:
+        # Tombstoned chunks too: an earlier attempt may have stopped after tombstoning
+        chunk_ids = await run_in_executor("io", chunk_store.doc_chunk_ids, doc)
+        if not chunk_ids:
+            return removed
+
+        with span("remove_document", doc=doc, chunks=len(chunk_ids)):
+            removed["vectors"] = await run_in_executor("io", _remove_vectors, username, chunk_ids)
+
+            # The entries are dropped only after the graph no longer needs them
+            kg = KnowledgeGraph(username, connector)
+            entities = await run_in_executor("io", _read_entities, kg.entities_file, chunk_ids)
+            removed.update(await kg.remove_chunks(chunk_ids, entities))
+            removed["entity_chunks"] = await run_in_executor("io", _drop_entities, kg.entities_file, chunk_ids)
+
+            removed["chunks"] = len(await run_in_executor("io", chunk_store.tombstone_doc, doc))
+    finally:
+        chunk_store.close()
+
+    print(f"Removed document {doc} for user {username}: {removed}")
+    return removed
@@ -0,0 +1,51 @@
+"""One-time cleanup of graphs built before nodes were keyed by username.
+
+Those graphs merged every user's entities by name, so no user can be given
+their part back and the user-scoped queries never see them. At startup the
+unscoped nodes are deleted, and users left without a graph have their files
+moved back to ``entities_extracted``, so the status asks for a graph build
+instead of reporting an empty graph as ready.
+"""
+import logging
+from typing import List, Optional, Tuple
+
+from db import models
+from db.database import SessionLocal
+from db.neo4j_connector import Neo4jConnector, get_neo4j_connector
+from modules.jobs import update_file_status
+from modules.KnowledgeGraph import graph_stats_path, remove_legacy_graph
+from utils.executors import run_in_executor
+
+GRAPH_STATUSES = ["graph_built", "graph_updated"]
+
+HAS_SCOPED_GRAPH = "MATCH (e:Entity {username: $username}) RETURN e.name AS name LIMIT 1"
+
+
+def _users_with_graphs() -> List[Tuple[int, str]]:
+    db = SessionLocal()
+    try:
+        rows = (
+            db.query(models.User.id, models.User.username)
+            .join(models.File, models.File.user_id == models.User.id)
+            .filter(models.File.status.in_(GRAPH_STATUSES))
+            .distinct()
+            .all()
+        )
+        return [(row.id, row.username) for row in rows]
+    finally:
+        db.close()
+
+
+async def migrate_legacy_graph(connector: Optional[Neo4jConnector] = None):
+    connector = connector or get_neo4j_connector()
+    try:
+        if not await remove_legacy_graph(connector):
+            return
+        for user_id, username in await run_in_executor("io", _users_with_graphs):
+            if await connector.execute_read(HAS_SCOPED_GRAPH, {"username": username}):
+                continue
+            await run_in_executor("io", update_file_status, user_id, GRAPH_STATUSES, "entities_extracted")
+            await run_in_executor("io", graph_stats_path(username).unlink, True)
+            logging.info(f"User {username} had only a legacy graph; it must be built again")
+    except Exception as e:
+        logging.error(f"Legacy graph migration failed: {e}")
@@ -0,0 +1,177 @@
+"""Query history: buffered writes off the chat response path, keyset pages and streaming export."""
+import asyncio
+import base64
+import csv
+import io
+import json
+import logging
+from datetime import datetime
+from typing import AsyncIterator, List, Optional, Tuple
+
+from sqlalchemy import insert, select, tuple_
+
+from config import settings
+from db import models
+from db.database import AsyncSessionLocal
+
+EXPORT_COLUMNS = ("id", "timestamp", "query", "answer")
+
+
+def encode_cursor(timestamp: datetime, row_id: int) -> str:
+    return base64.urlsafe_b64encode(f"{timestamp.isoformat()}|{row_id}".encode()).decode()
+
+
+def decode_cursor(cursor: str) -> Tuple[datetime, int]:
+    """Raises ValueError for a cursor this module did not produce."""
+    try:
+        timestamp, row_id = base64.urlsafe_b64decode(cursor.encode()).decode().split("|")
+        return datetime.fromisoformat(timestamp), int(row_id)
+    except Exception as e:
+        raise ValueError(f"Invalid cursor: {cursor}") from e
+
+
+def merge_pending(rows: List[models.QueryHistory], pending: List[models.QueryHistory],
+                  cursor: Optional[str] = None) -> List[models.QueryHistory]:
+    """Add buffered rows that belong on a page to the rows read from the database.
+
+    Buffered rows have no id yet; once written they get ids above every
+    stored row, so they sort as if their id were infinite. A row written
+    between taking ``pending`` and reading ``rows`` appears once.
+    """
+    if cursor:
+        before = decode_cursor(cursor)[0]
+        pending = [row for row in pending if row.timestamp < before]
+    stored = {(row.timestamp, row.query) for row in rows}
+    merged = list(rows) + [row for row in pending if (row.timestamp, row.query) not in stored]
+    merged.sort(key=lambda row: (row.timestamp, float("inf") if row.id is None else row.id), reverse=True)
+    return merged
+
+
+def history_page_query(user_id: int, limit: int, cursor: Optional[str] = None):
+    """Newest first; the next page starts strictly after ``cursor``'s (timestamp, id).
+
+    Served by the (user_id, timestamp, id) index without an offset scan, so
+    deep pages cost the same as the first.
+    """
+    query = select(models.QueryHistory).where(models.QueryHistory.user_id == user_id)
+    if cursor:
+        timestamp, row_id = decode_cursor(cursor)
+        query = query.where(
+            tuple_(models.QueryHistory.timestamp, models.QueryHistory.id) < tuple_(timestamp, row_id)
+        )
+    return query.order_by(
+        models.QueryHistory.timestamp.desc(), models.QueryHistory.id.desc()
+    ).limit(limit)
+
+
+async def export_history(user_id: int, fmt: str) -> AsyncIterator[str]:
+    """Stream a user's whole history as NDJSON or CSV in constant memory.
+
+    Rows come through a server-side cursor as plain tuples, so neither the
+    driver nor a session identity map holds more than one partition. The
+    generator owns its session because it outlives the request's dependencies.
+    """
+    columns = [getattr(models.QueryHistory, name) for name in EXPORT_COLUMNS]
+    query = select(*columns).where(
+        models.QueryHistory.user_id == user_id
+    ).order_by(models.QueryHistory.timestamp, models.QueryHistory.id)
+
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    if fmt == "csv":
+        writer.writerow(EXPORT_COLUMNS)
+
+    async with AsyncSessionLocal() as db:
+        result = await db.stream(query.execution_options(yield_per=settings.history_export_batch))
+        async for rows in result.partitions():
+            for row in rows:
+                record = dict(zip(EXPORT_COLUMNS, row))
+                record["timestamp"] = record["timestamp"].isoformat() if record["timestamp"] else None
+                if fmt == "csv":
+                    writer.writerow(record[name] for name in EXPORT_COLUMNS)
+                else:
+                    buffer.write(json.dumps(record, ensure_ascii=False) + "\n")
+            yield buffer.getvalue()
+            buffer.seek(0)
+            buffer.truncate()
+    if buffer.tell():
+        yield buffer.getvalue()
+
+
+class HistoryWriter:
+    """Buffers chat history rows and writes them with one multi-row INSERT.
+
+    ``add`` never touches the database, so answering a question no longer
+    waits on a commit. Rows are stamped when added, which keeps their order.
+    A failed flush puts its rows back so the next one retries them; past
+    ``history_buffer_limit`` buffered rows the oldest are dropped.
+    """
+
+    def __init__(self, interval: float = settings.history_flush_interval):
+        self.interval = interval
+        self._rows: List[dict] = []
+        self._writing: List[dict] = []
+        self._task = None
+        self._lock = asyncio.Lock()
+
+    def add(self, user_id: int, query: str, answer: str):
+        self._rows.append({
+            "user_id": user_id,
+            "query": query,
+            "answer": answer,
+            "timestamp": datetime.now()
+        })
+        overflow = len(self._rows) - settings.history_buffer_limit
+        if overflow > 0:
+            del self._rows[:overflow]
+            logging.warning(f"History buffer full, dropped {overflow} rows")
+
+    def pending(self, user_id: int) -> List[models.QueryHistory]:
+        """The user's rows not yet committed, including a batch being written, newest first."""
+        return [
+            models.QueryHistory(**row)
+            for row in reversed(self._writing + self._rows) if row["user_id"] == user_id
+        ]
+
+    async def flush(self) -> int:
+        async with self._lock:
+            if not self._rows:
+                return 0
+            batch, self._rows = self._rows, []
+            self._writing = batch
+            try:
+                async with AsyncSessionLocal() as db:
+                    await db.execute(insert(models.QueryHistory), batch)
+                    await db.commit()
+                return len(batch)
+            except BaseException as e:
+                # Also on cancellation, so stop() can still write them
+                self._rows[:0] = batch
+                if not isinstance(e, Exception):
+                    raise
+                logging.error(f"Failed to write {len(batch)} history rows: {e}")
+                return 0
+            finally:
+                self._writing = []
+
+    async def _run(self):
+        while True:
+            await asyncio.sleep(self.interval)
+            await self.flush()
+
+    def start(self):
+        if self._task is None:
+            self._task = asyncio.create_task(self._run())
+
+    async def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+        await self.flush()
+
+
+history_writer = HistoryWriter()
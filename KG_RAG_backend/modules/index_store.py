@@ -0,0 +1,212 @@
+import json
+import mmap
+import os
+import shutil
+import threading
+import time
+from pathlib import Path
+from typing import Dict, List, Optional
+
+import faiss
+import numpy as np
+
+from config import PUBLISHED_INDEX_DIR, PUBLISHED_VERSIONS_KEPT
+from modules.chunk_store import ChunkStore
+from utils.metrics import CACHE_REQUESTS
+
+# Flat indexes are only mapped (instead of copied into the heap) with IO_FLAG_MMAP_IFC,
+# which newer faiss builds provide; older builds fall back to the generic mmap flag.
+_MMAP_FLAGS = faiss.IO_FLAG_READ_ONLY | getattr(faiss, "IO_FLAG_MMAP_IFC", faiss.IO_FLAG_MMAP)
+
+CURRENT_POINTER = "CURRENT"
+
+# A replaced handle stays open this long for searches that already hold it
+RETIRED_HANDLE_GRACE = 60.0
+
+
+class IndexPublisher:
+    """Publishes a user's vector store as an immutable, versioned snapshot.
+
+    Each version directory holds the raw FAISS index, the chunk metadata in FAISS
+    row order, an offsets table into that metadata and a snapshot of the chunk
+    store for lookups by ``chunk_id``. The ``CURRENT`` pointer is swapped with an
+    atomic rename once the snapshot is complete, so readers never observe a
+    half-written version.
+    """
+
+    def __init__(self, username: str, root: Path = PUBLISHED_INDEX_DIR):
+        self.username = username
+        self.user_dir = Path(root) / username
+        self.user_dir.mkdir(parents=True, exist_ok=True)
+
+    def publish(self, vector_store, chunk_store: Optional[ChunkStore] = None) -> str:
+        """Write a new version from a langchain FAISS store and make it current."""
+        version = f"v{time.time_ns()}"
+        staging_dir = self.user_dir / f".{version}.tmp"
+        staging_dir.mkdir(parents=True)
+
+        try:
+            faiss.write_index(vector_store.index, str(staging_dir / "index.faiss"))
+
+            ntotal = vector_store.index.ntotal
+            offsets = np.zeros((ntotal, 2), dtype=np.int64)
+            with open(staging_dir / "meta.jsonl", "wb") as out:
+                for position in range(ntotal):
+                    doc = vector_store.docstore.search(vector_store.index_to_docstore_id[position])
+                    line = json.dumps(
+                        {"text": doc.page_content, "metadata": doc.metadata},
+                        ensure_ascii=False
+                    ).encode("utf-8") + b"\n"
+                    offsets[position] = (out.tell(), len(line))
+                    out.write(line)
+                out.flush()
+                os.fsync(out.fileno())
+            np.save(staging_dir / "offsets.npy", offsets)
+            if chunk_store is not None:
+                chunk_store.snapshot(staging_dir / "chunks.db")
+
+            os.replace(staging_dir, self.user_dir / version)
+        except Exception:
+            shutil.rmtree(staging_dir, ignore_errors=True)
+            raise
+
+        pointer_tmp = self.user_dir / f".{CURRENT_POINTER}.{os.getpid()}"
+        pointer_tmp.write_text(version, encoding="utf-8")
+        os.replace(pointer_tmp, self.user_dir / CURRENT_POINTER)
+        print(f"Published vector index {version} for user {self.username}")
+
+        self._prune(keep=version)
+        return version
+
+    def _prune(self, keep: str):
+        """Remove old versions; workers that still map them keep valid mappings until they switch."""
+        versions = sorted(
+            p for p in self.user_dir.iterdir()
+            if p.is_dir() and p.name.startswith("v")
+        )
+        # At least the version just published is always kept
+        for old in versions[:len(versions) - max(PUBLISHED_VERSIONS_KEPT, 1)]:
+            if old.name != keep:
+                shutil.rmtree(old, ignore_errors=True)
+
+
+class PublishedIndex:
+    """Read-only, memory-mapped view of one published version."""
+
+    def __init__(self, version_dir: Path):
+        self.version = version_dir.name
+        self.index = faiss.read_index(str(version_dir / "index.faiss"), _MMAP_FLAGS)
+        self.offsets = np.load(version_dir / "offsets.npy", mmap_mode="r")
+        self._meta_file = open(version_dir / "meta.jsonl", "rb")
+        size = os.fstat(self._meta_file.fileno()).st_size
+        self._meta = mmap.mmap(self._meta_file.fileno(), 0, access=mmap.ACCESS_READ) if size else b""
+        chunks_path = version_dir / "chunks.db"
+        self.chunks = ChunkStore(chunks_path, read_only=True) if chunks_path.exists() else None
+
+    def record(self, position: int) -> Dict:
+        offset, length = self.offsets[position]
+        return json.loads(self._meta[offset:offset + length])
+
+    def search(self, vectors, k: int = 4) -> List[List[Dict]]:
+        """Search one or more query vectors; returns one hit list per query row."""
+        queries = np.asarray(vectors, dtype="float32")
+        if queries.ndim == 1:
+            queries = queries.reshape(1, -1)
+        scores, positions = self.index.search(queries, k)
+
+        results = []
+        for row_scores, row_positions in zip(scores, positions):
+            hits = []
+            for score, position in zip(row_scores, row_positions):
+                if position < 0:
+                    continue
+                hit = self.record(int(position))
+                hit["score"] = float(score)
+                hits.append(hit)
+            results.append(hits)
+        return results
+
+    def close(self):
+        if self.chunks is not None:
+            self.chunks.close()
+        if isinstance(self._meta, mmap.mmap):
+            self._meta.close()
+        self._meta_file.close()
+
+
+class SharedIndexRegistry:
+    """Per-process registry of published indexes.
+
+    Every worker maps the same immutable files, so the page cache holds a single
+    copy of each user's index. A cheap ``stat`` of the ``CURRENT`` pointer tells a
+    worker when ingestion has published a newer version, and the handle is
+    swapped in place; searches already running keep the old handle, which is
+    closed on a later lookup once ``RETIRED_HANDLE_GRACE`` seconds have passed.
+    """
+
+    def __init__(self, root: Path = PUBLISHED_INDEX_DIR):
+        self.root = Path(root)
+        self._lock = threading.Lock()
+        self._handles: Dict[str, PublishedIndex] = {}
+        self._pointers: Dict[str, tuple] = {}
+        # (retired at, handle) for replaced versions, closed once the grace period is over
+        self._retired: List[tuple] = []
+
+    def current_version(self, username: str) -> Optional[str]:
+        pointer = self.root / username / CURRENT_POINTER
+        try:
+            stat = os.stat(pointer)
+        except FileNotFoundError:
+            return None
+
+        key = (stat.st_ino, stat.st_mtime_ns)
+        cached = self._pointers.get(username)
+        if cached and cached[0] == key:
+            return cached[1]
+
+        version = pointer.read_text(encoding="utf-8").strip()
+        self._pointers[username] = (key, version)
+        return version
+
+    def get(self, username: str) -> Optional[PublishedIndex]:
+        version = self.current_version(username)
+        if version is None:
+            return None
+
+        if self._retired and time.monotonic() - self._retired[0][0] >= RETIRED_HANDLE_GRACE:
+            with self._lock:
+                self._close_retired()
+
+        handle = self._handles.get(username)
+        if handle is not None and handle.version == version:
+            CACHE_REQUESTS.inc(cache="published_index", result="hit")
+            return handle
+
+        with self._lock:
+            handle = self._handles.get(username)
+            if handle is None or handle.version != version:
+                CACHE_REQUESTS.inc(cache="published_index", result="miss")
+                previous = self._handles.get(username)
+                handle = PublishedIndex(self.root / username / version)
+                self._handles[username] = handle
+                if previous is not None:
+                    self._retired.append((time.monotonic(), previous))
+                self._close_retired()
+                print(f"Switched user {username} to published index {version}")
+            else:
+                CACHE_REQUESTS.inc(cache="published_index", result="hit")
+        return handle
+
+    def _close_retired(self, grace: float = RETIRED_HANDLE_GRACE):
+        """Close replaced handles no search can still be using. Called with the lock held."""
+        now = time.monotonic()
+        keep = []
+        for retired_at, handle in self._retired:
+            if now - retired_at >= grace:
+                handle.close()
+            else:
+                keep.append((retired_at, handle))
+        self._retired = keep
+
+
+shared_indexes = SharedIndexRegistry()
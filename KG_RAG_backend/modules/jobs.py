@@ -0,0 +1,601 @@
+import asyncio
+import logging
+import os
+import socket
+import uuid
+from datetime import datetime, timedelta
+from pathlib import Path
+from typing import Callable, Dict, List, Optional, Tuple
+
+from sqlalchemy import func, select
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.orm import aliased
+
+from config import settings
+from db import models
+from db.database import SessionLocal
+from utils.cache import TTLCache
+from utils.executors import run_in_executor
+from utils.tracing import trace
+
+ACTIVE_STATUSES = ("queued", "running")
+
+# Namespaces for two-key Postgres advisory locks, keyed by user id
+ENQUEUE_LOCK = 7301
+CLAIM_LOCK = 7302
+UPLOAD_LOCK = 7303
+
+# How far each file status has come; new documents are taken as far as the rest
+FILE_STAGES = {"processed": 1, "entities_extracted": 2, "graph_built": 3, "graph_updated": 3}
+STAGE_STATUSES = {1: "processed", 2: "entities_extracted", 3: "graph_built"}
+
+
+# Built KG status responses by user id. This process drops a user's entry whenever
+# it changes their jobs or files; changes made by other processes show up once the
+# entry expires, which is after ``kg_status_active_ttl`` while a job is active
+status_cache = TTLCache("kg_status", settings.kg_status_cache_size, settings.kg_status_cache_ttl)
+
+
+def invalidate_status(user_id: int):
+    status_cache.pop(user_id)
+
+
+class JobCancelled(Exception):
+    """Raised inside a job handler once cancellation of its job has been requested."""
+
+
+class JobContext:
+    """What a running handler knows about its job.
+
+    ``report`` only records progress in memory, so it is cheap enough to call
+    from hot loops in any thread; the worker's heartbeat persists it and picks
+    up cancellation requests.
+    """
+
+    def __init__(self, job_id: int, kind: str, user_id: int, username: str, payload: dict,
+                 attempts: int, max_attempts: int):
+        self.job_id = job_id
+        self.kind = kind
+        self.user_id = user_id
+        self.username = username
+        self.payload = payload
+        self.attempts = attempts
+        self.max_attempts = max_attempts
+        self.stage: Optional[str] = None
+        self.progress = 0.0
+        self.cancelled = False
+
+    def report(self, stage: str, progress: float):
+        if self.cancelled:
+            raise JobCancelled(f"Job {self.job_id} was cancelled")
+        self.stage = stage
+        self.progress = max(0.0, min(1.0, progress))
+
+
+JOB_HANDLERS: Dict[str, Callable] = {}
+
+
+def job_handler(kind: str):
+    def register(fn):
+        JOB_HANDLERS[kind] = fn
+        return fn
+    return register
+
+
+async def enqueue(db: AsyncSession, user: models.User, kind: str, payload: dict = None,
+                  attach_running: bool = True) -> models.Job:
+    """Queue a pipeline job for ``user``; any worker process can pick it up.
+
+    If the user already has an identical job waiting (or running, unless
+    ``attach_running`` is False) that job is returned instead, so duplicate
+    requests share one run and one result.
+    """
+    if kind not in JOB_HANDLERS:
+        raise ValueError(f"Unknown job kind: {kind}")
+
+    # Serialize enqueues per user so two concurrent requests can't both miss each other
+    await db.execute(select(func.pg_advisory_xact_lock(ENQUEUE_LOCK, user.id)))
+
+    attachable = ("queued", "running") if attach_running else ("queued",)
+    result = await db.execute(
+        select(models.Job).where(
+            models.Job.user_id == user.id,
+            models.Job.kind == kind,
+            models.Job.status.in_(attachable),
+            models.Job.cancel_requested.is_(False)
+        ).order_by(models.Job.id.desc()).limit(1)
+    )
+    existing = result.scalars().first()
+    if existing:
+        await db.commit()
+        logging.info(f"Attached {kind} request for user {user.username} to job {existing.id}")
+        return existing
+
+    job = models.Job(
+        user_id=user.id,
+        kind=kind,
+        status="queued",
+        payload=payload or {},
+        max_attempts=settings.job_max_attempts
+    )
+    db.add(job)
+    await db.commit()
+    await db.refresh(job)
+    invalidate_status(user.id)
+    logging.info(f"Queued {kind} job {job.id} for user {user.username}")
+    return job
+
+
+async def request_cancel(db: AsyncSession, job: models.Job) -> models.Job:
+    """Cancel a queued job immediately, or flag a running one for its handler to stop."""
+    if job.status == "queued":
+        job.status = "cancelled"
+        job.finished_at = datetime.now()
+    elif job.status == "running":
+        job.cancel_requested = True
+    await db.commit()
+    await db.refresh(job)
+    invalidate_status(job.user_id)
+    return job
+
+
+def pending_file_ids(user_id: int, statuses: List[str]) -> List[int]:
+    db = SessionLocal()
+    try:
+        rows = db.query(models.File.id).filter(
+            models.File.user_id == user_id,
+            models.File.status.in_(statuses)
+        ).all()
+        return [row.id for row in rows]
+    finally:
+        db.close()
+
+
+def pending_files(user_id: int) -> Tuple[List[models.File], List[str]]:
+    """The user's pending files, and the statuses of their other files that are staying."""
+    db = SessionLocal()
+    try:
+        files = db.query(models.File).filter(models.File.user_id == user_id).all()
+        pending = [file for file in files if file.status == "pending"]
+        others = [file.status for file in files if file.status not in ("pending", "removing")]
+        db.expunge_all()
+        return pending, others
+    finally:
+        db.close()
+
+
+def files_with_status(user_id: int, status: str) -> List[models.File]:
+    db = SessionLocal()
+    try:
+        files = db.query(models.File).filter(
+            models.File.user_id == user_id,
+            models.File.status == status
+        ).order_by(models.File.id).all()
+        db.expunge_all()
+        return files
+    finally:
+        db.close()
+
+
+def delete_file_record(user_id: int, file_id: int):
+    db = SessionLocal()
+    try:
+        db.query(models.File).filter(models.File.user_id == user_id, models.File.id == file_id).delete()
+        db.commit()
+        invalidate_status(user_id)
+    finally:
+        db.close()
+
+
+def update_file_status(user_id: int, from_statuses: List[str], to_status: str, processed_at: bool = False,
+                       file_ids: Optional[List[int]] = None) -> int:
+    """Move the user's files between pipeline states; returns how many were updated.
+
+    ``file_ids`` limits the update to the files a job actually saw when it started.
+    """
+    db = SessionLocal()
+    try:
+        query = db.query(models.File).filter(
+            models.File.user_id == user_id,
+            models.File.status.in_(from_statuses)
+        )
+        if file_ids is not None:
+            query = query.filter(models.File.id.in_(file_ids))
+        files = query.all()
+        for file in files:
+            file.status = to_status
+            if processed_at:
+                file.processed_at = datetime.now()
+        db.commit()
+        invalidate_status(user_id)
+        return len(files)
+    finally:
+        db.close()
+
+
+@job_handler("ingest")
+async def run_ingest(ctx: JobContext):
+    from modules.data_loader import PDFLoader
+
+    user_dir = Path(f"data/pdfs/{ctx.username}")
+    ctx.report("Loading PDFs", 0.0)
+    # Files uploaded after this point are left pending for the next ingest job
+    file_ids = await run_in_executor("io", pending_file_ids, ctx.user_id, ["pending"])
+    loader = await run_in_executor("io", PDFLoader, pdf_dir=str(user_dir), username=ctx.username)
+    await loader.load_pdfs(progress_callback=ctx.report)
+
+    files_processed = await run_in_executor(
+        "io", update_file_status, ctx.user_id, ["pending"], "processed", True, file_ids
+    )
+    return {"message": "PDFs processed successfully", "files_processed": files_processed}
+
+
+@job_handler("extract_entities")
+async def run_extract_entities(ctx: JobContext):
+    from modules.JSON_NER import Chunks_NER
+
+    ctx.report("Extracting entities", 0.0)
+    ner = await run_in_executor("io", Chunks_NER, username=ctx.username)
+    entities = await run_in_executor("pipeline", ner.Extract_Entities, progress_callback=ctx.report)
+
+    files_processed = await run_in_executor("io", update_file_status, ctx.user_id, ["processed"], "entities_extracted")
+    return {
+        "message": "Entity extraction completed successfully",
+        "files_processed": files_processed,
+        "entities_found": len(entities) if entities else 0
+    }
+
+
+@job_handler("build_graph")
+async def run_build_graph(ctx: JobContext):
+    from modules.KnowledgeGraph import KnowledgeGraph
+
+    ctx.report("Building knowledge graph", 0.0)
+    await KnowledgeGraph(username=ctx.username).create_graph(progress_callback=ctx.report)
+
+    files_processed = await run_in_executor("io", update_file_status, ctx.user_id, ["entities_extracted"], "graph_built")
+    return {"message": "Knowledge graph built successfully", "files_processed": files_processed}
+
+
+@job_handler("update_graph")
+async def run_update_graph(ctx: JobContext):
+    from modules.JSON_NER import Chunks_NER
+    from modules.KnowledgeGraph import KnowledgeGraph
+
+    def ner_progress(stage, progress):
+        ctx.report(stage, progress * 0.5)
+
+    def graph_progress(stage, progress):
+        ctx.report(stage, 0.5 + progress * 0.5)
+
+    # First extract new entities
+    ner = await run_in_executor("io", Chunks_NER, username=ctx.username)
+    entities = await run_in_executor("pipeline", ner.Extract_Entities, progress_callback=ner_progress)
+
+    # Then update the knowledge graph
+    await KnowledgeGraph(username=ctx.username).create_graph(progress_callback=graph_progress)
+
+    files_processed = await run_in_executor("io", update_file_status, ctx.user_id, ["processed"], "graph_updated")
+    return {
+        "message": "Knowledge graph updated successfully",
+        "files_processed": files_processed,
+        "entities_found": len(entities) if entities else 0
+    }
+
+
+@job_handler("add_documents")
+async def run_add_documents(ctx: JobContext):
+    """Ingest only the user's pending files, taking them as far as their other files.
+
+    Parsed pages, embeddings and entities come from the content store when
+    the same content was processed before, so an upload another user
+    already ingested costs almost nothing. Users without an ingested
+    corpus, or with other files still pending, get the full pipeline.
+    """
+    from modules.data_loader import PDFLoader
+    from modules.JSON_NER import Chunks_NER
+    from modules.KnowledgeGraph import KnowledgeGraph
+
+    pending, others = await run_in_executor("io", pending_files, ctx.user_id)
+    if not pending:
+        return {"message": "No new files to process", "files_processed": 0}
+    loader = await run_in_executor("io", PDFLoader, pdf_dir=f"data/pdfs/{ctx.username}", username=ctx.username)
+    indexed = await run_in_executor("io", loader.chunk_store.exists) and loader.vector_store_path.exists()
+    if not indexed or not others or any(status not in FILE_STAGES for status in others):
+        return await JOB_HANDLERS["pipeline" if settings.streaming_pipeline else "ingest"](ctx)
+    stage = min(FILE_STAGES[status] for status in others)
+
+    def progress(start, end):
+        return lambda label, fraction: ctx.report(label, start + fraction * (end - start))
+
+    chunks = await loader.add_pdfs([Path(file.file_path) for file in pending], progress(0.0, 0.4))
+
+    found = {}
+    if stage >= 2 and chunks:
+        ner = await run_in_executor("io", Chunks_NER, username=ctx.username)
+        found = await run_in_executor("pipeline", ner.add_entities, chunks, progress(0.4, 0.8))
+    if stage >= 3 and found:
+        kg = KnowledgeGraph(username=ctx.username)
+        await kg.write_entities(found, progress(0.8, 1.0))
+        await kg.save_graph_stats()
+
+    files_processed = await run_in_executor(
+        "io", update_file_status, ctx.user_id, ["pending"], STAGE_STATUSES[stage], True,
+        [file.id for file in pending]
+    )
+    return {
+        "message": f"New PDFs added up to the {STAGE_STATUSES[stage]} stage",
+        "files_processed": files_processed,
+        "chunks": len(chunks),
+        "chunks_with_entities": len(found)
+    }
+
+
+@job_handler("delete_graph")
+async def run_delete_graph(ctx: JobContext):
+    """Delete the user's knowledge graph, never while one of their builds is writing it."""
+    import shutil
+
+    from modules.KnowledgeGraph import KnowledgeGraph
+
+    ctx.report("Deleting knowledge graph", 0.0)
+    kg = KnowledgeGraph(username=ctx.username)
+    deleted = await kg.delete_graph(progress_callback=ctx.report)
+    await run_in_executor("io", shutil.rmtree, kg.graph_dir, True)
+
+    files_reset = await run_in_executor(
+        "io", update_file_status, ctx.user_id, ["graph_built", "graph_updated"], "entities_extracted"
+    )
+    return {"message": "Knowledge graph deleted", "files_reset": files_reset, **deleted}
+
+
+@job_handler("remove_documents")
+async def run_remove_documents(ctx: JobContext):
+    """Remove every file marked ``removing`` and everything derived from it.
+
+    Runs as a job so it never overlaps an ingest or graph build of the
+    same user, which would write the removed chunks back.
+    """
+    from modules.document_removal import remove_document
+
+    files = await run_in_executor("io", files_with_status, ctx.user_id, "removing")
+    removed = {}
+    for n, file in enumerate(files):
+        ctx.report("Removing documents", n / len(files))
+        removed[file.filename] = await remove_document(ctx.username, file.filename)
+        if os.path.exists(file.file_path):
+            await run_in_executor("io", os.remove, file.file_path)
+        await run_in_executor("io", delete_file_record, ctx.user_id, file.id)
+    return {"message": "Documents removed", "files_removed": len(files), "removed": removed}
+
+
+@job_handler("pipeline")
+async def run_pipeline(ctx: JobContext):
+    from modules.pipeline import StreamingPipeline
+
+    ctx.report("Parsing PDFs", 0.0)
+    file_ids = await run_in_executor("io", pending_file_ids, ctx.user_id, ["pending"])
+    stats = await StreamingPipeline(ctx.username, progress_callback=ctx.report).run()
+
+    files_processed = await run_in_executor(
+        "io", update_file_status, ctx.user_id, ["pending"], "graph_built", True, file_ids
+    )
+    return {
+        "message": "PDFs processed and knowledge graph built successfully",
+        "files_processed": files_processed,
+        **stats
+    }
+
+
+class JobWorker:
+    """Pulls jobs from the ``jobs`` table and runs them.
+
+    Claims use ``SELECT ... FOR UPDATE SKIP LOCKED``, so any number of worker
+    processes or nodes can share the queue without handing out a job twice.
+    A user never has more than one running job: stages rebuild the same
+    chunk store, entity file and graph, so they are serialized per user.
+    Failed jobs are retried with exponential backoff up to ``max_attempts``,
+    and jobs whose worker stopped heartbeating are put back on the queue.
+    """
+
+    def __init__(self, concurrency: int = settings.job_worker_concurrency):
+        self.concurrency = concurrency
+        self.worker_id = f"{socket.gethostname()}:{os.getpid()}:{uuid.uuid4().hex[:6]}"
+        self._tasks: List[asyncio.Task] = []
+        self._stopping: Optional[asyncio.Event] = None
+
+    def start(self):
+        self._stopping = asyncio.Event()
+        self._tasks = [asyncio.create_task(self._run_slot()) for _ in range(self.concurrency)]
+        self._tasks.append(asyncio.create_task(self._reap_stale()))
+        logging.info(f"Job worker {self.worker_id} started with {self.concurrency} slots")
+
+    async def stop(self):
+        if self._stopping is not None:
+            self._stopping.set()
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        self._tasks = []
+
+    async def _sleep(self, seconds: float):
+        try:
+            await asyncio.wait_for(self._stopping.wait(), timeout=seconds)
+        except asyncio.TimeoutError:
+            pass
+
+    async def _run_slot(self):
+        while not self._stopping.is_set():
+            try:
+                ctx = await run_in_executor("io", self._claim)
+            except Exception as e:
+                logging.error(f"Error claiming job: {e}")
+                ctx = None
+
+            if ctx is None:
+                await self._sleep(settings.job_poll_interval)
+                continue
+            await self._execute(ctx)
+
+    def _claim(self) -> Optional[JobContext]:
+        db = SessionLocal()
+        try:
+            running = aliased(models.Job)
+            user_busy = (
+                select(running.id)
+                .where(running.user_id == models.Job.user_id, running.status == "running")
+                .exists()
+            )
+            job = (
+                db.query(models.Job)
+                .filter(
+                    models.Job.status == "queued",
+                    models.Job.run_after <= func.now(),
+                    ~user_busy
+                )
+                .order_by(models.Job.id)
+                .with_for_update(skip_locked=True)
+                .first()
+            )
+            if job is None:
+                db.rollback()
+                return None
+
+            # Two workers can claim different jobs of the same user at once; only
+            # one gets the lock, and the re-check sees any claim committed before it
+            locked = db.execute(select(func.pg_try_advisory_xact_lock(CLAIM_LOCK, job.user_id))).scalar()
+            if not locked or db.query(
+                db.query(models.Job).filter(
+                    models.Job.user_id == job.user_id, models.Job.status == "running"
+                ).exists()
+            ).scalar():
+                db.rollback()
+                return None
+
+            job.status = "running"
+            job.attempts += 1
+            job.worker_id = self.worker_id
+            job.started_at = func.now()
+            job.heartbeat_at = func.now()
+            ctx = JobContext(
+                job.id, job.kind, job.user_id, job.user.username, job.payload or {},
+                job.attempts, job.max_attempts
+            )
+            db.commit()
+            invalidate_status(ctx.user_id)
+            return ctx
+        finally:
+            db.close()
+
+    async def _execute(self, ctx: JobContext):
+        logging.info(f"Worker {self.worker_id} running {ctx.kind} job {ctx.job_id} (attempt {ctx.attempts})")
+        heartbeat = asyncio.create_task(self._heartbeat(ctx))
+        try:
+            handler = JOB_HANDLERS.get(ctx.kind)
+            if handler is None:
+                raise ValueError(f"No handler registered for job kind {ctx.kind}")
+            with trace(f"job.{ctx.kind}", job_id=ctx.job_id, user_id=ctx.user_id,
+                       parent=ctx.payload.get("trace"), attempt=ctx.attempts):
+                result = await handler(ctx)
+        except JobCancelled:
+            outcome = ("cancelled", None, None)
+        except Exception as e:
+            logging.error(f"Job {ctx.job_id} failed: {e}")
+            outcome = ("failed", None, str(e))
+        else:
+            outcome = ("succeeded", result, None)
+        finally:
+            heartbeat.cancel()
+
+        try:
+            await run_in_executor("io", self._finish, ctx, *outcome)
+        except Exception as e:
+            logging.error(f"Error recording outcome of job {ctx.job_id}: {e}")
+
+    def _finish(self, ctx: JobContext, status: str, result: Optional[dict], error: Optional[str]):
+        db = SessionLocal()
+        try:
+            job = db.query(models.Job).filter(models.Job.id == ctx.job_id).first()
+            if job is None:
+                return
+
+            job.stage = ctx.stage
+            job.error = error
+            if status == "failed" and job.attempts < job.max_attempts and not job.cancel_requested:
+                # Retry later with exponential backoff
+                delay = settings.job_retry_backoff * (2 ** (job.attempts - 1))
+                job.status = "queued"
+                job.worker_id = None
+                job.run_after = func.now() + timedelta(seconds=delay)
+                logging.info(f"Job {job.id} will be retried in {delay:.0f}s")
+            else:
+                job.status = status
+                job.result = result
+                job.finished_at = func.now()
+                if status == "succeeded":
+                    job.progress = 1.0
+            db.commit()
+            invalidate_status(ctx.user_id)
+        finally:
+            db.close()
+
+    async def _heartbeat(self, ctx: JobContext):
+        while True:
+            await asyncio.sleep(settings.job_heartbeat_interval)
+            try:
+                if await run_in_executor("io", self._beat, ctx):
+                    ctx.cancelled = True
+            except Exception as e:
+                logging.warning(f"Heartbeat for job {ctx.job_id} failed: {e}")
+
+    def _beat(self, ctx: JobContext) -> bool:
+        """Persist progress and return whether cancellation was requested."""
+        db = SessionLocal()
+        try:
+            job = db.query(models.Job).filter(models.Job.id == ctx.job_id).first()
+            if job is None or job.status != "running":
+                return True
+            job.stage = ctx.stage
+            job.progress = ctx.progress
+            job.heartbeat_at = func.now()
+            cancel_requested = job.cancel_requested
+            db.commit()
+            invalidate_status(ctx.user_id)
+            return cancel_requested
+        finally:
+            db.close()
+
+    async def _reap_stale(self):
+        while not self._stopping.is_set():
+            try:
+                await run_in_executor("io", self._requeue_stale)
+            except Exception as e:
+                logging.error(f"Error requeueing stale jobs: {e}")
+            await self._sleep(settings.job_stale_after / 2)
+
+    def _requeue_stale(self):
+        db = SessionLocal()
+        try:
+            stale = (
+                db.query(models.Job)
+                .filter(
+                    models.Job.status == "running",
+                    models.Job.heartbeat_at < func.now() - timedelta(seconds=settings.job_stale_after)
+                )
+                .with_for_update(skip_locked=True)
+                .all()
+            )
+            for job in stale:
+                logging.warning(f"Job {job.id} lost its worker {job.worker_id}; requeueing")
+                if job.attempts >= job.max_attempts:
+                    job.status = "failed"
+                    job.error = "Worker stopped responding"
+                    job.finished_at = func.now()
+                else:
+                    job.status = "queued"
+                    job.worker_id = None
+            db.commit()
+            for job in stale:
+                invalidate_status(job.user_id)
+        finally:
+            db.close()
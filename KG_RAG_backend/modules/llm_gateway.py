@@ -0,0 +1,362 @@
+import asyncio
+import hashlib
+import heapq
+import itertools
+import json
+import logging
+import threading
+import time
+from concurrent.futures import Future
+from functools import lru_cache
+from typing import TYPE_CHECKING, Any, Dict, List, Optional
+
+import httpx
+
+from config import settings
+from utils.metrics import LLM_CALL_SECONDS, LLM_CALLS, LLM_COALESCED, LLM_TOKENS
+from utils.tracing import annotate, span
+
+if TYPE_CHECKING:
+    from langchain_core.messages import BaseMessage
+    from langchain_core.outputs import ChatResult
+
+PRIORITIES = {"interactive": 0, "batch": 1}
+
+
+class LeaderCancelled(Exception):
+    """Set on a coalesced call's future when its leader's caller went away.
+
+    Followers then issue the call themselves instead of failing with the
+    leader's cancellation.
+    """
+
+
+def _caller_cancelled(error: BaseException) -> bool:
+    """True when the leader's caller was cancelled, rather than the call itself failing."""
+    if not isinstance(error, Exception):
+        # asyncio.CancelledError, KeyboardInterrupt, SystemExit
+        return True
+    from modules.jobs import JobCancelled
+
+    return isinstance(error, JobCancelled)
+
+
+class TokenBucket:
+    """Request-rate limiter shared by threads and the event loop.
+
+    ``reserve`` takes a token immediately and returns how long the caller must
+    wait before using it, so waiting happens outside the lock and callers are
+    served in arrival order.
+    """
+
+    def __init__(self, rate: float, burst: float):
+        self.rate = rate
+        self.burst = burst
+        self.tokens = burst
+        self.updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def reserve(self) -> float:
+        if self.rate <= 0:
+            return 0.0
+        with self._lock:
+            now = time.monotonic()
+            self.tokens = min(self.burst, self.tokens + (now - self.updated) * self.rate)
+            self.updated = now
+            self.tokens -= 1
+            return 0.0 if self.tokens >= 0 else -self.tokens / self.rate
+
+
+class PriorityLimiter:
+    """Caps in-flight calls; freed slots go to the highest-priority waiter first.
+
+    Works for both thread and coroutine waiters: each waiter registers a wake-up
+    callback and a released slot is handed straight to the next waiter.
+    """
+
+    def __init__(self, slots: int):
+        self.free = slots
+        self._waiters = []
+        self._seq = itertools.count()
+        self._lock = threading.Lock()
+
+    def _try_take(self, priority: int, wake) -> bool:
+        with self._lock:
+            if self.free > 0 and not self._waiters:
+                self.free -= 1
+                return True
+            heapq.heappush(self._waiters, (priority, next(self._seq), wake))
+            return False
+
+    def acquire(self, priority: int):
+        event = threading.Event()
+        if not self._try_take(priority, event.set):
+            event.wait()
+
+    async def acquire_async(self, priority: int):
+        loop = asyncio.get_running_loop()
+        granted = loop.create_future()
+
+        def wake():
+            loop.call_soon_threadsafe(lambda: granted.done() or granted.set_result(None))
+
+        if not self._try_take(priority, wake):
+            try:
+                await granted
+            except asyncio.CancelledError:
+                # The slot may already have been handed over; pass it on
+                if not self._forget(wake):
+                    self.release()
+                raise
+
+    def _forget(self, wake) -> bool:
+        with self._lock:
+            for i, waiter in enumerate(self._waiters):
+                if waiter[2] is wake:
+                    self._waiters.pop(i)
+                    heapq.heapify(self._waiters)
+                    return True
+            return False
+
+    def release(self):
+        with self._lock:
+            if self._waiters:
+                _, _, wake = heapq.heappop(self._waiters)
+            else:
+                self.free += 1
+                return
+        wake()
+
+    @property
+    def waiting(self) -> int:
+        return len(self._waiters)
+
+
+class LLMGateway:
+    """Single entry point for every LLM call made by this process.
+
+    Provides a global and a per-user request-rate token bucket, a cap on
+    in-flight calls that serves interactive chat before batch NER,
+    coalescing of identical in-flight prompts, and per-call latency and
+    token-count logging. If the caller leading a coalesced call is cancelled,
+    one of its followers issues the call instead of failing with it.
+    """
+
+    def __init__(self):
+        self.global_bucket = TokenBucket(settings.llm_global_rps, settings.llm_global_burst)
+        self.user_buckets: Dict[str, TokenBucket] = {}
+        self.limiter = PriorityLimiter(settings.llm_max_inflight)
+        self._inflight: Dict[str, Future] = {}
+        self._lock = threading.Lock()
+
+        self.calls = 0
+        self.errors = 0
+        self.coalesced = 0
+        self.prompt_tokens = 0
+        self.completion_tokens = 0
+        self.latency_ms_total = 0.0
+
+    def _user_bucket(self, username: Optional[str]) -> TokenBucket:
+        key = username or "_anonymous"
+        with self._lock:
+            bucket = self.user_buckets.get(key)
+            if bucket is None:
+                bucket = TokenBucket(settings.llm_user_rps, settings.llm_user_burst)
+                self.user_buckets[key] = bucket
+            return bucket
+
+    def _admission_delay(self, username: Optional[str]) -> float:
+        return max(self.global_bucket.reserve(), self._user_bucket(username).reserve())
+
+    @staticmethod
+    def request_key(model: str, messages: List["BaseMessage"], stop, kwargs) -> str:
+        payload = json.dumps(
+            [model, [(m.type, m.content) for m in messages], stop, sorted(kwargs.items())],
+            default=str
+        )
+        return hashlib.sha256(payload.encode()).hexdigest()
+
+    def _join_or_lead(self, key: str):
+        """Return (future, is_leader) for the in-flight call with this key."""
+        with self._lock:
+            future = self._inflight.get(key)
+            if future is not None:
+                self.coalesced += 1
+                LLM_COALESCED.inc()
+                return future, False
+            future = Future()
+            self._inflight[key] = future
+            return future, True
+
+    def _settle(self, key: str, future: Future, result: Optional["ChatResult"], error: Optional[BaseException]):
+        with self._lock:
+            self._inflight.pop(key, None)
+        if future.done():
+            return
+        if error is not None and _caller_cancelled(error):
+            future.set_exception(LeaderCancelled())
+        elif error is not None:
+            future.set_exception(error)
+        else:
+            future.set_result(result)
+
+    def _record(self, username: Optional[str], priority: str, started: float, result: Optional["ChatResult"]):
+        latency_ms = (time.perf_counter() - started) * 1000
+        usage = ((result.llm_output or {}).get("token_usage") or {}) if result is not None else {}
+        prompt_tokens = usage.get("prompt_tokens") or 0
+        completion_tokens = usage.get("completion_tokens") or 0
+        with self._lock:
+            self.calls += 1
+            if result is None:
+                self.errors += 1
+            self.latency_ms_total += latency_ms
+            self.prompt_tokens += prompt_tokens
+            self.completion_tokens += completion_tokens
+        LLM_CALLS.inc(priority=priority, outcome="ok" if result is not None else "error")
+        LLM_CALL_SECONDS.observe(latency_ms / 1000, priority=priority)
+        LLM_TOKENS.inc(prompt_tokens, priority=priority, type="prompt")
+        LLM_TOKENS.inc(completion_tokens, priority=priority, type="completion")
+        annotate(prompt_tokens=prompt_tokens, completion_tokens=completion_tokens, call_ms=round(latency_ms, 1))
+        logging.info(
+            f"LLM call user={username} priority={priority} latency_ms={latency_ms:.0f} "
+            f"prompt_tokens={prompt_tokens} completion_tokens={completion_tokens} ok={result is not None}"
+        )
+
+    def call(self, key: str, username: Optional[str], priority: str, generate) -> "ChatResult":
+        while True:
+            future, leader = self._join_or_lead(key)
+            if leader:
+                return self._lead(key, future, username, priority, generate)
+            try:
+                return future.result()
+            except LeaderCancelled:
+                # Take over (or join whoever took over) the abandoned call
+                continue
+
+    def _lead(self, key: str, future: Future, username: Optional[str], priority: str, generate) -> "ChatResult":
+        result, error = None, None
+        started = time.perf_counter()
+        with span("llm_call", priority=priority):
+            try:
+                time.sleep(self._admission_delay(username))
+                self.limiter.acquire(PRIORITIES[priority])
+                try:
+                    started = time.perf_counter()
+                    result = generate()
+                finally:
+                    self.limiter.release()
+            except BaseException as e:
+                error = e
+                raise
+            finally:
+                self._record(username, priority, started, result)
+                self._settle(key, future, result, error)
+        return result
+
+    async def acall(self, key: str, username: Optional[str], priority: str, agenerate) -> "ChatResult":
+        while True:
+            future, leader = self._join_or_lead(key)
+            if leader:
+                return await self._alead(key, future, username, priority, agenerate)
+            try:
+                # Shield so a cancelled follower doesn't cancel the leader's shared future
+                return await asyncio.shield(asyncio.wrap_future(future))
+            except LeaderCancelled:
+                continue
+
+    async def _alead(self, key: str, future: Future, username: Optional[str], priority: str, agenerate) -> "ChatResult":
+        result, error = None, None
+        started = time.perf_counter()
+        with span("llm_call", priority=priority):
+            try:
+                await asyncio.sleep(self._admission_delay(username))
+                await self.limiter.acquire_async(PRIORITIES[priority])
+                try:
+                    started = time.perf_counter()
+                    result = await agenerate()
+                finally:
+                    self.limiter.release()
+            except BaseException as e:
+                error = e
+                raise
+            finally:
+                self._record(username, priority, started, result)
+                self._settle(key, future, result, error)
+        return result
+
+    def snapshot(self) -> Dict[str, Any]:
+        with self._lock:
+            return {
+                "calls": self.calls,
+                "errors": self.errors,
+                "coalesced": self.coalesced,
+                "waiting": self.limiter.waiting,
+                "prompt_tokens": self.prompt_tokens,
+                "completion_tokens": self.completion_tokens,
+                "avg_latency_ms": round(self.latency_ms_total / self.calls, 2) if self.calls else 0.0,
+            }
+
+
+llm_gateway = LLMGateway()
+
+
+def _http_limits() -> httpx.Limits:
+    return httpx.Limits(
+        max_connections=settings.llm_pool_connections,
+        max_keepalive_connections=settings.llm_pool_connections,
+        keepalive_expiry=settings.llm_keepalive_expiry
+    )
+
+
+@lru_cache(maxsize=1)
+def _http_client() -> httpx.Client:
+    return httpx.Client(limits=_http_limits(), timeout=settings.llm_timeout)
+
+
+@lru_cache(maxsize=1)
+def _http_async_client() -> httpx.AsyncClient:
+    return httpx.AsyncClient(limits=_http_limits(), timeout=settings.llm_timeout)
+
+
+@lru_cache(maxsize=1)
+def _chat_model_class():
+    """Defined on first use so importing the gateway (e.g. for /health) doesn't load langchain_openai."""
+    from langchain_openai import ChatOpenAI
+
+    class GatewayChatModel(ChatOpenAI):
+        """ChatOpenAI whose calls go through the process-wide ``llm_gateway``."""
+
+        username: Optional[str] = None
+        priority: str = "interactive"
+
+        def _generate(self, messages, stop=None, run_manager=None, **kwargs) -> "ChatResult":
+            key = llm_gateway.request_key(self.model_name, messages, stop, kwargs)
+            return llm_gateway.call(
+                key, self.username, self.priority,
+                lambda: super(GatewayChatModel, self)._generate(messages, stop=stop, run_manager=run_manager, **kwargs)
+            )
+
+        async def _agenerate(self, messages, stop=None, run_manager=None, **kwargs) -> "ChatResult":
+            key = llm_gateway.request_key(self.model_name, messages, stop, kwargs)
+            return await llm_gateway.acall(
+                key, self.username, self.priority,
+                lambda: super(GatewayChatModel, self)._agenerate(messages, stop=stop, run_manager=run_manager, **kwargs)
+            )
+
+    return GatewayChatModel
+
+
+def get_chat_model(username: Optional[str] = None, priority: str = "interactive"):
+    """Chat model for ``username`` that shares the gateway's limits and connection pool."""
+    if priority not in PRIORITIES:
+        raise ValueError(f"Unknown LLM priority: {priority}")
+    return _chat_model_class()(
+        temperature=settings.llm_temperature,
+        openai_api_key=settings.together_api_key,
+        openai_api_base=settings.together_api_base,
+        model_name=settings.llm_model,
+        http_client=_http_client(),
+        http_async_client=_http_async_client(),
+        username=username,
+        priority=priority,
+    )
@@ -0,0 +1,126 @@
+import asyncio
+import logging
+from pathlib import Path
+
+from config import BLOCK_SIZE, settings
+from modules.data_loader import PDFLoader
+from modules.JSON_NER import Chunks_NER
+from modules.KnowledgeGraph import KnowledgeGraph
+from utils.executors import run_in_executor
+
+_DONE = object()
+
+
+class StreamingPipeline:
+    """Runs PDF parsing, NER and graph writes as overlapping stages.
+
+    Chunks go to NER as soon as their PDF is parsed, and each NER batch is
+    written to the graph while the next batch is extracted. Bounded queues
+    between the stages provide backpressure, so a slow stage holds back the
+    ones upstream of it instead of buffering the whole corpus. Indexing the
+    chunks (chunk store and FAISS) runs once parsing finishes, alongside NER.
+    """
+
+    def __init__(self, username: str, progress_callback=None, queue_size: int = settings.pipeline_queue_size):
+        self.username = username
+        self.report = progress_callback or (lambda stage, progress: None)
+        self.queue_size = queue_size
+
+        self.docs_total = 0
+        self.docs_parsed = 0
+        self.chunks_produced = 0
+        self.chunks_extracted = 0
+        self.chunks_written = 0
+        self.entities = set()
+        self.dump = dict()
+
+    def _progress(self, stage: str):
+        # Parsing, NER and graph writes each count for a third of the job
+        parsed = self.docs_parsed / self.docs_total if self.docs_total else 1.0
+        produced = max(self.chunks_produced, 1)
+        self.report(stage, (parsed + self.chunks_extracted / produced + self.chunks_written / produced) / 3)
+
+    async def run(self):
+        self.loader = await run_in_executor(
+            "io", PDFLoader, pdf_dir=f"data/pdfs/{self.username}", username=self.username
+        )
+        self.ner = await run_in_executor("io", Chunks_NER, username=self.username)
+        self.kg = KnowledgeGraph(username=self.username)
+        self.docs_total = len(list(Path(self.loader.pdf_dir).glob("*.pdf")))
+
+        chunk_queue = asyncio.Queue(maxsize=self.queue_size)
+        entity_queue = asyncio.Queue(maxsize=self.queue_size)
+        tasks = [
+            asyncio.create_task(self._parse(chunk_queue)),
+            asyncio.create_task(self._extract(chunk_queue, entity_queue)),
+            asyncio.create_task(self._write(entity_queue)),
+        ]
+        try:
+            await asyncio.gather(*tasks)
+        except BaseException:
+            # One failed or cancelled stage stops the others
+            for task in tasks:
+                task.cancel()
+            await asyncio.gather(*tasks, return_exceptions=True)
+            raise
+
+        await run_in_executor("io", self.ner.save_entities, self.dump)
+        return {
+            "chunks": self.chunks_produced,
+            "chunks_with_entities": len(self.dump),
+            "entities_found": len(self.entities)
+        }
+
+    async def _parse(self, chunk_queue: asyncio.Queue):
+        all_chunks = []
+        async for chunks in self.loader.iter_pdf_chunks():
+            self.docs_parsed += 1
+            for chunk in chunks:
+                await chunk_queue.put([chunk["chunk_id"], chunk["text"]])
+                self.chunks_produced += 1
+            all_chunks.extend(chunks)
+            self._progress("Parsing PDFs")
+        await chunk_queue.put(_DONE)
+
+        # Same row order as a batch ingest, whatever order the PDFs finished in. The sort
+        # is stable and each PDF's chunks arrive in order, so the numeric doc_id is enough
+        # (chunk ids sort "d100..." between "d10..." and "d11...")
+        all_chunks.sort(key=lambda c: c["doc_id"])
+        await self.loader.index_chunks(all_chunks)
+
+    async def _extract(self, chunk_queue: asyncio.Queue, entity_queue: asyncio.Queue):
+        batch = []
+        batch_no = 0
+        while True:
+            item = await chunk_queue.get()
+            if item is not _DONE:
+                batch.append(item)
+            if batch and (len(batch) >= BLOCK_SIZE or item is _DONE):
+                batch_no += 1
+                self._progress("Extracting entities")
+                found = await run_in_executor(
+                    "pipeline", self.ner.extract_batch, batch, list(self.entities), str(batch_no)
+                )
+                for normalized in found.values():
+                    self.entities.update(normalized)
+                self.dump.update(found)
+                self.chunks_extracted += len(batch)
+                await entity_queue.put((found, len(batch)))
+                batch = []
+            if item is _DONE:
+                await entity_queue.put(_DONE)
+                return
+
+    async def _write(self, entity_queue: asyncio.Queue):
+        # Ensure the graph is empty before the first micro-batch lands
+        await self.kg.delete_graph()
+        while True:
+            item = await entity_queue.get()
+            if item is _DONE:
+                await self.kg.save_graph_stats()
+                return
+            found, batch_size = item
+            self._progress("Writing knowledge graph")
+            await self.kg.write_entities(found)
+            self.chunks_written += batch_size
+            logging.info(f"Streaming pipeline for {self.username}: {self.chunks_written} chunks written to graph")
@@ -1,56 +1,43 @@
-from langchain_openai import ChatOpenAI
 from langchain_core.prompts import PromptTemplate
 from langchain_core.output_parsers import PydanticOutputParser
 from pydantic import RootModel
-from typing import Dict, List
-import os
-from .data_loader import PDFLoader
-from langchain_neo4j import Neo4jGraph, GraphCypherQAChain
-from config import (
-    NEO4J_URI, NEO4J_USERNAME, NEO4J_PASSWORD,
-    TOGETHER_API_KEY, TOGETHER_API_BASE, LLM_MODEL, LLM_TEMPERATURE
-)
+import time
+from typing import Dict, List, Optional
+from .data_loader import PDFLoader, get_embeddings
+from .index_store import shared_indexes
+from .chunk_store import ChunkStore
+from .llm_gateway import get_chat_model
+from utils.executors import run_in_executor
+from utils.metrics import FAISS_SEARCH_SECONDS
+from db.neo4j_connector import Neo4jConnector, get_neo4j_connector
+from config import SHARED_INDEX_SERVING
 
 class EntityResponse(RootModel[Dict[str, List[str]]]):
     pass
 
 class SearchTools:
-    def __init__(self, username: str = None):
+    def __init__(self, username: str = None, connector: Optional[Neo4jConnector] = None):
         self.username = username
+        self._chunk_store = None
         
         # Initialize vector store
         if username:
             pdf_dir = f"data/pdfs/{username}"
             self.pdf_loader = PDFLoader(pdf_dir=pdf_dir, username=username)
-            if not self.pdf_loader.load_index():
+            # With shared serving, vectors come from the memory-mapped snapshot instead of a private copy
+            serving_shared = SHARED_INDEX_SERVING and shared_indexes.get(username) is not None
+            if not serving_shared and not self.pdf_loader.load_index():
                 print("Warning: No vector store found. Please process PDFs first.")
         else:
             print("Warning: No username provided. Vector store will not be initialized.")
             self.pdf_loader = None
         
-        # Initialize Neo4j graph
-        self.graph = Neo4jGraph(
-            url=NEO4J_URI,
-            username=NEO4J_USERNAME,
-            password=NEO4J_PASSWORD
-        )
-        
-        # Initialize LLM for Cypher generation
-        os.environ["TOGETHER_API_KEY"] = TOGETHER_API_KEY
-        self.llm = ChatOpenAI(
-            temperature=LLM_TEMPERATURE,
-            openai_api_key=TOGETHER_API_KEY,
-            openai_api_base=TOGETHER_API_BASE,
-            model_name=LLM_MODEL,
-        )
-        
-        # Initialize Cypher QA Chain
-        self.cypher_chain = GraphCypherQAChain.from_llm(
-            llm=self.llm,
-            graph=self.graph,
-            verbose=True,
-            allow_dangerous_requests=True
-        )
+        # Shared async connector for retrieval queries
+        self.connector = connector or get_neo4j_connector()
+
+        # LLM for query NER, shared through the gateway; text-to-Cypher lives
+        # in modules.cypher_qa and is only built for structured questions
+        self.llm = get_chat_model(username=username)
         
         # Initialize NER parser
         self.parser = PydanticOutputParser(pydantic_object=EntityResponse)
@@ -78,24 +65,25 @@ class SearchTools:
         
         self.ner_chain = self.ner_prompt | self.llm | self.parser
 
-    def get_relevant_chunks_from_graph(self, query: str, k: int = 3) -> List[Dict]:
+    async def get_relevant_chunks_from_graph(self, query: str, k: int = 3, entities: List[str] = None) -> List[Dict]:
         """
         Get most relevant chunks from the knowledge graph based on entity relationships.
         
         Args:
             query: The search query
             k: Number of results to return
+            entities: Entities already extracted from the query, if any
             
         Returns:
             List of dictionaries containing chunk information
         """
         try:
             # Extract entities from query
-            query_entities = self.extract_entities(query)
+            query_entities = entities if entities is not None else await self.extract_entities(query)
             
             # Construct Cypher query for finding similar nodes and their connections
             cypher_query = """
-            MATCH (e:Entity)
+            MATCH (e:Entity {username: $username})
             WHERE e.name IN $entities
             WITH e
             MATCH (e)-[r:RELATED_TO]-(related:Entity)
@@ -112,67 +100,187 @@ class SearchTools:
             """
             
             # Execute query
-            results = self.graph.query(
+            results = await self.connector.execute_read(
                 cypher_query,
-                params={"entities": query_entities, "k": k}
+                {"entities": query_entities, "k": k, "username": self.username}
             )
             
-            # Process results
-            relevant_chunks = []
-            for result in results:
-                entity_name = result['entity_name']
-                entity_chunks = result['entity_chunks']
-                related_entities = result['related_entities']
-                
-                # Add main entity chunks
-                relevant_chunks.append({
-                    'chunk_id': entity_chunks[0] if entity_chunks else None,
-                    'entity': entity_name,
-                    'related_entities': [r['name'] for r in related_entities],
-                    'relationship_count': sum(r['relationship_count'] for r in related_entities),
-                    'is_main_context': True
-                })
-                
-                # Add related entity chunks
-                for related in related_entities:
-                    if related['chunks']:
-                        relevant_chunks.append({
-                            'chunk_id': related['chunks'][0],
-                            'entity': related['name'],
-                            'related_entities': [entity_name],
-                            'relationship_count': related['relationship_count'],
-                            'is_main_context': False
-                        })
-            
-            # Sort by relationship count and return top k
-            relevant_chunks.sort(key=lambda x: x['relationship_count'], reverse=True)
-            return relevant_chunks[:k]
+            top_chunks = self._rank_graph_rows(results, k)
+            await run_in_executor("io", self._attach_chunk_texts, top_chunks)
+            return top_chunks
             
         except Exception as e:
             print(f"Error getting relevant chunks from graph: {str(e)}")
             return []
 
-    def search_similar_chunks(self, query: str, k: int = 3) -> List[Dict]:
+    async def get_relevant_chunks_from_graph_batch(self, entity_lists: List[List[str]], k: int = 3) -> List[List[Dict]]:
+        """
+        Graph retrieval for many queries with a single UNWIND round trip.
+
+        Args:
+            entity_lists: Extracted entities, one list per query
+            k: Number of results to return per query
+
+        Returns:
+            One list of chunk dictionaries per query, in input order
+        """
+        try:
+            cypher_query = """
+            UNWIND $queries AS q
+            CALL {
+                WITH q
+                MATCH (e:Entity {username: $username})
+                WHERE e.name IN q.entities
+                WITH e
+                MATCH (e)-[r:RELATED_TO]-(related:Entity)
+                WITH e, related, r
+                ORDER BY r.count DESC
+                LIMIT $k
+                RETURN e.name as entity_name,
+                       e.chunk_ids as entity_chunks,
+                       collect({
+                           name: related.name,
+                           chunks: related.chunk_ids,
+                           relationship_count: r.count
+                       }) as related_entities
+            }
+            RETURN q.idx as idx, entity_name, entity_chunks, related_entities
+            """
+
+            results = await self.connector.execute_read(
+                cypher_query,
+                {
+                    "queries": [{"idx": i, "entities": e} for i, e in enumerate(entity_lists)],
+                    "k": k,
+                    "username": self.username
+                }
+            )
+
+            grouped = [[] for _ in entity_lists]
+            for result in results:
+                grouped[result['idx']].append(result)
+
+            ranked = [self._rank_graph_rows(rows, k) for rows in grouped]
+            await run_in_executor(
+                "io", self._attach_chunk_texts, [chunk for chunks in ranked for chunk in chunks]
+            )
+            return ranked
+
+        except Exception as e:
+            print(f"Error getting relevant chunks from graph in batch: {str(e)}")
+            return [[] for _ in entity_lists]
+
+    @staticmethod
+    def _rank_graph_rows(results, k: int) -> List[Dict]:
+        """Turn entity/related-entity rows into the top-k chunk references."""
+        relevant_chunks = []
+        for result in results:
+            entity_name = result['entity_name']
+            entity_chunks = result['entity_chunks']
+            related_entities = result['related_entities']
+
+            # Add main entity chunks
+            relevant_chunks.append({
+                'chunk_id': entity_chunks[0] if entity_chunks else None,
+                'entity': entity_name,
+                'related_entities': [r['name'] for r in related_entities],
+                'relationship_count': sum(r['relationship_count'] for r in related_entities),
+                'is_main_context': True
+            })
+
+            # Add related entity chunks
+            for related in related_entities:
+                if related['chunks']:
+                    relevant_chunks.append({
+                        'chunk_id': related['chunks'][0],
+                        'entity': related['name'],
+                        'related_entities': [entity_name],
+                        'relationship_count': related['relationship_count'],
+                        'is_main_context': False
+                    })
+
+        # Sort by relationship count and return top k
+        relevant_chunks.sort(key=lambda x: x['relationship_count'], reverse=True)
+        return relevant_chunks[:k]
+
+    def _attach_chunk_texts(self, chunks: List[Dict]):
+        """Attach chunk text with a single keyed lookup instead of scanning the chunk file."""
+        store = self.get_chunk_store()
+        texts = store.get_many(c['chunk_id'] for c in chunks) if store else {}
+        for chunk in chunks:
+            found = texts.get(chunk['chunk_id'])
+            chunk['text'] = found['text'] if found else None
+
+    def get_chunk_store(self):
+        """Chunk store for text lookups; the published snapshot when serving shared indexes."""
+        if not self.username:
+            return None
+        if SHARED_INDEX_SERVING:
+            published = shared_indexes.get(self.username)
+            if published is not None and published.chunks is not None:
+                return published.chunks
+        if self._chunk_store is None:
+            self._chunk_store = ChunkStore.for_user(self.username)
+        return self._chunk_store
+
+    def search_similar_chunks(self, query: str, k: int = 3, timings: Optional[Dict[str, float]] = None) -> List[Dict]:
         """
         Search for similar chunks using the vector store.
         
         Args:
             query: The search query
             k: Number of results to return
+            timings: If given, receives seconds spent in "embed" and "faiss"
             
         Returns:
             List of dictionaries containing similar chunks and their metadata
         """
         try:
-            if not self.pdf_loader or not self.pdf_loader.vector_store:
-                print("Warning: Vector store not initialized. Please process PDFs first.")
-                return []
-            return self.pdf_loader.search_similar(query, k=k)
+            started = time.perf_counter()
+            query_vector = get_embeddings().embed_query(query)
+            embedded = time.perf_counter()
+            results = self.search_by_vectors([query_vector], k=k)[0]
+            if timings is not None:
+                timings["embed"] = embedded - started
+                timings["faiss"] = time.perf_counter() - embedded
+            return results
         except Exception as e:
             print(f"Error searching similar chunks: {str(e)}")
             return []
 
-    def extract_entities(self, text: str) -> List[str]:
+    def search_by_vectors(self, vectors, k: int = 3) -> List[List[Dict]]:
+        """FAISS search for already-embedded queries, from the shared snapshot when enabled."""
+        if SHARED_INDEX_SERVING and self.username:
+            published = shared_indexes.get(self.username)
+            if published is not None:
+                with FAISS_SEARCH_SECONDS.time(source="shared"):
+                    return published.search(vectors, k=k)
+
+        if not self.pdf_loader or not self.pdf_loader.vector_store:
+            print("Warning: Vector store not initialized. Please process PDFs first.")
+            return [[] for _ in vectors]
+        with FAISS_SEARCH_SECONDS.time(source="local"):
+            return self.pdf_loader.search_similar_by_vectors(vectors, k=k)
+
+    def search_similar_chunks_batch(self, queries: List[str], k: int = 3) -> List[List[Dict]]:
+        """
+        Embed all queries in one matrix pass and search them with one FAISS call.
+
+        Args:
+            queries: The search queries
+            k: Number of results to return per query
+
+        Returns:
+            One list of similar chunks per query, in input order
+        """
+        try:
+            vectors = get_embeddings().embed_documents(queries)
+            return self.search_by_vectors(vectors, k=k)
+        except Exception as e:
+            print(f"Error searching similar chunks in batch: {str(e)}")
+            return [[] for _ in queries]
+
+    async def extract_entities(self, text: str) -> List[str]:
         """
         Extract entities from the given text using the NER model.
         
@@ -183,12 +291,13 @@ class SearchTools:
             List of extracted entities
         """
         try:
-            response = self.ner_chain.invoke({"text": text})
+            response = await self.ner_chain.ainvoke({"text": text})
             return response.root.get('entities', [])
         except Exception as e:
             print(f"Error extracting entities: {str(e)}")
             return []
 
-    def close(self):
+    async def close(self):
         """Close connections to external services."""
-        self.graph.close() 
\ No newline at end of file
+        if self._chunk_store is not None:
+            self._chunk_store.close()
\ No newline at end of file
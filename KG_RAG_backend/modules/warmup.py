@@ -0,0 +1,71 @@
+"""Optional background warmup, run once the server is already accepting traffic.
+
+Imports the query stack, loads the embedding model and, with shared index
+serving, maps the published indexes of the most recently active users, so
+the first chat requests don't pay for it. Everything runs on the io pool.
+"""
+import logging
+import time
+from typing import List
+
+from sqlalchemy import func, select
+
+from config import settings
+from db import models
+from db.database import AsyncSessionLocal
+from utils.executors import run_in_executor
+
+# disabled, pending, running, done or failed; shown by /health
+state = {"status": "disabled" if not settings.warmup_enabled else "pending", "steps": {}}
+
+
+def _import_query_stack():
+    import modules.agent  # noqa: F401
+
+
+def _load_embeddings():
+    from modules.data_loader import get_embeddings
+
+    # The first encode initialises the tokenizer and weights, not just the constructor
+    get_embeddings().embed_query("warmup")
+
+
+def _map_indexes(usernames: List[str]) -> int:
+    from modules.index_store import shared_indexes
+
+    return sum(1 for username in usernames if shared_indexes.get(username) is not None)
+
+
+async def _recent_users(limit: int) -> List[str]:
+    async with AsyncSessionLocal() as db:
+        result = await db.execute(
+            select(models.User.username)
+            .join(models.QueryHistory, models.QueryHistory.user_id == models.User.id)
+            .group_by(models.User.username)
+            .order_by(func.max(models.QueryHistory.timestamp).desc())
+            .limit(limit)
+        )
+        return list(result.scalars().all())
+
+
+async def _step(name: str, fn, *args):
+    started = time.perf_counter()
+    result = await run_in_executor("io", fn, *args)
+    state["steps"][name] = round((time.perf_counter() - started) * 1000, 1)
+    return result
+
+
+async def warmup():
+    state["status"] = "running"
+    try:
+        await _step("import_query_stack", _import_query_stack)
+        await _step("embeddings", _load_embeddings)
+        if settings.shared_index_serving and settings.warmup_index_users > 0:
+            usernames = await _recent_users(settings.warmup_index_users)
+            mapped = await _step("indexes", _map_indexes, usernames)
+            state["indexes_mapped"] = mapped
+        state["status"] = "done"
+        logging.info(f"Warmup finished: {state['steps']}")
+    except Exception as e:
+        state["status"] = "failed"
+        logging.error(f"Warmup failed: {e}")
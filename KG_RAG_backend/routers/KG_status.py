@@ -1,21 +1,27 @@
-from fastapi import APIRouter, HTTPException, Depends, status
-from modules.data_loader import PDFLoader
-from modules.JSON_NER import Chunks_NER
-from modules.KnowledgeGraph import KnowledgeGraph
+from fastapi import APIRouter, HTTPException, Depends, Request, Response, status
+from fastapi.responses import JSONResponse
+from modules.KnowledgeGraph import KnowledgeGraph, read_graph_stats
+from modules.chunk_store import ChunkStore
+from modules.jobs import ACTIVE_STATUSES, enqueue, invalidate_status, status_cache
 from auth.oauth2 import get_current_user
 from db import models
 from typing import List, Dict, Any
 from pathlib import Path
-from sqlalchemy.orm import Session
+from sqlalchemy import delete, func, select
+from sqlalchemy.ext.asyncio import AsyncSession
+import hashlib
+import json
 import logging
 import psutil
 import os
 from datetime import datetime
 import shutil
 from config import settings
-from schemas import KGStatusResponse
+from schemas import KGStatusResponse, JobOut
+from utils.executors import run_in_executor
 
-from db.database import get_db
+from db.database import get_async_db
+from db.neo4j_connector import Neo4jConnector, get_neo4j_connector
 
 router = APIRouter(
     prefix="/KG-status",
@@ -28,61 +34,110 @@ router = APIRouter(
     }
 )
 
-@router.get("/status", response_model=KGStatusResponse)
-async def get_kg_status(current_user: models.User = Depends(get_current_user), db: Session = Depends(get_db)):
-    """Get the current status of the knowledge graph for the user."""
-    try:
-        # Check files status
-        files = db.query(models.File).filter(models.File.user_id == current_user.id).all()
+PROCESSED_STATUSES = ("processed", "entities_extracted", "graph_built", "graph_updated")
+EXTRACTED_STATUSES = ("entities_extracted", "graph_built", "graph_updated")
+GRAPH_STATUSES = ("graph_built", "graph_updated")
 
-        pdfs_processed = sum(1 for f in files if f.status in ["processed", "entities_extracted", "graph_built", "graph_updated"])
-        entities_extracted = sum(1 for f in files if f.status in ["entities_extracted", "graph_built", "graph_updated"])
-        graph_built = any(f.status in ["graph_built", "graph_updated"] for f in files)
+async def _build_kg_status(current_user: models.User, db: AsyncSession, neo4j: Neo4jConnector) -> KGStatusResponse:
+    # One aggregate row per file status instead of loading every file
+    result = await db.execute(
+        select(models.File.status, func.count())
+        .where(models.File.user_id == current_user.id)
+        .group_by(models.File.status)
+    )
+    counts = dict(result.all())
 
-        logging.info(f"KG Status - User: {current_user.username}")
-        logging.info(f"  PDFs Processed: {pdfs_processed}")
-        logging.info(f"  Entities Extracted: {entities_extracted}")
-        logging.info(f"  Graph Built: {graph_built}")
+    pdfs_processed = sum(counts.get(s, 0) for s in PROCESSED_STATUSES)
+    entities_extracted = sum(counts.get(s, 0) for s in EXTRACTED_STATUSES)
+    graph_built = any(counts.get(s, 0) for s in GRAPH_STATUSES)
 
-        status_message = "offline"
-        if graph_built:
-            status_message = "ready"
-        elif entities_extracted > 0:
-            status_message = "entities_extracted" # Custom status for FE
-        elif pdfs_processed > 0:
-            status_message = "processed" # Custom status for FE
-        
-        logging.info(f"  Determined status: {status_message}")
+    status_message = "offline"
+    if graph_built:
+        status_message = "ready"
+    elif entities_extracted > 0:
+        status_message = "entities_extracted" # Custom status for FE
+    elif pdfs_processed > 0:
+        status_message = "processed" # Custom status for FE
+
+    # A queued or running pipeline job takes precedence over the file states
+    result = await db.execute(
+        select(models.Job).where(
+            models.Job.user_id == current_user.id,
+            models.Job.status.in_(ACTIVE_STATUSES)
+        ).order_by(models.Job.id.desc()).limit(1)
+    )
+    active_job = result.scalars().first()
+    if active_job:
+        return KGStatusResponse(
+            status="building",
+            message=f"{active_job.kind} job {active_job.status}",
+            stage=active_job.stage or "Queued",
+            progress=int(round((active_job.progress or 0.0) * 100)),
+            pdfsProcessed=pdfs_processed,
+            entitiesExtracted=entities_extracted
+        )
 
-        # Get graph stats from Neo4j
-        entity_count = 0
-        relationship_count = 0
-        if status_message == "ready":
+    # Graph counts are saved at build time; only graphs built before that
+    # existed are counted here, once, and the result saved for later polls
+    entity_count = 0
+    relationship_count = 0
+    if status_message == "ready":
+        stats = await run_in_executor("io", read_graph_stats, current_user.username)
+        if stats is None:
             try:
-                kg = KnowledgeGraph(username=current_user.username)
-                stats = kg.get_graph_stats()
-                entity_count = stats["node_count"]
-                relationship_count = stats["relationship_count"]
-                kg.close()
+                kg = KnowledgeGraph(username=current_user.username, connector=neo4j)
+                stats = await kg.save_graph_stats()
             except Exception as e:
                 logging.warning(f"Could not connect to Neo4j or get graph stats: {e}")
-                # If Neo4j is not ready but files are processed, still show processed status
-                if status_message == "ready":
-                    status_message = "error"
-                    return KGStatusResponse(
-                        status=status_message,
-                        message="Knowledge graph not accessible. Please ensure Neo4j is running."
-                    )
+                return KGStatusResponse(
+                    status="error",
+                    message="Knowledge graph not accessible. Please ensure Neo4j is running."
+                )
+        entity_count = stats["node_count"]
+        relationship_count = stats["relationship_count"]
 
-        return KGStatusResponse(
-            status=status_message,
-            message="Knowledge Graph is ready for queries" if status_message == "ready" else "",
-            pdfsProcessed=pdfs_processed,
-            entitiesExtracted=entities_extracted,
-            entityCount=entity_count,
-            relationshipCount=relationship_count
-        )
+    return KGStatusResponse(
+        status=status_message,
+        message="Knowledge Graph is ready for queries" if status_message == "ready" else "",
+        pdfsProcessed=pdfs_processed,
+        entitiesExtracted=entities_extracted,
+        entityCount=entity_count,
+        relationshipCount=relationship_count
+    )
 
+def _etag_matches(if_none_match: str, etag: str) -> bool:
+    """Whether an ``If-None-Match`` list names ``etag``, by weak comparison as RFC 9110 requires."""
+    for tag in if_none_match.split(","):
+        tag = tag.strip()
+        if tag == "*":
+            return True
+        if tag.startswith("W/"):
+            tag = tag[2:]
+        if tag == etag:
+            return True
+    return False
+
+@router.get("/status", response_model=KGStatusResponse)
+async def get_kg_status(
+    request: Request,
+    current_user: models.User = Depends(get_current_user),
+    db: AsyncSession = Depends(get_async_db),
+    neo4j: Neo4jConnector = Depends(get_neo4j_connector)
+):
+    """Get the current status of the knowledge graph for the user.
+
+    The response carries an ETag; pollers that send it back in
+    ``If-None-Match`` get an empty 304 until the status changes. Built
+    statuses are cached per user and dropped when this process changes the
+    user's jobs or files, so most polls make no database or Neo4j queries.
+    """
+    try:
+        kg_status = status_cache.get(current_user.id)
+        if kg_status is None:
+            kg_status = await _build_kg_status(current_user, db, neo4j)
+            # Workers in other processes don't invalidate this cache; re-check active jobs often
+            ttl = settings.kg_status_active_ttl if kg_status.status in ("building", "error") else None
+            status_cache.set(current_user.id, kg_status, ttl=ttl)
     except Exception as e:
         logging.error(f"Error getting KG status: {e}")
         raise HTTPException(
@@ -90,14 +145,43 @@ async def get_kg_status(current_user: models.User = Depends(get_current_user), d
             detail=f"Error retrieving knowledge graph status: {str(e)}"
         )
 
-@router.post("/pdf-status")
-async def pdf_breaker(file_ids: List[str], current_user: models.User = Depends(get_current_user), db: Session = Depends(get_db)):
+    content = kg_status.model_dump(mode="json")
+    body = json.dumps(content, sort_keys=True, separators=(",", ":"))
+    etag = f'"{hashlib.sha1(body.encode()).hexdigest()}"'
+    headers = {"ETag": etag, "Cache-Control": "private, no-cache"}
+    if _etag_matches(request.headers.get("if-none-match") or "", etag):
+        return Response(status_code=status.HTTP_304_NOT_MODIFIED, headers=headers)
+    return JSONResponse(content=content, headers=headers)
+
+def _chunks_exist(username: str) -> bool:
+    with ChunkStore.for_user(username) as store:
+        return store.exists()
+
+def _delete_chunks(username: str):
+    with ChunkStore.for_user(username) as store:
+        store.delete()
+
+def _queued(message: str, job: models.Job):
+    return JSONResponse(
+        content={
+            "message": message,
+            "status": "queued",
+            "job": JobOut.model_validate(job).model_dump(mode="json")
+        },
+        status_code=status.HTTP_202_ACCEPTED
+    )
+
+@router.post("/pdf-status", status_code=status.HTTP_202_ACCEPTED)
+async def pdf_breaker(file_ids: List[str], current_user: models.User = Depends(get_current_user), db: AsyncSession = Depends(get_async_db)):
     try:
         # Get user's files from database
-        files = db.query(models.File).filter(
-            models.File.user_id == current_user.id,
-            models.File.status == "pending"
-        ).all()
+        result = await db.execute(
+            select(models.File.id).where(
+                models.File.user_id == current_user.id,
+                models.File.status == "pending"
+            )
+        )
+        files = result.all()
         
         if not files:
             raise HTTPException(status_code=404, detail="No pending PDFs found for user")
@@ -106,66 +190,33 @@ async def pdf_breaker(file_ids: List[str], current_user: models.User = Depends(g
         if not user_dir.exists():
             raise HTTPException(status_code=404, detail="PDF directory not found")
             
-        loader = PDFLoader(pdf_dir=str(user_dir), username=current_user.username)
-        await loader.load_pdfs()
-        
-        # Update file status to processed
-        for file in files:
-            file.status = "processed"
-            file.processed_at = datetime.now()
-        db.commit()
-        
-        return {
-            "message": "PDFs processed successfully", 
-            "status": "completed",
-            "files_processed": len(files)
-        }
+        job = await enqueue(db, current_user, "ingest")
+        return _queued("PDF processing queued", job)
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
-@router.post("/entity-extractor")
-async def entity_extractor(current_user: models.User = Depends(get_current_user), db: Session = Depends(get_db)):
-    """Extract entities from chunks and create knowledge graph."""
+@router.post("/entity-extractor", status_code=status.HTTP_202_ACCEPTED)
+async def entity_extractor(current_user: models.User = Depends(get_current_user), db: AsyncSession = Depends(get_async_db)):
+    """Queue entity extraction over the user's chunks."""
     try:
         # Check if chunks exist for the user
-        chunks_file = Path(f"data/chunks/{current_user.username}/chunks_{current_user.username}.jsonl")
-        if not chunks_file.exists():
+        if not await run_in_executor("io", _chunks_exist, current_user.username):
             raise HTTPException(
                 status_code=status.HTTP_404_NOT_FOUND,
                 detail="No chunks found for processing. Please process PDFs first."
             )
             
-        # Initialize NER with username
-        ner = Chunks_NER(username=current_user.username)
-        
-        # Extract entities
-        entities = ner.Extract_Entities()
-        
-        # Update file status in database
-        files = db.query(models.File).filter(
-            models.File.user_id == current_user.id,
-            models.File.status == "processed"
-        ).all()
-        
-        for file in files:
-            file.status = "entities_extracted"
-        db.commit()
-        
-        return {
-            "message": "Entity extraction completed successfully",
-            "status": "completed",
-            "files_processed": len(files),
-            "entities_found": len(entities) if entities else 0
-        }
+        job = await enqueue(db, current_user, "extract_entities")
+        return _queued("Entity extraction queued", job)
     except Exception as e:
         raise HTTPException(
             status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
             detail=f"Error in entity extraction: {str(e)}"
         )
 
-@router.post("/build-kg")
-async def build_knowledge_graph(current_user: models.User = Depends(get_current_user), db: Session = Depends(get_db)):
-    """Build knowledge graph from extracted entities."""
+@router.post("/build-kg", status_code=status.HTTP_202_ACCEPTED)
+async def build_knowledge_graph(current_user: models.User = Depends(get_current_user), db: AsyncSession = Depends(get_async_db)):
+    """Queue a knowledge graph build from extracted entities."""
     try:
         # Check if entities exist for the user
         entities_file = Path(f"data/entities/{current_user.username}/entities_{current_user.username}.json")
@@ -175,63 +226,20 @@ async def build_knowledge_graph(current_user: models.User = Depends(get_current_
                 detail="No entities found for processing. Please extract entities first."
             )
             
-        # Initialize KnowledgeGraph with user-specific path
-        kg = KnowledgeGraph(username=current_user.username)
-        
-        # Create the knowledge graph
-        kg.create_graph()
-        kg.close()
-        
-        # Update file status in database
-        files = db.query(models.File).filter(
-            models.File.user_id == current_user.id,
-            models.File.status == "entities_extracted"
-        ).all()
-        
-        for file in files:
-            file.status = "graph_built"
-        db.commit()
-        
-        return {
-            "message": "Knowledge graph built successfully",
-            "status": "completed",
-            "files_processed": len(files)
-        }
+        job = await enqueue(db, current_user, "build_graph")
+        return _queued("Knowledge graph build queued", job)
     except Exception as e:
         raise HTTPException(
             status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
             detail=f"Error building knowledge graph: {str(e)}"
         )
 
-@router.post("/update-kg")
-async def update_knowledge_graph(current_user: models.User = Depends(get_current_user), db: Session = Depends(get_db)):
-    """Update knowledge graph with new entities."""
+@router.post("/update-kg", status_code=status.HTTP_202_ACCEPTED)
+async def update_knowledge_graph(current_user: models.User = Depends(get_current_user), db: AsyncSession = Depends(get_async_db)):
+    """Queue entity extraction followed by a knowledge graph rebuild."""
     try:
-        # First extract new entities
-        ner = Chunks_NER(username=current_user.username)
-        entities = ner.Extract_Entities()
-        
-        # Then update the knowledge graph
-        kg = KnowledgeGraph(username=current_user.username)
-        kg.create_graph()
-        kg.close()
-        
-        # Update file status in database
-        files = db.query(models.File).filter(
-            models.File.user_id == current_user.id,
-            models.File.status == "processed"
-        ).all()
-        
-        for file in files:
-            file.status = "graph_updated"
-        db.commit()
-        
-        return {
-            "message": "Knowledge graph updated successfully",
-            "status": "completed",
-            "files_processed": len(files),
-            "entities_found": len(entities) if entities else 0
-        }
+        job = await enqueue(db, current_user, "update_graph")
+        return _queued("Knowledge graph update queued", job)
     except Exception as e:
         raise HTTPException(
             status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
@@ -239,19 +247,19 @@ async def update_knowledge_graph(current_user: models.User = Depends(get_current
         )
 
 @router.delete("/pdf-status", status_code=status.HTTP_204_NO_CONTENT)
-def delete_pdf_status(current_user: models.User = Depends(get_current_user)):
+async def delete_pdf_status(current_user: models.User = Depends(get_current_user), db: AsyncSession = Depends(get_async_db)):
     """Delete all PDF files and their status for the current user."""
     try:
         # Delete PDF files
         pdf_dir = Path(f"data/pdfs/{current_user.username}")
         if pdf_dir.exists():
-            shutil.rmtree(pdf_dir)
+            await run_in_executor("io", shutil.rmtree, pdf_dir)
             pdf_dir.mkdir(parents=True, exist_ok=True)
         
         # Delete file records from database
-        db = next(get_db())
-        db.query(models.File).filter(models.File.user_id == current_user.id).delete()
-        db.commit()
+        await db.execute(delete(models.File).where(models.File.user_id == current_user.id))
+        await db.commit()
+        invalidate_status(current_user.id)
         
         return {"message": "Successfully deleted all PDF files and their status"}
     except Exception as e:
@@ -261,20 +269,17 @@ def delete_pdf_status(current_user: models.User = Depends(get_current_user)):
         )
 
 @router.delete("/entity-extractor", status_code=status.HTTP_204_NO_CONTENT)
-def delete_entity_extractor(current_user: models.User = Depends(get_current_user)):
+async def delete_entity_extractor(current_user: models.User = Depends(get_current_user)):
     """Delete all entity extraction results for the current user."""
     try:
         # Delete entity files
         entity_dir = Path(f"data/entities/{current_user.username}")
         if entity_dir.exists():
-            shutil.rmtree(entity_dir)
+            await run_in_executor("io", shutil.rmtree, entity_dir)
             entity_dir.mkdir(parents=True, exist_ok=True)
         
-        # Delete chunks file
-        chunks_file = Path(f"data/chunks/{current_user.username}/chunks.json")
-        if chunks_file.exists():
-            chunks_file.unlink()
-            chunks_file.parent.mkdir(parents=True, exist_ok=True)
+        # Delete chunk store
+        await run_in_executor("io", _delete_chunks, current_user.username)
         
         return {"message": "Successfully deleted all entity extraction results"}
     except Exception as e:
@@ -283,22 +288,16 @@ def delete_entity_extractor(current_user: models.User = Depends(get_current_user
             detail=f"Error deleting entity extraction results: {str(e)}"
         )
 
-@router.delete("/knowledge-graph", status_code=status.HTTP_204_NO_CONTENT)
-def delete_knowledge_graph(current_user: models.User = Depends(get_current_user)):
-    """Delete the knowledge graph for the current user."""
+@router.delete("/knowledge-graph", status_code=status.HTTP_202_ACCEPTED)
+async def delete_knowledge_graph(current_user: models.User = Depends(get_current_user), db: AsyncSession = Depends(get_async_db)):
+    """Queue deletion of the current user's knowledge graph.
+
+    As a job it runs after any build or pipeline job of the user instead of
+    racing its writes.
+    """
     try:
-        # Delete knowledge graph from Neo4j
-        kg = KnowledgeGraph()
-        kg.delete_graph()
-        kg.close()
-        
-        # Delete graph files
-        graph_dir = Path(f"data/graphs/{current_user.username}")
-        if graph_dir.exists():
-            shutil.rmtree(graph_dir)
-            graph_dir.mkdir(parents=True, exist_ok=True)
-        
-        return {"message": "Successfully deleted knowledge graph"}
+        job = await enqueue(db, current_user, "delete_graph")
+        return _queued("Knowledge graph deletion queued", job)
     except Exception as e:
         raise HTTPException(
             status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
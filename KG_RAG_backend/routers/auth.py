@@ -1,13 +1,15 @@
 from fastapi import APIRouter, Depends, status, HTTPException, Response
 from fastapi.security.oauth2 import OAuth2PasswordRequestForm
-from sqlalchemy.orm import Session
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
 from datetime import datetime, timedelta
 
-from db.database import get_db
+from db.database import get_async_db
 from db import models
 from utils import auth
 from schemas import Token, UserCreate
 from auth import oauth2
+from utils.executors import run_in_executor
 
 router = APIRouter(
     prefix="/auth",
@@ -21,13 +23,14 @@ router = APIRouter(
 
 
 @router.post("/login", response_model=Token)
-def login(
+async def login(
     user_credentials: OAuth2PasswordRequestForm = Depends(),
-    db: Session = Depends(get_db)
+    db: AsyncSession = Depends(get_async_db)
 ):
-    user = db.query(models.User).filter(
-        models.User.username == user_credentials.username
-    ).first()
+    result = await db.execute(
+        select(models.User).where(models.User.username == user_credentials.username)
+    )
+    user = result.scalars().first()
     
     if not user:
         raise HTTPException(
@@ -36,7 +39,8 @@ def login(
             headers={"WWW-Authenticate": "Bearer"}
         )
     
-    if not auth.verify(user_credentials.password, user.password):
+    # bcrypt is deliberately slow; keep it off the event loop
+    if not await run_in_executor("io", auth.verify, user_credentials.password, user.password):
         raise HTTPException(
             status_code=status.HTTP_401_UNAUTHORIZED,
             detail="Invalid credentials",
@@ -47,19 +51,20 @@ def login(
     return {"access_token": access_token, "token_type": "bearer"}
 
 @router.post("/register", response_model=Token)
-def register(user: UserCreate, db: Session = Depends(get_db)):
+async def register(user: UserCreate, db: AsyncSession = Depends(get_async_db)):
     # Check if user already exists
-    existing_user = db.query(models.User).filter(models.User.username == user.username).first()
+    result = await db.execute(select(models.User).where(models.User.username == user.username))
+    existing_user = result.scalars().first()
     if existing_user:
         raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="Username already exists")
     
     # Hash password and create user
-    hashed_password = auth.hash(user.password)
+    hashed_password = await run_in_executor("io", auth.hash, user.password)
     user.password = hashed_password
     new_user = models.User(**user.model_dump())
     db.add(new_user)
-    db.commit()
-    db.refresh(new_user)
+    await db.commit()
+    await db.refresh(new_user)
     
     # Create access token
     access_token = oauth2.create_access_token(data={"user_id": new_user.id})
@@ -2,15 +2,18 @@ from fastapi import APIRouter, UploadFile, File, HTTPException, Depends, status
 from fastapi.responses import JSONResponse
 from typing import List
 from pathlib import Path
-from modules.data_loader import PDFLoader
+from modules.jobs import UPLOAD_LOCK, enqueue, invalidate_status
 from auth.oauth2 import get_current_user
 from db import models
-from sqlalchemy.orm import Session
-import os
+from sqlalchemy import func, select
+from sqlalchemy.ext.asyncio import AsyncSession
 from datetime import datetime
 
-from db.database import get_db
-from schemas import FileStatus
+from db.database import get_async_db
+from modules.content_store import content_store
+from schemas import FileStatus, JobOut
+from utils.executors import run_in_executor
+from utils.tracing import span, trace, trace_context
 
 router = APIRouter(
     prefix="/data-loader",
@@ -22,70 +25,122 @@ router = APIRouter(
     }
 )
 
+async def _get_user_file(db: AsyncSession, file_id: int, current_user: models.User) -> models.File:
+    result = await db.execute(
+        select(models.File).where(
+            models.File.id == file_id,
+            models.File.user_id == current_user.id
+        )
+    )
+    file = result.scalars().first()
+    if not file:
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="File not found")
+    return file
+
 @router.post("/upload")
 async def upload_files(
     files: List[UploadFile] = File(...),
     current_user: models.User = Depends(get_current_user),
-    db: Session = Depends(get_db)
+    db: AsyncSession = Depends(get_async_db)
 ):
     try:
-        # Create user-specific directory
-        user_dir = Path(f"data/pdfs/{current_user.username}")
-        user_dir.mkdir(parents=True, exist_ok=True)
+        with trace("upload", user_id=current_user.id, files=len(files)):
+            # Create user-specific directory
+            user_dir = Path(f"data/pdfs/{current_user.username}")
+            user_dir.mkdir(parents=True, exist_ok=True)
         
-        uploaded_db_files = [] # Store db_file objects to update their status later
-        for file in files:
-            if not file.filename.lower().endswith('.pdf'):
-                raise HTTPException(
-                    status_code=400,
-                    detail=f"File {file.filename} is not a PDF"
+            results = []
+            new_files = 0
+            for file in files:
+                if not file.filename.lower().endswith('.pdf'):
+                    raise HTTPException(
+                        status_code=400,
+                        detail=f"File {file.filename} is not a PDF"
+                    )
+
+                # Stream into the content-addressed store, hashing as it is written
+                with span("save_pdf", file=file.filename):
+                    content_hash, file_size, known = await content_store.save_upload(file)
+
+                # Held until the commit below, so concurrent uploads can't both claim a filename
+                await db.execute(select(func.pg_advisory_xact_lock(UPLOAD_LOCK, current_user.id)))
+                existing = (await db.execute(
+                    select(models.File.content_hash, models.File.status).where(
+                        models.File.user_id == current_user.id,
+                        (models.File.content_hash == content_hash) | (models.File.filename == file.filename)
+                    )
+                )).all()
+                if any(row.status == "removing" for row in existing):
+                    # The queued removal deletes this path and record, so nothing can be kept or linked yet
+                    await db.commit()
+                    results.append({
+                        "filename": file.filename,
+                        "status": "removal_pending",
+                        "detail": "This file is still being removed; upload it again once the removal has finished"
+                    })
+                    continue
+                hashes = {row.content_hash for row in existing}
+                if content_hash in hashes:
+                    await db.commit()
+                    results.append({"filename": file.filename, "status": "duplicate"})
+                    continue
+                if hashes:
+                    # Linking would swap the bytes under the existing file's record
+                    await db.commit()
+                    results.append({
+                        "filename": file.filename,
+                        "status": "name_conflict",
+                        "detail": "A different file with this name was already uploaded; rename it or delete the old one"
+                    })
+                    continue
+
+                # The user's copy is a link to the stored blob
+                file_path = user_dir / file.filename
+                await run_in_executor("io", content_store.link, content_hash, file_path)
+
+                db_file = models.File(
+                    filename=file.filename,
+                    size=file_size,
+                    status="pending",
+                    file_path=str(file_path),
+                    content_hash=content_hash,
+                    user_id=current_user.id
                 )
-            
-            # Save file to user's directory
-            file_path = user_dir / file.filename
-            # Read content to get size before writing
-            content = await file.read()
-            file_size = len(content) # Get size in bytes
-            with open(file_path, "wb") as buffer:
-                buffer.write(content)
-            
-            # Create file record in database
-            db_file = models.File(
-                filename=file.filename,
-                size=file_size, # Save the actual file size
-                status="pending",
-                file_path=str(file_path),
-                user_id=current_user.id
+                db.add(db_file)
+                await db.commit()
+                invalidate_status(current_user.id)
+                new_files += 1
+                # ``deduplicated``: another upload already stored this PDF, so its
+                # parsed pages, embeddings and entities are reused by the job
+                results.append({"filename": file.filename, "status": "success", "deduplicated": known})
+
+            if not new_files:
+                return JSONResponse(
+                    content={
+                        "message": "All files were already uploaded",
+                        "status": "unchanged",
+                        "job": None,
+                        "files": results
+                    },
+                    status_code=200
+                )
+
+            # Only the new files are ingested, in a background job. A running job has already
+            # listed its files, so only one that is still queued can take these too.
+            # The job's spans continue this upload's trace
+            job = await enqueue(
+                db, current_user, "add_documents", payload={"trace": trace_context()}, attach_running=False
+            )
+
+            return JSONResponse(
+                content={
+                    "message": "Files uploaded; processing queued",
+                    "status": "queued",
+                    "job": JobOut.model_validate(job).model_dump(mode="json"),
+                    "files": results
+                },
+                status_code=202
             )
-            db.add(db_file)
-            db.commit()
-            db.refresh(db_file)
-            
-            uploaded_db_files.append(db_file)
-
-        # Process the uploaded PDFs (chunking)
-        loader = PDFLoader(
-            pdf_dir=str(user_dir),
-            username=current_user.username
-        )
-        await loader.load_pdfs()
-        
-        # Update status of processed files in the database
-        for db_file in uploaded_db_files:
-            db_file.status = "processed" # Mark as processed after PDF loading
-            db.add(db_file)
-        db.commit()
-
-        return JSONResponse(
-            content={
-                "message": "Files uploaded and processed successfully",
-                "files": [{
-                    "filename": f.filename,
-                    "status": "success"
-                } for f in uploaded_db_files] # Return success status for each file
-            },
-            status_code=200
-        )
         
     except Exception as e:
         raise HTTPException(
@@ -96,54 +151,49 @@ async def upload_files(
 @router.get("/list", response_model=List[FileStatus])
 async def list_files(
     current_user: models.User = Depends(get_current_user),
-    db: Session = Depends(get_db)
+    db: AsyncSession = Depends(get_async_db)
 ):
     try:
         # Get list of uploaded files
-        files = db.query(models.File).filter(models.File.user_id == current_user.id).all()
-        return files
+        result = await db.execute(select(models.File).where(models.File.user_id == current_user.id))
+        return result.scalars().all()
     except Exception as e:
         raise HTTPException(
             status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
             detail=f"Error retrieving files: {str(e)}"
         )
 
-@router.delete("/delete/{file_id}")
+@router.delete("/delete/{file_id}", status_code=status.HTTP_202_ACCEPTED)
 async def delete_file(
     file_id: int,
     current_user: models.User = Depends(get_current_user),
-    db: Session = Depends(get_db)
+    db: AsyncSession = Depends(get_async_db)
 ):
-    file = db.query(models.File).filter(
-        models.File.id == file_id,
-        models.File.user_id == current_user.id
-    ).first()
-    
-    if not file:
-        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="File not found")
-    
-    # Delete file from storage
-    if os.path.exists(file.file_path):
-        os.remove(file.file_path)
-    
-    # Delete from database
-    db.delete(file)
-    db.commit()
-    
-    return {"message": "File deleted successfully"}
+    file = await _get_user_file(db, file_id, current_user)
+
+    # The job takes the document out of the chunk store, vector store, entities
+    # and graph, then deletes the file and its record, after any running job
+    file.status = "removing"
+    await db.commit()
+    invalidate_status(current_user.id)
+    # A running removal has already listed its files
+    job = await enqueue(
+        db, current_user, "remove_documents", payload={"trace": trace_context()}, attach_running=False
+    )
+
+    return JSONResponse(
+        content={
+            "message": "File removal queued",
+            "status": "queued",
+            "job": JobOut.model_validate(job).model_dump(mode="json")
+        },
+        status_code=status.HTTP_202_ACCEPTED
+    )
 
 @router.get("/status/{file_id}", response_model=FileStatus)
 async def get_file_status(
     file_id: int,
     current_user: models.User = Depends(get_current_user),
-    db: Session = Depends(get_db)
+    db: AsyncSession = Depends(get_async_db)
 ):
-    file = db.query(models.File).filter(
-        models.File.id == file_id,
-        models.File.user_id == current_user.id
-    ).first()
-    
-    if not file:
-        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="File not found")
-    
-    return file
+    return await _get_user_file(db, file_id, current_user)
@@ -1,12 +1,13 @@
 from fastapi import APIRouter, Depends, status, HTTPException
-from sqlalchemy.orm import Session
+from sqlalchemy.ext.asyncio import AsyncSession
 from typing import List, Dict, Any
 import json
 
-from db.database import get_db
+from db.database import get_async_db
 from db import models
 from auth.oauth2 import get_current_user
 from schemas import GraphSearch, GraphStats
+from db.cypher_log import cypher_log
 
 router = APIRouter(
     prefix="/graph",
@@ -33,7 +34,7 @@ def get_graph_data(current_user: models.User = Depends(get_current_user)):
 async def search_graph(
     search_params: GraphSearch,
     current_user: models.User = Depends(get_current_user),
-    db: Session = Depends(get_db)
+    db: AsyncSession = Depends(get_async_db)
 ):
     # Implement graph search logic
     # This is a placeholder - implement actual search logic
@@ -43,7 +44,7 @@ async def search_graph(
 async def export_graph(
     format: str = "json",
     current_user: models.User = Depends(get_current_user),
-    db: Session = Depends(get_db)
+    db: AsyncSession = Depends(get_async_db)
 ):
     # Implement graph export logic
     # This is a placeholder - implement actual export logic
@@ -61,7 +62,7 @@ async def export_graph(
 async def import_graph(
     graph_data: Dict[str, Any],
     current_user: models.User = Depends(get_current_user),
-    db: Session = Depends(get_db)
+    db: AsyncSession = Depends(get_async_db)
 ):
     # Implement graph import logic
     # This is a placeholder - implement actual import logic
@@ -70,7 +71,7 @@ async def import_graph(
 @router.get("/statistics", response_model=GraphStats)
 async def get_graph_statistics(
     current_user: models.User = Depends(get_current_user),
-    db: Session = Depends(get_db)
+    db: AsyncSession = Depends(get_async_db)
 ):
     # Implement graph statistics logic
     # This is a placeholder - implement actual statistics logic
@@ -79,4 +80,14 @@ async def get_graph_statistics(
         "relationship_count": 0,
         "entity_types": [],
         "relationship_types": []
-    }
\ No newline at end of file
+    }
+
+@router.get("/cypher-stats")
+async def get_cypher_stats(
+    limit: int = 50,
+    current_user: models.User = Depends(get_current_user)
+):
+    """Cypher statements by total time in this process, with any captured PROFILE plans."""
+    if not current_user.is_superuser:
+        raise HTTPException(status_code=status.HTTP_403_FORBIDDEN, detail="Superuser access required")
+    return cypher_log.snapshot(limit=min(limit, 200))
@@ -0,0 +1,68 @@
+from fastapi import APIRouter, HTTPException, Depends, status
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
+from typing import List
+
+from auth.oauth2 import get_current_user
+from db import models
+from db.database import get_async_db
+from modules.jobs import request_cancel
+from schemas import JobOut
+
+router = APIRouter(
+    prefix="/jobs",
+    tags=["jobs"],
+    responses={
+        401: {"description": "Unauthorized"},
+        404: {"description": "Not Found"},
+    }
+)
+
+async def _get_user_job(job_id: int, current_user: models.User, db: AsyncSession) -> models.Job:
+    result = await db.execute(
+        select(models.Job).where(
+            models.Job.id == job_id,
+            models.Job.user_id == current_user.id
+        )
+    )
+    job = result.scalars().first()
+    if not job:
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Job not found")
+    return job
+
+@router.get("", response_model=List[JobOut])
+async def list_jobs(
+    limit: int = 20,
+    current_user: models.User = Depends(get_current_user),
+    db: AsyncSession = Depends(get_async_db)
+):
+    """List the user's most recent pipeline jobs."""
+    result = await db.execute(
+        select(models.Job).where(
+            models.Job.user_id == current_user.id
+        ).order_by(models.Job.id.desc()).limit(min(limit, 100))
+    )
+    return result.scalars().all()
+
+@router.get("/{job_id}", response_model=JobOut)
+async def get_job(
+    job_id: int,
+    current_user: models.User = Depends(get_current_user),
+    db: AsyncSession = Depends(get_async_db)
+):
+    return await _get_user_job(job_id, current_user, db)
+
+@router.post("/{job_id}/cancel", response_model=JobOut)
+async def cancel_job(
+    job_id: int,
+    current_user: models.User = Depends(get_current_user),
+    db: AsyncSession = Depends(get_async_db)
+):
+    """Cancel a queued job, or ask a running one to stop at its next progress report."""
+    job = await _get_user_job(job_id, current_user, db)
+    if job.status not in ("queued", "running"):
+        raise HTTPException(
+            status_code=status.HTTP_409_CONFLICT,
+            detail=f"Job already {job.status}"
+        )
+    return await request_cancel(db, job)
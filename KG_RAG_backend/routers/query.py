@@ -1,14 +1,19 @@
-from fastapi import APIRouter, Depends, status, HTTPException, Body
-from sqlalchemy.orm import Session
-from typing import List, Dict, Any
-from datetime import datetime
+from fastapi import APIRouter, Depends, status, HTTPException, Body, Response
+from fastapi.responses import StreamingResponse
+from sqlalchemy.ext.asyncio import AsyncSession
+from typing import List, Dict, Any, Optional
+import json
 import logging
 
-from db.database import get_db
+from db.database import get_async_db
+from db.neo4j_connector import Neo4jConnector, get_neo4j_connector
 from db import models
 from auth.oauth2 import get_current_user
-from schemas import QuestionRequest, AnswerResponse, QueryHistory
-from modules.agent import SearchAgent
+from schemas import QuestionRequest, AnswerResponse, QueryHistory, BatchQuestionRequest, StructuredAnswerResponse
+from modules import cypher_qa
+from config import BATCH_MAX_QUESTIONS, settings
+from modules.history import encode_cursor, export_history, history_page_query, history_writer, merge_pending
+from utils.executors import run_in_executor
 
 router = APIRouter(
     prefix="/query",
@@ -20,34 +25,32 @@ router = APIRouter(
     }
 )
 
+def _new_agent(username: str, connector: Neo4jConnector):
+    # Deferred: modules.agent pulls in langchain, FAISS and the embedding stack
+    from modules.agent import SearchAgent
+
+    return SearchAgent(username=username, connector=connector)
+
 @router.post("/chat", response_model=AnswerResponse)
 async def chat(
     request: QuestionRequest = Body(...),
     current_user: models.User = Depends(get_current_user),
-    db: Session = Depends(get_db)
+    neo4j: Neo4jConnector = Depends(get_neo4j_connector)
 ):
     """Answers a question based on the ingested PDFs."""
     try:
         logging.info(f"Received chat request: {request.model_dump_json()}")
-        # Initialize agent with user's username
-        agent = SearchAgent(username=current_user.username)
+        # Initialize agent with user's username; loading the index is blocking I/O
+        agent = await run_in_executor("io", _new_agent, current_user.username, neo4j)
         
         # Get answer using search method
-        answer = agent.search(request.question)
-        
         try:
-            # Save query to history
-            history_entry = models.QueryHistory(
-                user_id=current_user.id,
-                query=request.question,
-                answer=answer,
-                timestamp=datetime.now()
-            )
-            db.add(history_entry)
-            db.commit()
-        except Exception as e:
-            # Log the error but continue with the response
-            print(f"Error saving query history: {str(e)}")
+            answer = await agent.search(request.question)
+        finally:
+            await agent.close()
+        
+        # Saved in the next batched insert, not before responding
+        history_writer.add(current_user.id, request.question, answer)
         
         return AnswerResponse(answer=answer)
     except Exception as e:
@@ -56,15 +59,103 @@ async def chat(
             detail=f"Error processing query: {str(e)}"
         )
 
+@router.post("/structured", response_model=StructuredAnswerResponse)
+async def structured(
+    request: QuestionRequest = Body(...),
+    current_user: models.User = Depends(get_current_user),
+    neo4j: Neo4jConnector = Depends(get_neo4j_connector)
+):
+    """Answers a question about the graph itself by generating and running a read-only Cypher query."""
+    if not settings.cypher_qa_enabled:
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Structured questions are disabled")
+    try:
+        result = await cypher_qa.ask(current_user.username, request.question, connector=neo4j)
+    except (FileNotFoundError, ValueError) as e:
+        # ValueError: the generated query was rejected (a write, or not scoped to the user)
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail=str(e))
+    except Exception as e:
+        raise HTTPException(
+            status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+            detail=f"Error processing structured query: {str(e)}"
+        )
+
+    history_writer.add(current_user.id, request.question, result["answer"])
+    return StructuredAnswerResponse(**result)
+
+@router.post("/batch")
+async def batch(
+    request: BatchQuestionRequest = Body(...),
+    current_user: models.User = Depends(get_current_user),
+    neo4j: Neo4jConnector = Depends(get_neo4j_connector)
+):
+    """Answers many questions at once, streaming NDJSON results in order of completion."""
+    if not request.questions:
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="No questions provided")
+    if len(request.questions) > BATCH_MAX_QUESTIONS:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail=f"At most {BATCH_MAX_QUESTIONS} questions are allowed per batch"
+        )
+
+    logging.info(f"Received batch request with {len(request.questions)} questions")
+    agent = await run_in_executor("io", _new_agent, current_user.username, neo4j)
+
+    async def stream():
+        try:
+            async for index, answer in agent.search_batch(request.questions, k=request.k):
+                yield json.dumps({
+                    "index": index,
+                    "question": request.questions[index],
+                    "answer": answer
+                }, ensure_ascii=False) + "\n"
+        finally:
+            await agent.close()
+
+    return StreamingResponse(stream(), media_type="application/x-ndjson")
+
 @router.get("/history", response_model=List[QueryHistory])
 async def get_query_history(
+    response: Response,
     current_user: models.User = Depends(get_current_user),
-    db: Session = Depends(get_db),
-    limit: int = 10
+    db: AsyncSession = Depends(get_async_db),
+    limit: int = 10,
+    cursor: Optional[str] = None
 ):
-    """Get user's query history."""
-    history = db.query(models.QueryHistory).filter(
-        models.QueryHistory.user_id == current_user.id
-    ).order_by(models.QueryHistory.timestamp.desc()).limit(limit).all()
-    
-    return history
+    """Get user's query history, newest first.
+
+    When more entries exist, the ``X-Next-Cursor`` header holds the
+    ``cursor`` value for the next page. Answers this process has not
+    written yet are included, with a null ``id``.
+    """
+    limit = max(1, min(limit, settings.history_page_max))
+    # Taken before the read, so a flush in between can't hide a row from both
+    pending = history_writer.pending(current_user.id)
+    try:
+        query = history_page_query(current_user.id, limit + 1, cursor)
+    except ValueError as e:
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail=str(e))
+    result = await db.execute(query)
+    rows = merge_pending(result.scalars().all(), pending, cursor)
+    if len(rows) > limit:
+        rows = rows[:limit]
+        # A buffered row's id is unknown; continuing from id 0 skips only its own timestamp
+        response.headers["X-Next-Cursor"] = encode_cursor(rows[-1].timestamp, rows[-1].id or 0)
+    return rows
+
+@router.get("/history/export")
+async def export_query_history(
+    format: str = "ndjson",
+    current_user: models.User = Depends(get_current_user)
+):
+    """Download the user's full history, oldest first, as NDJSON or CSV."""
+    media_types = {"ndjson": "application/x-ndjson", "csv": "text/csv"}
+    if format not in media_types:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail="Unsupported export format"
+        )
+    return StreamingResponse(
+        export_history(current_user.id, format),
+        media_type=media_types[format],
+        headers={"Content-Disposition": f'attachment; filename="history_{current_user.username}.{format}"'}
+    )
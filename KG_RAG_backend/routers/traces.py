@@ -0,0 +1,55 @@
+from fastapi import APIRouter, Depends
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
+from typing import List, Optional
+
+from auth.oauth2 import get_current_user
+from db import models
+from db.database import get_async_db
+from schemas import TraceSpanOut
+
+router = APIRouter(
+    prefix="/traces",
+    tags=["traces"],
+    responses={
+        401: {"description": "Unauthorized"},
+    }
+)
+
+def _user_spans(current_user: models.User):
+    # Indexed columns, not keys inside ``details``
+    return select(models.SystemLog.details).where(
+        models.SystemLog.level == "TRACE",
+        models.SystemLog.user_id == current_user.id
+    )
+
+@router.get("/slowest", response_model=List[TraceSpanOut])
+async def slowest_spans(
+    job_id: Optional[int] = None,
+    name: Optional[str] = None,
+    limit: int = 20,
+    current_user: models.User = Depends(get_current_user),
+    db: AsyncSession = Depends(get_async_db)
+):
+    """The user's slowest spans, optionally for one job or one span name (e.g. ner_batch)."""
+    query = _user_spans(current_user)
+    if job_id is not None:
+        query = query.where(models.SystemLog.job_id == job_id)
+    if name:
+        query = query.where(models.SystemLog.message == name)
+    result = await db.execute(
+        query.order_by(models.SystemLog.duration_ms.desc()).limit(min(limit, 200))
+    )
+    return result.scalars().all()
+
+@router.get("/jobs/{job_id}", response_model=List[TraceSpanOut])
+async def job_spans(
+    job_id: int,
+    current_user: models.User = Depends(get_current_user),
+    db: AsyncSession = Depends(get_async_db)
+):
+    """Every recorded span of a job in start order; rebuild the tree from parent_id."""
+    result = await db.execute(
+        _user_spans(current_user).where(models.SystemLog.job_id == job_id)
+    )
+    return sorted(result.scalars().all(), key=lambda d: d["start"])
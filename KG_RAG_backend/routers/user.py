@@ -1,10 +1,12 @@
 from fastapi import APIRouter, Depends, status, HTTPException, Response
-from sqlalchemy.orm import Session
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
 
 import schemas 
 from utils import auth
+from utils.executors import run_in_executor
 from db import models
-from db.database import get_db
+from db.database import get_async_db
 from auth import oauth2
 
 router = APIRouter(
@@ -17,65 +19,67 @@ router = APIRouter(
     }
 )
 
+async def _get_user_or_404(db: AsyncSession, id: int) -> models.User:
+    result = await db.execute(select(models.User).where(models.User.id == id))
+    user = result.scalars().first()
+    if not user:
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND,
+                            detail=f"User with id: {id} does not exist")
+    return user
+
 @router.get("/", response_model=list[schemas.UserOut])
-def get_users(db: Session = Depends(get_db)):
+async def get_users(db: AsyncSession = Depends(get_async_db)):
     print("Getting all users")
-    users = db.query(models.User).all()
-    return users
+    result = await db.execute(select(models.User))
+    return result.scalars().all()
 
 @router.post("/", status_code=status.HTTP_201_CREATED, response_model=schemas.UserOut)
-def create_user(user: schemas.UserCreate, db: Session = Depends(get_db)):
+async def create_user(user: schemas.UserCreate, db: AsyncSession = Depends(get_async_db)):
     # Check if username is already taken
-    existing_username = db.query(models.User).filter(models.User.username == user.username).first()
+    result = await db.execute(select(models.User).where(models.User.username == user.username))
+    existing_username = result.scalars().first()
     if existing_username:
         raise HTTPException(
             status_code=status.HTTP_400_BAD_REQUEST,
             detail="Username already taken"
         )
 
-    # hash the password
-    hashed_password = auth.hash(user.password)
+    # hash the password (bcrypt is slow; keep it off the event loop)
+    hashed_password = await run_in_executor("io", auth.hash, user.password)
     user.password = hashed_password
 
     new_user = models.User(**user.model_dump())
     db.add(new_user)
-    db.commit()
-    db.refresh(new_user)
+    await db.commit()
+    await db.refresh(new_user)
 
     return new_user
 
 @router.get('/{id}', response_model=schemas.UserOut)
-def get_user(id: int, db: Session = Depends(get_db), ):
-    user = db.query(models.User).filter(models.User.id == id).first()
-    if not user:
-        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND,
-                            detail=f"User with id: {id} does not exist")
-
-    return user
+async def get_user(id: int, db: AsyncSession = Depends(get_async_db), ):
+    return await _get_user_or_404(db, id)
 
 @router.put('/{id}', response_model=schemas.UserOut)
-def update_user(id: int, user: schemas.UserUpdate, db: Session = Depends(get_db)):
-    user_obj = db.query(models.User).filter(models.User.id == id).first()
-    if not user_obj:
-        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND,
-                            detail=f"User with id: {id} does not exist")
+async def update_user(id: int, user: schemas.UserUpdate, db: AsyncSession = Depends(get_async_db)):
+    user_obj = await _get_user_or_404(db, id)
 
     user_obj.fullname = user.fullname
     user_obj.username = user.username
+    if user.is_active is not None:
+        user_obj.is_active = user.is_active
 
-    db.commit()
-    db.refresh(user_obj)
+    await db.commit()
+    await db.refresh(user_obj)
+    oauth2.invalidate_user(id)
 
     return user_obj
 
 @router.delete('/{id}', status_code=status.HTTP_204_NO_CONTENT)
-def delete_user(id: int, db: Session = Depends(get_db)):
-    user = db.query(models.User).filter(models.User.id == id).first()
-    if not user:
-        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND,
-                            detail=f"User with id: {id} does not exist")
+async def delete_user(id: int, db: AsyncSession = Depends(get_async_db)):
+    user = await _get_user_or_404(db, id)
 
-    db.delete(user)
-    db.commit()
+    await db.delete(user)
+    await db.commit()
+    oauth2.invalidate_user(id)
 
-    return Response(status_code=status.HTTP_204_NO_CONTENT)
\ No newline at end of file
+    return Response(status_code=status.HTTP_204_NO_CONTENT)
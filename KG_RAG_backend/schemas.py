@@ -35,6 +35,7 @@ class UserCreate(UserBase):
 class UserUpdate(BaseModel):
     fullname: Optional[str] = None
     username: Optional[str] = None
+    is_active: Optional[bool] = None  # False deactivates the account
 
 class PDFUploadRequest(BaseModel):
     filename: str
@@ -50,6 +51,14 @@ class QuestionRequest(BaseModel):
 class AnswerResponse(BaseModel):
     answer: str
 
+class StructuredAnswerResponse(BaseModel):
+    answer: str
+    cypher: Optional[str] = None
+
+class BatchQuestionRequest(BaseModel):
+    questions: List[str]
+    k: int = 3
+
 class GraphDataNode(BaseModel):
     entity: str
     chunk_id: List[str]
@@ -81,6 +90,7 @@ class FileStatus(BaseModel):
     uploaded_at: datetime
     processed_at: Optional[datetime] = None
     file_path: str
+    content_hash: Optional[str] = None
     user_id: int
 
     class Config:
@@ -98,7 +108,8 @@ class GraphStats(BaseModel):
     relationship_types: List[str]
 
 class QueryHistory(BaseModel):
-    id: int
+    # None for an answer that is still buffered and not yet written
+    id: Optional[int] = None
     query: str
     timestamp: datetime
     user_id: int
@@ -108,6 +119,35 @@ class QueryHistory(BaseModel):
     class Config:
         from_attributes = True
 
+class JobOut(BaseModel):
+    id: int
+    kind: str
+    status: str
+    stage: Optional[str] = None
+    progress: float
+    result: Optional[Dict[str, Any]] = None
+    error: Optional[str] = None
+    attempts: int
+    max_attempts: int
+    cancel_requested: bool
+    created_at: Optional[datetime] = None
+    started_at: Optional[datetime] = None
+    finished_at: Optional[datetime] = None
+
+    class Config:
+        from_attributes = True
+
+class TraceSpanOut(BaseModel):
+    trace_id: str
+    span_id: str
+    parent_id: Optional[str] = None
+    job_id: Optional[int] = None
+    name: str
+    start: datetime
+    duration_ms: float
+    attrs: Dict[str, Any] = {}
+    error: Optional[str] = None
+
 class KGStatusResponse(BaseModel):
     status: str # e.g., 'offline', 'building', 'ready', 'error'
     message: Optional[str] = None
@@ -0,0 +1,39 @@
+import pytest
+
+from modules.cypher_qa import check_tenancy
+
+
+@pytest.mark.parametrize("query", [
+    "MATCH (e:Entity {username: $username}) RETURN count(e)",
+    "MATCH (e:Entity {username: $username, name: 'RAG'})-[r:RELATED_TO]-(o:Entity {username: $username}) "
+    "RETURN o.name, r.count ORDER BY r.count DESC",
+    "MATCH (e:Entity {username: $username}) WITH e MATCH (e {username: $username})-[:RELATED_TO]->"
+    "(o {username: $username}) RETURN e.name, collect(o.name)",
+    "MATCH p = shortestPath((a:Entity {username: $username})-[*..4]-(b:Entity {username: $username})) "
+    "WHERE a.name = 'x' AND (b.name = 'y' OR b.name = 'z') RETURN length(p)",
+])
+def test_scoped_queries_pass(query):
+    check_tenancy(query)
+
+
+@pytest.mark.parametrize("query", [
+    "MATCH (e:Entity) RETURN count(e)",
+    "MATCH (n) RETURN n LIMIT 5",
+    "MATCH (e:Entity {username: $username})-[:RELATED_TO]-(o) RETURN o.name",
+    "MATCH (e:Entity {username: 'someone_else'}) RETURN e",
+    "MATCH (e:Entity {username: $user}) RETURN e",
+    "MATCH (e:Entity {username: $username}) MATCH (e:Entity)-->(x {username: $username}) RETURN x",
+    "MATCH (e:Entity {username: $username}) RETURN [(e)-->(x) | x.name]",
+    "MATCH (a {username: $username}) RETURN a UNION MATCH (b) RETURN b AS a",
+    "MATCH (e:Entity {username: $username}) WITH e MATCH (e)-->(o {username: $username}) RETURN o.name",
+    "MATCH (e:Entity {username: $username}) WITH count(e) AS c MATCH (e) RETURN e.name",
+    "MATCH (a:Entity {username: $username}) RETURN a.name AS n UNION MATCH (a) RETURN a.name AS n",
+    "MATCH (e:Entity {username: $username}) MATCH (x:Entity WHERE true) RETURN x.name",
+    "MATCH (e:Entity {username: $username}) MATCH (x:Entity|Document) RETURN x.name",
+    "MATCH (e:Entity {username: $username})-->(x:!Entity {username: $username}) RETURN x.name",
+    "MATCH (e:Entity {username: $username}), (`x`) RETURN x.name",
+    "RETURN 1",
+])
+def test_unscoped_queries_are_rejected(query):
+    with pytest.raises(ValueError):
+        check_tenancy(query)
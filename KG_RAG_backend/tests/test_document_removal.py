@@ -0,0 +1,77 @@
+import asyncio
+import json
+
+import pytest
+
+from modules import KnowledgeGraph as kg_module
+from modules import document_removal
+from modules.chunk_store import ChunkStore
+from modules.document_removal import remove_document
+
+
+class FlakyConnector:
+    """Fails the first ``failures`` graph transactions, as if Neo4j were down."""
+
+    def __init__(self, failures: int):
+        self.failures = failures
+        self.transactions = []
+
+    async def write_transaction(self, work, *args):
+        if self.failures:
+            self.failures -= 1
+            raise ConnectionError("Neo4j is unavailable")
+        self.transactions.append((work, args))
+        return 0, 0
+
+
+@pytest.fixture
+def user_data(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    monkeypatch.setattr(kg_module, "_indexes_ready", True)
+    removed_vectors = []
+    monkeypatch.setattr(
+        document_removal, "_remove_vectors",
+        lambda username, chunk_ids: removed_vectors.extend(chunk_ids) or len(chunk_ids)
+    )
+
+    store = ChunkStore.for_user("alice")
+    store.append([
+        {"chunk_id": "d00p0001c01", "doc_id": 1, "doc": "a.pdf", "page": 1, "text": "kept"},
+        {"chunk_id": "d01p0001c01", "doc_id": 2, "doc": "b.pdf", "page": 1, "text": "removed"},
+        {"chunk_id": "d01p0002c01", "doc_id": 2, "doc": "b.pdf", "page": 2, "text": "removed"},
+    ])
+    store.close()
+
+    entities_file = tmp_path / "data/entities/alice/entities_alice.json"
+    entities_file.parent.mkdir(parents=True)
+    entities_file.write_text(json.dumps({
+        "d00p0001c01": ["RAG"], "d01p0001c01": ["RAG", "Neo4j"], "d01p0002c01": ["FAISS"]
+    }))
+    return entities_file, removed_vectors
+
+
+def test_remove_document_retry_finishes_after_graph_failure(user_data):
+    entities_file, removed_vectors = user_data
+    connector = FlakyConnector(failures=1)
+
+    with pytest.raises(ConnectionError):
+        asyncio.run(remove_document("alice", "b.pdf", connector))
+
+    removed = asyncio.run(remove_document("alice", "b.pdf", connector))
+
+    assert removed["chunks"] == 2 and removed["entity_chunks"] == 2
+    assert removed_vectors[-2:] == ["d01p0001c01", "d01p0002c01"]
+    queries = [args[0] for _, args in connector.transactions]
+    assert queries == [kg_module.REMOVE_CO_OCCURRENCES, kg_module.REMOVE_MENTIONS, kg_module.REMOVE_DOCUMENTS]
+    assert connector.transactions[1][1][1]["items"] == [
+        {"name": "RAG", "chunk_ids": ["d01p0001c01"]},
+        {"name": "Neo4j", "chunk_ids": ["d01p0001c01"]},
+        {"name": "FAISS", "chunk_ids": ["d01p0002c01"]},
+    ]
+    assert json.loads(entities_file.read_text()) == {"d00p0001c01": ["RAG"]}
+
+    store = ChunkStore.for_user("alice")
+    try:
+        assert [chunk["chunk_id"] for chunk in store.iter_chunks()] == ["d00p0001c01"]
+    finally:
+        store.close()
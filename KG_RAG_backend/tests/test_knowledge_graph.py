@@ -0,0 +1,100 @@
+import asyncio
+
+import pytest
+
+from modules import KnowledgeGraph as kg_module
+from modules.KnowledgeGraph import REMOVE_DOCUMENTS, KnowledgeGraph, doc_index
+
+DOCS = 120
+
+
+def chunk_id(doc: int, page: int = 1, n: int = 1) -> str:
+    # Same format as PDFLoader._build_chunks
+    return f"d{doc:02}p{page:04}c{n:02}"
+
+
+class FakeConnector:
+    """Records what the graph would write instead of talking to Neo4j."""
+
+    def __init__(self):
+        self.transactions = []
+
+    async def execute_write(self, query, params=None):
+        return []
+
+    async def execute_read(self, query, params=None):
+        return []
+
+    async def write_transaction(self, work, *args):
+        self.transactions.append((work, args))
+        return 0, 0
+
+
+@pytest.fixture
+def graph(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    monkeypatch.setattr(kg_module, "_indexes_ready", True)
+    return KnowledgeGraph("alice", FakeConnector())
+
+
+def test_doc_index_reads_every_digit():
+    assert doc_index(chunk_id(0)) == 0
+    assert doc_index(chunk_id(7, 12, 3)) == 7
+    assert doc_index(chunk_id(100)) == 100
+    assert doc_index(chunk_id(1234, 5678, 99)) == 1234
+    with pytest.raises(ValueError):
+        doc_index("p0001c01")
+
+
+def test_write_entities_keeps_documents_apart_past_99(graph):
+    data = {chunk_id(doc): [f"entity {doc}"] for doc in range(DOCS)}
+    asyncio.run(graph.write_entities(data))
+
+    written = [args[1:3] for _, args in graph.connector.transactions]
+    assert written == [(chunk_id(doc), doc) for doc in range(DOCS)]
+
+
+def test_remove_chunks_removes_only_their_documents_past_99(graph):
+    removed = [chunk_id(doc, page) for doc in (5, 10, 100, 101, 119) for page in (1, 2)]
+    asyncio.run(graph.remove_chunks(removed, {cid: ["x"] for cid in removed}))
+
+    documents = [
+        args[1]["items"] for _, args in graph.connector.transactions if args[0] == REMOVE_DOCUMENTS
+    ]
+    assert documents == [[5, 10, 100, 101, 119]]
+
+
+class LegacyConnector(FakeConnector):
+    """A graph holding ``legacy`` unscoped nodes, deleted up to ``batch`` at a time."""
+
+    def __init__(self, legacy: int, done: bool = False):
+        super().__init__()
+        self.legacy = legacy
+        self.done = done
+        self.writes = []
+
+    async def execute_read(self, query, params=None):
+        return [{"done": int(self.done)}]
+
+    async def execute_write(self, query, params=None):
+        self.writes.append(query)
+        if query == kg_module.MARK_LEGACY_MIGRATION_DONE:
+            self.done = True
+            return []
+        if "DETACH DELETE" not in query:
+            return [{"deleted": 0}]
+        deleted = min(self.legacy, params["batch"])
+        self.legacy -= deleted
+        return [{"deleted": deleted}]
+
+
+def test_remove_legacy_graph_deletes_unscoped_nodes_once(monkeypatch):
+    monkeypatch.setattr(kg_module.settings, "graph_delete_batch", 10)
+    connector = LegacyConnector(legacy=25)
+
+    assert asyncio.run(kg_module.remove_legacy_graph(connector)) == 25
+    assert connector.legacy == 0 and connector.done
+
+    connector.writes.clear()
+    assert asyncio.run(kg_module.remove_legacy_graph(connector)) == 0
+    assert connector.writes == []
@@ -0,0 +1,156 @@
+import asyncio
+from types import SimpleNamespace
+
+import pytest
+
+from modules.llm_gateway import PRIORITIES, LLMGateway, PriorityLimiter
+
+
+async def _wait_for(condition):
+    while not condition():
+        await asyncio.sleep(0)
+
+
+def test_limiter_serves_interactive_before_batch():
+    async def scenario():
+        limiter = PriorityLimiter(1)
+        await limiter.acquire_async(PRIORITIES["batch"])
+        order = []
+
+        async def waiter(name):
+            await limiter.acquire_async(PRIORITIES[name])
+            order.append(name)
+            limiter.release()
+
+        tasks = [asyncio.create_task(waiter("batch")), asyncio.create_task(waiter("interactive"))]
+        await _wait_for(lambda: limiter.waiting == 2)
+        limiter.release()
+        await asyncio.gather(*tasks)
+        return order, limiter.free
+
+    order, free = asyncio.run(scenario())
+    assert order == ["interactive", "batch"]
+    assert free == 1
+
+
+def test_limiter_keeps_arrival_order_within_a_priority():
+    async def scenario():
+        limiter = PriorityLimiter(1)
+        await limiter.acquire_async(0)
+        order = []
+
+        async def waiter(n):
+            await limiter.acquire_async(0)
+            order.append(n)
+            limiter.release()
+
+        tasks = []
+        for n in range(3):
+            tasks.append(asyncio.create_task(waiter(n)))
+            await _wait_for(lambda: limiter.waiting == n + 1)
+        limiter.release()
+        await asyncio.gather(*tasks)
+        return order
+
+    assert asyncio.run(scenario()) == [0, 1, 2]
+
+
+def test_cancelled_waiter_is_skipped():
+    async def scenario():
+        limiter = PriorityLimiter(1)
+        await limiter.acquire_async(0)
+        first = asyncio.create_task(limiter.acquire_async(0))
+        second = asyncio.create_task(limiter.acquire_async(1))
+        await _wait_for(lambda: limiter.waiting == 2)
+
+        first.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await first
+        assert limiter.waiting == 1
+
+        limiter.release()
+        await asyncio.wait_for(second, timeout=1)
+        limiter.release()
+        return limiter.free
+
+    assert asyncio.run(scenario()) == 1
+
+
+def test_slot_granted_to_a_cancelled_waiter_is_passed_on():
+    async def scenario():
+        limiter = PriorityLimiter(1)
+        await limiter.acquire_async(0)
+        first = asyncio.create_task(limiter.acquire_async(0))
+        second = asyncio.create_task(limiter.acquire_async(0))
+        await _wait_for(lambda: limiter.waiting == 2)
+
+        # Hand the slot to ``first`` and cancel it before it resumes
+        limiter.release()
+        first.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await first
+
+        await asyncio.wait_for(second, timeout=1)
+        limiter.release()
+        return limiter.free
+
+    assert asyncio.run(scenario()) == 1
+
+
+def _result(text):
+    return SimpleNamespace(llm_output={}, text=text)
+
+
+def test_follower_takes_over_when_the_leader_is_cancelled():
+    async def scenario():
+        gateway = LLMGateway()
+        leader_started = asyncio.Event()
+        calls = []
+
+        async def hang():
+            calls.append("leader")
+            leader_started.set()
+            await asyncio.Event().wait()
+
+        async def answer():
+            calls.append("follower")
+            return _result("answer")
+
+        leader = asyncio.create_task(gateway.acall("key", "alice", "interactive", hang))
+        await leader_started.wait()
+        follower = asyncio.create_task(gateway.acall("key", "bob", "interactive", answer))
+        await _wait_for(lambda: gateway.coalesced == 1)
+
+        leader.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await leader
+        result = await asyncio.wait_for(follower, timeout=1)
+        return result, calls, gateway
+
+    result, calls, gateway = asyncio.run(scenario())
+    assert result.text == "answer"
+    assert calls == ["leader", "follower"]
+    assert not gateway._inflight
+
+
+def test_followers_share_the_leaders_result():
+    async def scenario():
+        gateway = LLMGateway()
+        release = asyncio.Event()
+        calls = []
+
+        async def generate():
+            calls.append(1)
+            await release.wait()
+            return _result("shared")
+
+        first = asyncio.create_task(gateway.acall("key", "alice", "interactive", generate))
+        await _wait_for(lambda: calls)
+        second = asyncio.create_task(gateway.acall("key", "bob", "interactive", generate))
+        await _wait_for(lambda: gateway.coalesced == 1)
+        release.set()
+        return await asyncio.gather(first, second), calls
+
+    (first, second), calls = asyncio.run(scenario())
+    assert first.text == second.text == "shared"
+    assert calls == [1]
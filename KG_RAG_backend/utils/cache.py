@@ -0,0 +1,58 @@
+"""Thread-safe, size-bounded TTL cache with hit/miss metrics."""
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Hashable, Optional
+
+from utils.metrics import CACHE_REQUESTS
+
+
+class TTLCache:
+    """LRU cache whose entries also expire ``ttl`` seconds after being set.
+
+    Lookups are counted in ``kgrag_cache_requests_total{cache=name}``; an
+    expired entry counts as a miss. ``None`` cannot be cached.
+    """
+
+    def __init__(self, name: str, maxsize: int, ttl: float):
+        self.name = name
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self._data: "OrderedDict[Hashable, tuple]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key: Hashable) -> Optional[Any]:
+        now = time.monotonic()
+        value = None
+        with self._lock:
+            entry = self._data.get(key)
+            if entry is not None:
+                if entry[0] > now:
+                    self._data.move_to_end(key)
+                    value = entry[1]
+                else:
+                    del self._data[key]
+        CACHE_REQUESTS.inc(cache=self.name, result="hit" if value is not None else "miss")
+        return value
+
+    def set(self, key: Hashable, value: Any, ttl: Optional[float] = None):
+        """Cache ``value``; ``ttl`` can only shorten the cache-wide TTL."""
+        ttl = self.ttl if ttl is None else min(ttl, self.ttl)
+        if ttl <= 0 or self.maxsize <= 0:
+            return
+        with self._lock:
+            self._data[key] = (time.monotonic() + ttl, value)
+            self._data.move_to_end(key)
+            while len(self._data) > self.maxsize:
+                self._data.popitem(last=False)
+
+    def pop(self, key: Hashable):
+        with self._lock:
+            self._data.pop(key, None)
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+
+    def __len__(self) -> int:
+        return len(self._data)
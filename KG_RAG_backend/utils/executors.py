@@ -0,0 +1,116 @@
+import asyncio
+import contextvars
+import functools
+import logging
+import multiprocessing
+import time
+from concurrent.futures import Executor, ProcessPoolExecutor, ThreadPoolExecutor
+from typing import Dict
+
+from config import settings
+
+# Workload classes and the pool that serves each one. Sizes are per worker process.
+#   io       - short blocking calls: file reads/writes, sync SDK calls, index loads
+#   pipeline - long pipeline stages (an NER pass); bounds concurrent heavy jobs per worker
+#   embed    - embedding model inference and FAISS search; torch already uses intra-op threads
+#   cpu      - pure-Python CPU work such as PDF parsing and chunking, run in separate processes
+WORKLOAD_SIZES = {
+    "io": settings.io_workers,
+    "pipeline": settings.pipeline_workers,
+    "embed": settings.embed_workers,
+    "cpu": settings.cpu_workers,
+}
+
+_executors: Dict[str, Executor] = {}
+
+
+def get_executor(workload: str) -> Executor:
+    if workload not in WORKLOAD_SIZES:
+        raise ValueError(f"Unknown workload class: {workload}")
+
+    executor = _executors.get(workload)
+    if executor is None:
+        if workload == "cpu":
+            # spawn keeps children clear of locks held by torch and driver threads at fork time
+            executor = ProcessPoolExecutor(
+                max_workers=WORKLOAD_SIZES[workload],
+                mp_context=multiprocessing.get_context("spawn")
+            )
+        else:
+            executor = ThreadPoolExecutor(
+                max_workers=WORKLOAD_SIZES[workload],
+                thread_name_prefix=f"kg-{workload}"
+            )
+        _executors[workload] = executor
+    return executor
+
+
+async def run_in_executor(workload: str, fn, *args, **kwargs):
+    """Run a blocking callable in the pool for its workload class and await the result."""
+    loop = asyncio.get_running_loop()
+    executor = get_executor(workload)
+    call = functools.partial(fn, *args, **kwargs)
+    if not isinstance(executor, ProcessPoolExecutor):
+        # Carry context variables (the current trace span) into the pool thread
+        call = functools.partial(contextvars.copy_context().run, call)
+    return await loop.run_in_executor(executor, call)
+
+
+def shutdown_executors():
+    for executor in _executors.values():
+        executor.shutdown(wait=False, cancel_futures=True)
+    _executors.clear()
+
+
+class LoopLagMonitor:
+    """Measures how late the event loop wakes up from a fixed-interval sleep.
+
+    Any blocking call on the loop shows up directly as lag, so a responsive
+    loop keeps ``max_ms`` close to zero while pipelines run in the executors.
+    """
+
+    def __init__(self, interval: float = settings.loop_lag_interval, warn_ms: float = settings.loop_lag_warn_ms):
+        self.interval = interval
+        self.warn_ms = warn_ms
+        self.last_ms = 0.0
+        self.max_ms = 0.0
+        self.avg_ms = 0.0
+        self.samples = 0
+        self._task = None
+
+    async def _run(self):
+        while True:
+            start = time.perf_counter()
+            await asyncio.sleep(self.interval)
+            lag_ms = max(0.0, (time.perf_counter() - start - self.interval) * 1000)
+
+            self.samples += 1
+            self.last_ms = lag_ms
+            self.max_ms = max(self.max_ms, lag_ms)
+            self.avg_ms += (lag_ms - self.avg_ms) * 0.1
+            if lag_ms > self.warn_ms:
+                logging.warning(f"Event loop blocked for {lag_ms:.0f} ms")
+
+    def start(self):
+        if self._task is None:
+            self._task = asyncio.create_task(self._run())
+
+    async def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
+    def snapshot(self) -> Dict[str, float]:
+        return {
+            "last_ms": round(self.last_ms, 2),
+            "avg_ms": round(self.avg_ms, 2),
+            "max_ms": round(self.max_ms, 2),
+            "samples": self.samples,
+        }
+
+
+loop_monitor = LoopLagMonitor()
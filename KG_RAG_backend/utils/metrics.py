@@ -0,0 +1,177 @@
+"""In-process metrics rendered in the Prometheus text exposition format.
+
+Counters, gauges and histograms are plain dicts keyed by label values behind one
+lock each, so an observation costs a dict lookup and a few additions. Each
+worker process keeps its own values; scrape every process, or aggregate
+them in Prometheus.
+"""
+import bisect
+import threading
+import time
+from contextlib import contextmanager
+from typing import Dict, List, Sequence, Tuple
+
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0, 120.0)
+
+_registry: List["_Metric"] = []
+
+
+def _escape(value: str) -> str:
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def _format_labels(names: Sequence[str], values: Sequence[str], extra: Dict[str, str] = None) -> str:
+    pairs = [(n, v) for n, v in zip(names, values)] + list((extra or {}).items())
+    if not pairs:
+        return ""
+    return "{" + ",".join(f'{n}="{_escape(v)}"' for n, v in pairs) + "}"
+
+
+class _Metric:
+    kind = ""
+
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = ()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._lock = threading.Lock()
+        _registry.append(self)
+
+    def _key(self, labels: Dict[str, str]) -> Tuple[str, ...]:
+        return tuple(str(labels.get(name, "")) for name in self.labelnames)
+
+    def render(self) -> List[str]:
+        return [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} {self.kind}"]
+
+
+class Counter(_Metric):
+    kind = "counter"
+
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = ()):
+        super().__init__(name, documentation, labelnames)
+        self._values: Dict[Tuple[str, ...], float] = {}
+
+    def inc(self, amount: float = 1, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def value(self, **labels) -> float:
+        return self._values.get(self._key(labels), 0)
+
+    def render(self) -> List[str]:
+        lines = super().render()
+        with self._lock:
+            items = list(self._values.items())
+        for key, value in items:
+            lines.append(f"{self.name}{_format_labels(self.labelnames, key)} {value}")
+        return lines
+
+
+class Gauge(Counter):
+    kind = "gauge"
+
+    def dec(self, amount: float = 1, **labels):
+        self.inc(-amount, **labels)
+
+    def set(self, value: float, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = value
+
+
+class Histogram(_Metric):
+    kind = "histogram"
+
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = (),
+                 buckets: Sequence[float] = DEFAULT_BUCKETS):
+        super().__init__(name, documentation, labelnames)
+        self.buckets = tuple(sorted(buckets))
+        self._values: Dict[Tuple[str, ...], list] = {}
+
+    def observe(self, value: float, **labels):
+        key = self._key(labels)
+        index = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            state = self._values.get(key)
+            if state is None:
+                # Per-bucket counts (last slot is +Inf), then sum and count
+                state = self._values[key] = [[0] * (len(self.buckets) + 1), 0.0, 0]
+            state[0][index] += 1
+            state[1] += value
+            state[2] += 1
+
+    @contextmanager
+    def time(self, **labels):
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - started, **labels)
+
+    def render(self) -> List[str]:
+        lines = super().render()
+        with self._lock:
+            items = [(key, list(state[0]), state[1], state[2]) for key, state in self._values.items()]
+        for key, counts, total, count in items:
+            cumulative = 0
+            for bound, bucket_count in zip(self.buckets + (float("inf"),), counts):
+                cumulative += bucket_count
+                le = "+Inf" if bound == float("inf") else repr(bound)
+                lines.append(f"{self.name}_bucket{_format_labels(self.labelnames, key, {'le': le})} {cumulative}")
+            lines.append(f"{self.name}_sum{_format_labels(self.labelnames, key)} {total}")
+            lines.append(f"{self.name}_count{_format_labels(self.labelnames, key)} {count}")
+        return lines
+
+
+def render_metrics() -> str:
+    lines = []
+    for metric in _registry:
+        lines.extend(metric.render())
+    return "\n".join(lines) + "\n"
+
+
+# HTTP
+HTTP_REQUEST_SECONDS = Histogram(
+    "kgrag_http_request_duration_seconds", "HTTP request latency by route template.",
+    ("method", "route", "status")
+)
+
+# Ingestion
+PDF_PAGES_PARSED = Counter("kgrag_pdf_pages_parsed_total", "PDF pages parsed.")
+CHUNKS_CREATED = Counter("kgrag_chunks_created_total", "Text chunks produced by chunking.")
+CHUNKS_EMBEDDED = Counter("kgrag_chunks_embedded_total", "Chunks embedded into a vector store.")
+EMBEDDING_SECONDS = Histogram("kgrag_embedding_duration_seconds", "Time to embed and index a chunk set.")
+NER_BATCH_SECONDS = Histogram("kgrag_ner_batch_duration_seconds", "NER time per chunk batch.", ("outcome",))
+NER_CHUNKS = Counter("kgrag_ner_chunks_total", "Chunks sent to NER.")
+GRAPH_CHUNKS_WRITTEN = Counter("kgrag_graph_chunks_written_total", "Chunk transactions written to the graph.")
+
+# LLM
+LLM_CALLS = Counter("kgrag_llm_calls_total", "LLM calls made upstream.", ("priority", "outcome"))
+LLM_COALESCED = Counter("kgrag_llm_coalesced_total", "LLM calls served by an identical in-flight call.")
+LLM_TOKENS = Counter("kgrag_llm_tokens_total", "LLM tokens used.", ("priority", "type"))
+LLM_CALL_SECONDS = Histogram("kgrag_llm_call_duration_seconds", "Upstream LLM call latency.", ("priority",))
+
+# Neo4j
+CYPHER_QUERIES = Counter("kgrag_cypher_queries_total", "Cypher transactions run.", ("access", "outcome"))
+CYPHER_SECONDS = Histogram(
+    "kgrag_cypher_duration_seconds", "Cypher transaction latency.", ("access",),
+    buckets=(0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 10.0)
+)
+NEO4J_POOL_MAX = Gauge("kgrag_neo4j_pool_max_connections", "Configured Neo4j driver pool size.")
+NEO4J_POOL_IN_USE = Gauge("kgrag_neo4j_pool_in_use", "Neo4j transactions holding a pooled connection.")
+NEO4J_ACQUIRE_SECONDS = Histogram(
+    "kgrag_neo4j_acquire_duration_seconds",
+    "Wait from requesting a transaction to it starting (pool acquisition plus BEGIN).", ("access",),
+    buckets=(0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 5.0, 30.0)
+)
+
+# Query path
+FAISS_SEARCH_SECONDS = Histogram(
+    "kgrag_faiss_search_duration_seconds", "FAISS search latency per call.", ("source",),
+    buckets=(0.0001, 0.00025, 0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.5)
+)
+QUERY_STAGE_SECONDS = Histogram("kgrag_query_stage_duration_seconds", "SearchAgent.search time per stage.", ("stage",))
+
+# Caches
+CACHE_REQUESTS = Counter("kgrag_cache_requests_total", "Cache lookups by cache and result.", ("cache", "result"))
@@ -0,0 +1,49 @@
+"""Startup phase timings, logged once the process is ready and shown by /health."""
+import os
+import time
+from typing import Dict, Optional
+
+import psutil
+
+from utils.metrics import Gauge
+
+STARTUP_PHASE_SECONDS = Gauge("kgrag_startup_phase_seconds", "Time spent in each startup phase.", ("phase",))
+
+
+class StartupProfile:
+    """Each ``mark(phase)`` records the time since the previous mark.
+
+    The clock starts when this module is first imported, which ``main`` does
+    before anything else. Interpreter and server start-up before that is
+    reported as ``process_start``, measured from the process creation time.
+    """
+
+    def __init__(self):
+        self._last = time.perf_counter()
+        self.phases: Dict[str, float] = {}
+        self.before_imports: Optional[float] = None
+        try:
+            self.before_imports = max(time.time() - psutil.Process(os.getpid()).create_time(), 0.0)
+        except psutil.Error:
+            pass
+
+    def mark(self, phase: str):
+        now = time.perf_counter()
+        self.phases[phase] = now - self._last
+        STARTUP_PHASE_SECONDS.set(self.phases[phase], phase=phase)
+        self._last = now
+
+    def snapshot(self) -> Dict[str, float]:
+        phases = {name: round(seconds * 1000, 1) for name, seconds in self.phases.items()}
+        if self.before_imports is not None:
+            phases = {"process_start": round(self.before_imports * 1000, 1), **phases}
+        return phases
+
+    def report(self):
+        phases = self.snapshot()
+        total = sum(phases.values())
+        lines = [f"  {name:<20} {ms:>9.1f} ms" for name, ms in phases.items()]
+        print(f"Startup took {total:.1f} ms:\n" + "\n".join(lines))
+
+
+startup_profile = StartupProfile()
@@ -0,0 +1,251 @@
+"""Nested timing spans for profiling slow jobs, flushed in bulk to SystemLog.
+
+``trace()`` opens a trace for a job or request and ``span()`` times a child of
+whatever span is current. The current span lives in a context variable, so
+nesting follows asyncio tasks and, through ``run_in_executor``, pool threads.
+Outside a trace ``span`` does nothing, so hooks cost nothing on untraced paths.
+
+Finished spans are buffered in memory; ``TraceFlusher`` writes them to
+``system_logs`` in one INSERT per interval, one row per span with level
+``TRACE``, the span name as message and the span itself in ``details``.
+``log_event`` queues other diagnostic rows through the same buffer. Rows
+older than ``SYSTEM_LOG_RETENTION_DAYS`` are pruned by the flusher.
+"""
+import asyncio
+import logging
+import threading
+import time
+import uuid
+from contextlib import contextmanager
+from contextvars import ContextVar
+from datetime import datetime, timedelta, timezone
+from typing import Any, Dict, List, Optional
+
+from sqlalchemy import delete, insert, select
+
+from config import settings
+from utils.executors import run_in_executor
+from utils.metrics import Counter
+
+TRACE_ROWS_DROPPED = Counter("kgrag_trace_rows_dropped_total", "Trace and log rows dropped because the buffer was full.")
+
+
+class _Trace:
+    __slots__ = ("trace_id", "job_id", "user_id")
+
+    def __init__(self, trace_id: str, job_id: Optional[int], user_id: Optional[int]):
+        self.trace_id = trace_id
+        self.job_id = job_id
+        self.user_id = user_id
+
+
+class Span:
+    __slots__ = ("trace", "span_id", "parent_id", "name", "attrs", "started_at", "_started")
+
+    def __init__(self, trace: _Trace, parent_id: Optional[str], name: str, attrs: Dict[str, Any]):
+        self.trace = trace
+        self.span_id = uuid.uuid4().hex[:16]
+        self.parent_id = parent_id
+        self.name = name
+        self.attrs = attrs
+        self.started_at = datetime.now(timezone.utc)
+        self._started = time.perf_counter()
+
+    def finish(self, error: Optional[str], root: bool):
+        duration_ms = (time.perf_counter() - self._started) * 1000
+        # Children never outlast their parent, so a kept span's ancestors are kept too
+        if not root and error is None and duration_ms < settings.trace_min_span_ms:
+            return
+        duration_ms = round(duration_ms, 3)
+        log_event("TRACE", self.name, {
+            "trace_id": self.trace.trace_id,
+            "span_id": self.span_id,
+            "parent_id": self.parent_id,
+            "job_id": self.trace.job_id,
+            "user_id": self.trace.user_id,
+            "name": self.name,
+            "start": self.started_at.isoformat(),
+            "duration_ms": duration_ms,
+            "attrs": self.attrs,
+            "error": error,
+        }, user_id=self.trace.user_id, job_id=self.trace.job_id, duration_ms=duration_ms)
+
+
+_current_trace: ContextVar[Optional[_Trace]] = ContextVar("kg_trace", default=None)
+_current_span: ContextVar[Optional[Span]] = ContextVar("kg_span", default=None)
+
+_buffer: List[Dict[str, Any]] = []
+_buffer_lock = threading.Lock()
+
+
+def log_event(level: str, message: str, details: Dict[str, Any], user_id: Optional[int] = None,
+              job_id: Optional[int] = None, duration_ms: Optional[float] = None):
+    """Queue a system_logs row for the next bulk flush."""
+    with _buffer_lock:
+        if len(_buffer) >= settings.trace_buffer_limit:
+            TRACE_ROWS_DROPPED.inc()
+            return
+        _buffer.append({
+            "level": level,
+            "message": message,
+            "details": details,
+            "user_id": user_id,
+            "job_id": job_id,
+            "duration_ms": duration_ms
+        })
+
+
+@contextmanager
+def span(name: str, **attrs):
+    """Time the enclosed block as a child of the current span."""
+    trace_ = _current_trace.get()
+    if trace_ is None:
+        yield None
+        return
+
+    parent = _current_span.get()
+    current = Span(trace_, parent.span_id if parent else None, name, attrs)
+    token = _current_span.set(current)
+    error = None
+    try:
+        yield current
+    except BaseException as e:
+        error = f"{type(e).__name__}: {e}"[:500]
+        raise
+    finally:
+        _current_span.reset(token)
+        current.finish(error, root=parent is None)
+
+
+@contextmanager
+def trace(name: str, job_id: Optional[int] = None, user_id: Optional[int] = None,
+          parent: Optional[Dict[str, str]] = None, **attrs):
+    """Open a trace with root span ``name``.
+
+    ``parent`` is a ``trace_context()`` captured elsewhere (e.g. stored in a
+    job payload), so a job's spans continue the request that queued it.
+    """
+    if not settings.tracing_enabled:
+        yield None
+        return
+
+    parent = parent or {}
+    trace_token = _current_trace.set(_Trace(parent.get("trace_id") or uuid.uuid4().hex, job_id, user_id))
+    root = Span(_current_trace.get(), parent.get("span_id"), name, attrs)
+    span_token = _current_span.set(root)
+    error = None
+    try:
+        yield root
+    except BaseException as e:
+        error = f"{type(e).__name__}: {e}"[:500]
+        raise
+    finally:
+        _current_span.reset(span_token)
+        _current_trace.reset(trace_token)
+        root.finish(error, root=True)
+
+
+def annotate(**attrs):
+    """Add attributes to the current span, if any."""
+    current = _current_span.get()
+    if current is not None:
+        current.attrs.update(attrs)
+
+
+def trace_context() -> Optional[Dict[str, str]]:
+    """The current trace and span ids, for continuing the trace in a job."""
+    current = _current_span.get()
+    if current is None:
+        return None
+    return {"trace_id": current.trace.trace_id, "span_id": current.span_id}
+
+
+def flush() -> int:
+    """Write buffered rows to system_logs in one INSERT; returns how many were written."""
+    with _buffer_lock:
+        if not _buffer:
+            return 0
+        batch = list(_buffer)
+        _buffer.clear()
+
+    # Deferred: importing db.database connects to Postgres, which span users don't need
+    from db import models
+    from db.database import SessionLocal
+
+    db = SessionLocal()
+    try:
+        db.execute(insert(models.SystemLog), batch)
+        db.commit()
+        return len(batch)
+    except Exception as e:
+        db.rollback()
+        logging.error(f"Failed to flush {len(batch)} trace rows: {e}")
+        return 0
+    finally:
+        db.close()
+
+
+def prune(retention_days: float = settings.system_log_retention_days,
+          batch: int = settings.system_log_prune_batch) -> int:
+    """Delete system_logs rows older than the retention period, ``batch`` rows per transaction."""
+    if retention_days <= 0:
+        return 0
+    from db import models
+    from db.database import SessionLocal
+
+    cutoff = datetime.now() - timedelta(days=retention_days)
+    expired = select(models.SystemLog.id).where(models.SystemLog.timestamp < cutoff).limit(batch)
+    deleted = 0
+    db = SessionLocal()
+    try:
+        while True:
+            result = db.execute(delete(models.SystemLog).where(models.SystemLog.id.in_(expired)))
+            db.commit()
+            deleted += result.rowcount
+            if result.rowcount < batch:
+                return deleted
+    except Exception as e:
+        db.rollback()
+        logging.error(f"Failed to prune system logs: {e}")
+        return deleted
+    finally:
+        db.close()
+
+
+class TraceFlusher:
+    """Periodically flushes buffered rows, and prunes expired ones, from the io pool."""
+
+    def __init__(self, interval: float = settings.trace_flush_interval,
+                 prune_interval: float = settings.system_log_prune_interval):
+        self.interval = interval
+        self.prune_interval = prune_interval
+        self._task = None
+
+    async def _run(self):
+        last_prune = None
+        while True:
+            await asyncio.sleep(self.interval)
+            await run_in_executor("io", flush)
+            if last_prune is None or time.monotonic() - last_prune >= self.prune_interval:
+                last_prune = time.monotonic()
+                pruned = await run_in_executor("io", prune)
+                if pruned:
+                    logging.info(f"Pruned {pruned} expired system log rows")
+
+    def start(self):
+        if self._task is None:
+            self._task = asyncio.create_task(self._run())
+
+    async def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+        # Write what is left before the process exits
+        await run_in_executor("io", flush)
+
+
+trace_flusher = TraceFlusher()
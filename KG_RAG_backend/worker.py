@@ -0,0 +1,48 @@
+"""Standalone pipeline job worker.
+
+Run ``python worker.py`` on dedicated nodes and set ``JOB_WORKER_ENABLED=false``
+on the API servers so ingestion, NER and graph builds stay off the request path.
+"""
+import asyncio
+import logging
+import signal
+
+from config import settings
+from db.database import close_db, init_db
+from db.neo4j_connector import close_neo4j_connector
+from modules.jobs import JobWorker
+from utils.executors import loop_monitor, shutdown_executors
+from utils.tracing import trace_flusher
+
+
+async def main():
+    logging.basicConfig(level=logging.INFO)
+    stop = asyncio.Event()
+    loop = asyncio.get_running_loop()
+    for sig in (signal.SIGINT, signal.SIGTERM):
+        try:
+            loop.add_signal_handler(sig, stop.set)
+        except NotImplementedError:  # Windows
+            pass
+
+    await init_db()
+    worker = JobWorker(concurrency=settings.job_worker_concurrency)
+    worker.start()
+    loop_monitor.start()
+    trace_flusher.start()
+    try:
+        await stop.wait()
+    finally:
+        await worker.stop()
+        await loop_monitor.stop()
+        await trace_flusher.stop()
+        await close_neo4j_connector()
+        shutdown_executors()
+        await close_db()
+
+
+if __name__ == "__main__":
+    try:
+        asyncio.run(main())
+    except KeyboardInterrupt:
+        pass
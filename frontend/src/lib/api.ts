@@ -13,7 +13,9 @@ import type {
   GraphSearchRequest,
   GraphSearchResponse,
   GraphStats,
-  FileStatusInfo
+  FileStatusInfo,
+  Job,
+  QueuedJobResponse
 } from '@/types';
 
 const API_URL = import.meta.env.VITE_API_URL || 'http://localhost:8000';
@@ -48,6 +50,50 @@ api.interceptors.response.use(
   }
 );
 
+// Pipeline jobs run in the background; poll until they finish
+const JOB_POLL_INTERVAL_MS = 1000;
+
+export const jobApi = {
+  list: async (): Promise<Job[]> => {
+    const response = await api.get<Job[]>('/jobs');
+    return response.data;
+  },
+
+  get: async (jobId: number): Promise<Job> => {
+    const response = await api.get<Job>(`/jobs/${jobId}`);
+    return response.data;
+  },
+
+  cancel: async (jobId: number): Promise<Job> => {
+    const response = await api.post<Job>(`/jobs/${jobId}/cancel`);
+    return response.data;
+  },
+};
+
+export const waitForJob = async (
+  jobId: number,
+  onProgress?: (job: Job) => void
+): Promise<Job> => {
+  for (;;) {
+    const job = await jobApi.get(jobId);
+    onProgress?.(job);
+    if (job.status === 'succeeded') {
+      return job;
+    }
+    if (job.status === 'failed' || job.status === 'cancelled') {
+      throw new Error(job.error || `Job ${job.status}`);
+    }
+    await new Promise(resolve => setTimeout(resolve, JOB_POLL_INTERVAL_MS));
+  }
+};
+
+// Queue a pipeline step, wait for its job, then return the refreshed KG status
+const runKGJob = async (path: string, data?: unknown): Promise<KGStatusResponse> => {
+  const response = await api.post<QueuedJobResponse>(path, data);
+  await waitForJob(response.data.job.id);
+  return kgStatusApi.getStatus();
+};
+
 // Auth API
 export const authApi = {
   login: async (data: LoginRequest): Promise<LoginResponse> => {
@@ -91,6 +137,9 @@ export const fileApi = {
         'Content-Type': 'multipart/form-data',
       },
     });
+    if (response.data.job) {
+      await waitForJob(response.data.job.id);
+    }
     return response.data;
   },
 
@@ -112,25 +161,17 @@ export const fileApi = {
 
 // KG Status API
 export const kgStatusApi = {
-  processPDFs: async (data: ProcessPDFsRequest): Promise<KGStatusResponse> => {
-    const response = await api.post<KGStatusResponse>('/KG-status/pdf-status', data);
-    return response.data;
-  },
+  processPDFs: (data: ProcessPDFsRequest): Promise<KGStatusResponse> =>
+    runKGJob('/KG-status/pdf-status', data),
 
-  extractEntities: async (): Promise<KGStatusResponse> => {
-    const response = await api.post<KGStatusResponse>('/KG-status/entity-extractor');
-    return response.data;
-  },
+  extractEntities: (): Promise<KGStatusResponse> =>
+    runKGJob('/KG-status/entity-extractor'),
 
-  buildKG: async (): Promise<KGStatusResponse> => {
-    const response = await api.post<KGStatusResponse>('/KG-status/build-kg');
-    return response.data;
-  },
+  buildKG: (): Promise<KGStatusResponse> =>
+    runKGJob('/KG-status/build-kg'),
 
-  updateKG: async (): Promise<KGStatusResponse> => {
-    const response = await api.post<KGStatusResponse>('/KG-status/update-kg');
-    return response.data;
-  },
+  updateKG: (): Promise<KGStatusResponse> =>
+    runKGJob('/KG-status/update-kg'),
 
   deletePDFStatus: async (): Promise<{ message: string }> => {
     const response = await api.delete<{ message: string }>('/KG-status/pdf-status');
@@ -90,8 +90,11 @@ export interface FileInfo {
   message: string;
   files: Array<{
     filename: string;
-    status: 'success' | 'error';
+    status: 'success' | 'duplicate' | 'error';
+    deduplicated?: boolean;
   }>;
+  // null when every file was already uploaded and nothing was queued
+  job: Job | null;
 }
 
 export interface FileStatusInfo {
@@ -102,6 +105,7 @@ export interface FileStatusInfo {
   uploaded_at: string;
   processed_at: string | null;
   file_path: string;
+  content_hash: string | null;
   user_id: number;
 }
 
@@ -123,6 +127,31 @@ export interface KGStatusResponse {
   relationshipsCreated?: number;
 }
 
+// Job Types
+export type JobStatus = 'queued' | 'running' | 'succeeded' | 'failed' | 'cancelled';
+
+export interface Job {
+  id: number;
+  kind: 'ingest' | 'extract_entities' | 'build_graph' | 'update_graph' | 'pipeline';
+  status: JobStatus;
+  stage: string | null;
+  progress: number;
+  result: Record<string, any> | null;
+  error: string | null;
+  attempts: number;
+  max_attempts: number;
+  cancel_requested: boolean;
+  created_at: string | null;
+  started_at: string | null;
+  finished_at: string | null;
+}
+
+export interface QueuedJobResponse {
+  message: string;
+  status: 'queued';
+  job: Job;
+}
+
 // Query Types
 export interface ChatRequest {
   question: string;